@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, JSON, DateTime, func
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, JSON, DateTime, Index, func
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from app.config import settings
+from app.services.metrics import instrument_engine
 import re
+from typing import Optional
 
 Base = declarative_base()
 
@@ -50,42 +53,85 @@ class Client(Base):
     agency = relationship("Agency", back_populates="clients")
     plans = relationship("Plan", back_populates="client")
 
+    __table_args__ = (
+        # One client per email within an agency; the plan pipeline upserts against it
+        Index("ix_clients_agency_id_email", "agency_id", "email", unique=True),
+    )
+
 class Plan(Base):
     __tablename__ = "plans"
 
     id = Column(Integer, primary_key=True, index=True)
     client_id = Column(Integer, ForeignKey("clients.id"), nullable=True)
     agency_id = Column(Integer, ForeignKey("agencies.id"), nullable=False)
-    plan_data = Column(JSON, nullable=False)
+    plan_data = Column(JSONB, nullable=False)
+    # Extracted from plan_data when the plan is saved, for listings and analytics
+    plan_title = Column(Text)
+    recommended_service_ids = Column(ARRAY(Integer), nullable=False, server_default="{}")   # Service.id of each recommendation
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     client = relationship("Client", back_populates="plans")
     agency = relationship("Agency", back_populates="plans")
 
-DATABASE_URL_FROM_SETTINGS = settings.DATABASE_URL
-
-# Re-add sslmode stripping logic for robustness
-CLEANED_DATABASE_URL = DATABASE_URL_FROM_SETTINGS
-if DATABASE_URL_FROM_SETTINGS and "sslmode=" in DATABASE_URL_FROM_SETTINGS:
-    TEMP_URL = re.sub(r"sslmode=[^&]*&?", "", DATABASE_URL_FROM_SETTINGS)
-    CLEANED_DATABASE_URL = re.sub(r"\?&", "?", TEMP_URL)
-    if CLEANED_DATABASE_URL.endswith("?"):
-        CLEANED_DATABASE_URL = CLEANED_DATABASE_URL[:-1]
-    if not CLEANED_DATABASE_URL.startswith(DATABASE_URL_FROM_SETTINGS.split("://")[0] + "://"):
-        CLEANED_DATABASE_URL = DATABASE_URL_FROM_SETTINGS
-
-# print(f"Using DATABASE_URL for SQLAlchemy: {CLEANED_DATABASE_URL}")
-
-engine = create_async_engine(
-    CLEANED_DATABASE_URL, 
-    pool_size=5, 
-    max_overflow=5,
-    pool_recycle=1800,  # Recycle connections every 30 minutes
-    pool_pre_ping=True  # Enable pre-ping to check connection liveness
-)
-
-AsyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
+    __table_args__ = (
+        # Keyset pagination of plan history, newest first (see plan_history)
+        Index("ix_plans_agency_id_created_at_id", "agency_id", "created_at", "id"),
+        Index("ix_plans_client_id_created_at_id", "client_id", "created_at", "id"),
+        # "Plans recommending service X" is an array containment (@>) lookup
+        Index("ix_plans_recommended_service_ids", "recommended_service_ids", postgresql_using="gin"),
+        Index("ix_plans_plan_data", "plan_data", postgresql_using="gin", postgresql_ops={"plan_data": "jsonb_path_ops"}),
+    )
+
+class PlanTask(Base):
+    __tablename__ = "plan_tasks"
+
+    id = Column(String(64), primary_key=True)
+    data = Column(JSON, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+def _database_url() -> str:
+    url = settings.DATABASE_URL
+    # Re-add sslmode stripping logic for robustness
+    if url and "sslmode=" in url:
+        cleaned = re.sub(r"sslmode=[^&]*&?", "", url)
+        cleaned = re.sub(r"\?&", "?", cleaned)
+        if cleaned.endswith("?"):
+            cleaned = cleaned[:-1]
+        if cleaned.startswith(url.split("://")[0] + "://"):
+            return cleaned
+    return url
+
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[sessionmaker] = None
+
+def get_engine() -> AsyncEngine:
+    """The shared engine, created on first use so importing this module doesn't load the driver or build the pool."""
+    global _engine, _session_factory
+    if _engine is None:
+        _engine = create_async_engine(
+            _database_url(),
+            pool_size=5,
+            max_overflow=5,
+            pool_recycle=1800,  # Recycle connections every 30 minutes
+            pool_pre_ping=True  # Enable pre-ping to check connection liveness
+        )
+        instrument_engine(_engine)
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_engine, class_=AsyncSession)
+    return _engine
+
+def AsyncSessionLocal() -> AsyncSession:
+    """A new session on the shared engine; call sites use it like the sessionmaker it replaces."""
+    get_engine()
+    return _session_factory()
+
+async def dispose_engine():
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+        _session_factory = None
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -1,182 +1,370 @@
 from dotenv import load_dotenv
 load_dotenv(dotenv_path=".env.local")
 
-from fastapi import FastAPI, Request, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import JSONResponse
-from sqlalchemy.ext.asyncio import AsyncSession
-# from sqlalchemy.future import select # Removed as select is imported from sqlalchemy directly or not used for this query type
-from sqlalchemy.orm import selectinload
-from sqlalchemy import select # Ensure select is imported if it was meant to be from here
-from app.schemas import ClientResponses, DisplayServiceRecommendation
+from fastapi import FastAPI, Request, HTTPException, Header, Query
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from app.schemas import ClientResponses
 from app.services.limiter import check as check_rate
-from app.services.scraper import screenshot, crawl_website
-from app.services.openai_llm import analyse_website, recommend_services, extract_company_insights
-from app.db import get_db, Agency as App_DB_Agency, Service as App_DB_Service, Client as App_DB_Client, Plan as App_DB_Plan # Add Client, Plan
+from app.services.browser_pool import browser_pool
+from app.services.loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
+from app.services.redis_client import close_redis
+from app.services.openai_llm import close_openai_client
+from app.services.warmup import warmup
+from app.db import dispose_engine
+from app.services.http_crawler import close_http_client
+from app.services.task_store import task_store
+from app.services import dedup
+from app.services.agency_cache import get_agency_catalog
+from app.services.plan_analytics import service_recommendation_counts, count_plans_recommending, month_start
+from app.services.plan_history import list_plans, get_plan, InvalidCursor, PLAN_HISTORY_PAGE_SIZE, PLAN_HISTORY_MAX_PAGE_SIZE
+from app.services.plan_batch import parse_batch_rows, max_batch_rows, row_task_id, BatchInputError, PLAN_BATCH_CONCURRENCY, PLAN_BATCH_MAX_CONCURRENCY, PLAN_BATCH_MAX_BYTES
+from app.services.task_events import task_events, TERMINAL_STATUSES
+from app.services.blob_store import screenshot_store, BLOB_ID_PATTERN, MEDIA_TYPES
+from app.services.job_queue import plan_queue, plan_batch_queue, PLAN_QUEUE_MAX_DEPTH, PLAN_BATCH_QUEUE_MAX_DEPTH, PLAN_QUEUE_RETRY_AFTER_SECONDS
+from app.services import metrics
+from app.worker import start_plan_workers, stop_plan_workers, collect_runtime_metrics, PLAN_RUN_WORKERS_IN_API
 import logging # Import logging
 import uuid # Added for taskId generation
 import asyncio # Added for parallel execution
-from typing import Dict, Any # Added for typing
-
-app = FastAPI()
+import json
+import math
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory store for task statuses. 
-# TODO: Replace with a more robust solution like Redis or a database table for production.
-task_statuses: Dict[str, Dict[str, Any]] = {}
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if LOOP_MONITOR_ENABLED:
+        await loop_monitor.start()
+    # Serve straight away and warm up in the background; /ready says when it's done.
+    # The shared Chromium is only worth launching where plans run.
+    warmup.start(browser=PLAN_RUN_WORKERS_IN_API)
+    workers = await start_plan_workers() if PLAN_RUN_WORKERS_IN_API else None
+    yield
+    await warmup.stop()
+    if workers:
+        await stop_plan_workers(workers)
+    await browser_pool.stop()
+    await close_http_client()
+    await close_openai_client()
+    await close_redis()
+    await dispose_engine()
+    await loop_monitor.stop()
 
-async def generate_plan_async(task_id: str, payload: ClientResponses, db: AsyncSession, agency_api_key: str, client_host: str):
-    try:
-        task_statuses[task_id]["status"] = "processing"
-        
-        # Fetch agency and services from DB (Replicated from original endpoint)
-        agency_query_statement = (
-            select(App_DB_Agency)
-            .where(App_DB_Agency.api_key == agency_api_key) # Use passed apiKey
-            .options(selectinload(App_DB_Agency.services))
-        )
-        agency_result = await db.execute(agency_query_statement)
-        db_agency = agency_result.scalars().first()
-
-        if not db_agency:
-            task_statuses[task_id] = {"status": "failed", "error": "Agency not found."}
-            logger.error(f"Task {task_id}: Agency not found for API key.")
-            return
-
-        agency_desc = db_agency.description
-        services = [
-            {
-                "name": service.name,
-                "description": service.description,
-                "outcomes": service.outcomes,
-                "price_lower": service.price_lower,
-                "price_upper": service.price_upper,
-                "when_to_recommend": service.when_to_recommend,
-            }
-            for service in db_agency.services
-        ]
-        website_analysis = None
-        b64 = None
-        company_insights = None
-        all_payload_data_for_analysis = payload.model_dump()
-        if payload.model_extra:
-            all_payload_data_for_analysis.update(payload.model_extra)
-            
-        if payload.websiteUrl:
-            # Run screenshot and website crawling in parallel for speed
-            screenshot_task = screenshot(payload.websiteUrl)
-            crawl_task = crawl_website(payload.websiteUrl, max_pages=6)
-            
-            # Execute both tasks in parallel
-            (b64, _), crawled_content = await asyncio.gather(screenshot_task, crawl_task)
-            
-            # Analyze the screenshot
-            website_analysis = await analyse_website(b64, payload.websiteUrl, all_payload_data_for_analysis)
-            
-            # Extract company insights from crawled content
-            if crawled_content:
-                company_insights = await extract_company_insights(crawled_content, all_payload_data_for_analysis)
-                logger.info(f"Task {task_id}: Extracted insights from {len(crawled_content)} pages")
-            else:
-                logger.warning(f"Task {task_id}: No content found during website crawl")
-
-        all_payload_data_for_recommend = payload.model_dump()
-        if payload.model_extra:
-            all_payload_data_for_recommend.update(payload.model_extra)
-
-        ai_response_data = await recommend_services(agency_desc, services, all_payload_data_for_recommend, website_analysis, company_insights)
-
-        # Find or create client
-        db_client = None
-        if payload.email:
-            client_query = await db.execute(
-                select(App_DB_Client).where(App_DB_Client.email == payload.email, App_DB_Client.agency_id == db_agency.id)
-            )
-            db_client = client_query.scalars().first()
-
-        if not db_client and payload.email:
-            db_client = App_DB_Client(
-                email=payload.email,
-                name=payload.name,
-                website_url=payload.websiteUrl,
-                agency_id=db_agency.id
-            )
-            db.add(db_client)
-            await db.flush()
-
-        # Save plan to DB
-        new_plan = App_DB_Plan(
-            client_id=db_client.id if db_client else None,
-            agency_id=db_agency.id,
-            plan_data=ai_response_data.model_dump()
-        )
-        db.add(new_plan)
-        
-        await db.commit()
-        await db.refresh(new_plan)
-        if db_client:
-            await db.refresh(db_client)
-
-        display_recommendations = []
-        for recommendation in ai_response_data.recommendations:
-            display_recommendations.append(DisplayServiceRecommendation(
-                id=recommendation.id,
-                serviceId=recommendation.serviceId,
-                reason=recommendation.reason,
-                description=services[recommendation.id]["description"]
-            ))
-
-        plan_data_for_response = {
-            "planId": new_plan.id,
-            "clientId": db_client.id if db_client else None,
-            "recommendations": display_recommendations,
-            "executiveSummary": ai_response_data.executiveSummary,
-            "websiteAnalysis": website_analysis,
-            "screenshotBase64": b64,
-            "planTitle": ai_response_data.planTitle,
-            "subTitle": ai_response_data.subTitle,
-            "callToAction": ai_response_data.callToAction
-        }
-        task_statuses[task_id] = {"status": "completed", "planData": plan_data_for_response}
-        logger.info(f"Task {task_id}: Plan generation completed successfully.")
-
-    except Exception as e:
-        logger.error(f"Task {task_id}: Error during plan generation: {e}", exc_info=True)
-        task_statuses[task_id] = {"status": "failed", "error": str(e)}
-    finally:
-        pass
+app = FastAPI(lifespan=lifespan)
+metrics.registry.add_collector(collect_runtime_metrics)
 
 
 @app.post("/plan")
 async def generate_plan_request(
     payload: ClientResponses, 
     req: Request, 
-    background_tasks: BackgroundTasks, # Added BackgroundTasks
-    db: AsyncSession = Depends(get_db)
+    refresh: bool = False # Bypass the crawl cache and re-render the website
 ):
     logger.info(f"Received request for /plan. API Key: {payload.apiKey}, Email: {payload.email}, Website URL: {payload.websiteUrl}")
+
+    # Double-clicks and retries attach to the task already running for the same request,
+    # before the queue and rate limit checks so they don't count against either
+    task_id = str(uuid.uuid4())
+    dedup_key = dedup.plan_request_key(payload, refresh, req.headers.get("Idempotency-Key"))
+    existing_task_id = await dedup.claim(dedup_key, task_id)
+    if existing_task_id is not None:
+        existing_status = await task_store.get(existing_task_id)
+        if existing_status is None:
+            # The first request is still being admitted and may yet be turned away with
+            # a 429 or 503, leaving its task without a status; don't hand its id out yet
+            raise HTTPException(
+                status_code=409,
+                detail="An identical request is still being accepted, please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        # Rejected requests release their claim, so only a failed task is worth retrying
+        if existing_status.get("status") != "failed":
+            logger.info(f"Duplicate /plan request attached to task {existing_task_id}.")
+            return JSONResponse(status_code=202, content={"taskId": existing_task_id})
+        await dedup.replace(dedup_key, task_id)
+
+    # Shed load before touching the rate limit so rejected requests don't count against it
+    queue_depth = await plan_queue.depth()
+    if queue_depth >= PLAN_QUEUE_MAX_DEPTH:
+        logger.warning(f"Plan queue depth {queue_depth} at limit {PLAN_QUEUE_MAX_DEPTH}. Returning 503.")
+        await dedup.release(dedup_key, task_id)
+        raise HTTPException(
+            status_code=503,
+            detail="Too many plans in progress, please retry shortly.",
+            headers={"Retry-After": str(PLAN_QUEUE_RETRY_AFTER_SECONDS)},
+        )
+
     ident = payload.apiKey or req.client.host
-    rl = await check_rate(ident)
+    with metrics.rate_limit_seconds.time():
+        rl = await check_rate(ident)
     if not rl["allowed"]:
-        raise HTTPException(status_code=429, detail=rl)
+        await dedup.release(dedup_key, task_id)
+        raise HTTPException(status_code=429, detail=rl, headers={"Retry-After": str(math.ceil(rl["retry_after"]))})
 
-    task_id = str(uuid.uuid4())
-    task_statuses[task_id] = {"status": "pending", "request_payload": payload.model_dump(mode='json')} # Store payload if needed
-    background_tasks.add_task(generate_plan_async, task_id, payload, db, payload.apiKey, req.client.host)
+    await task_store.set(task_id, {"status": "pending", "request_payload": payload.model_dump(mode='json')}) # Store payload if needed
+    await plan_queue.enqueue({
+        "taskId": task_id,
+        "payload": payload.model_dump(mode='json'),
+        "clientHost": req.client.host,
+        "refresh": refresh,
+    })
     
     logger.info(f"Task {task_id} created for /plan request. Returning 202 Accepted.")
     return JSONResponse(status_code=202, content={"taskId": task_id})
 
 
+async def _read_batch_body(req: Request) -> bytes:
+    """The upload, refused with a 413 as soon as it's known to exceed PLAN_BATCH_MAX_BYTES."""
+    too_large = HTTPException(status_code=413, detail=f"The batch is larger than {PLAN_BATCH_MAX_BYTES} bytes.")
+    content_length = req.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > PLAN_BATCH_MAX_BYTES:
+        raise too_large
+    # Content-Length can be missing (chunked uploads) or wrong, so count what actually arrives too
+    body = bytearray()
+    async for chunk in req.stream():
+        body += chunk
+        if len(body) > PLAN_BATCH_MAX_BYTES:
+            raise too_large
+    return bytes(body)
+
+
+@app.post("/plan/batch")
+async def generate_plan_batch_request(
+    req: Request,
+    x_api_key: str = Header(...),
+    concurrency: int = PLAN_BATCH_CONCURRENCY,  # Rows in flight at once, capped at PLAN_BATCH_MAX_CONCURRENCY
+    refresh: bool = False
+):
+    """
+    Queue plans for a lead list: a JSONL body (one ClientResponses object per line) or,
+    with Content-Type text/csv, a CSV with one column per field. Progress is on
+    /plan/batch/{batchId} and /plan/events/{batchId}; results on /plan/batch/{batchId}/results.
+    """
+    try:
+        payloads = parse_batch_rows(
+            await _read_batch_body(req), req.headers.get("content-type", ""), x_api_key,
+            max_rows=max_batch_rows(task_store.capacity),
+        )
+    except BatchInputError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info(f"Received request for /plan/batch with {len(payloads)} rows.")
+
+    queue_depth = await plan_batch_queue.depth()
+    if queue_depth >= PLAN_BATCH_QUEUE_MAX_DEPTH:
+        logger.warning(f"Batch queue depth {queue_depth} at limit {PLAN_BATCH_QUEUE_MAX_DEPTH}. Returning 503.")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many batches in progress, please retry shortly.",
+            headers={"Retry-After": str(PLAN_QUEUE_RETRY_AFTER_SECONDS)},
+        )
+
+    # A batch takes one request's allowance; its size is bounded by max_batch_rows instead
+    with metrics.rate_limit_seconds.time():
+        rl = await check_rate(x_api_key)
+    if not rl["allowed"]:
+        raise HTTPException(status_code=429, detail=rl, headers={"Retry-After": str(math.ceil(rl["retry_after"]))})
+
+    batch_id = str(uuid.uuid4())
+    await task_store.set(batch_id, {"status": "pending", "total": len(payloads), "completed": 0, "failed": 0})
+    await asyncio.gather(*(task_store.set(row_task_id(batch_id, row), {"status": "pending"}) for row in range(len(payloads))))
+    await plan_batch_queue.enqueue({
+        "batchId": batch_id,
+        "apiKey": x_api_key,
+        "payloads": [payload.model_dump(mode='json') for payload in payloads],
+        "refresh": refresh,
+        "concurrency": min(max(1, concurrency), PLAN_BATCH_MAX_CONCURRENCY),
+    })
+
+    logger.info(f"Batch {batch_id} created for {len(payloads)} plans. Returning 202 Accepted.")
+    return JSONResponse(status_code=202, content={"batchId": batch_id, "total": len(payloads)})
+
+
+@app.get("/plan/batch/{batch_id}")
+async def get_plan_batch_status(batch_id: str):
+    status_info = await task_store.get(batch_id)
+    if not status_info or "total" not in status_info:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return status_info
+
+
+@app.get("/plan/batch/{batch_id}/results")
+async def download_plan_batch_results(batch_id: str):
+    """One JSON line per row, in upload order, with the row's current status and its planData once completed."""
+    status_info = await task_store.get(batch_id)
+    if not status_info or "total" not in status_info:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    async def result_lines():
+        for row in range(status_info["total"]):
+            task_id = row_task_id(batch_id, row)
+            row_status = await task_store.get(task_id) or {"status": "failed", "error": "Task expired"}
+            row_status.pop("request_payload", None)
+            yield json.dumps({"row": row, "taskId": task_id, **row_status}, default=str) + "\n"
+
+    return StreamingResponse(
+        result_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="plans-{batch_id}.jsonl"'},
+    )
+
+
 @app.get("/plan/status/{task_id}")
 async def get_plan_status(task_id: str):
     logger.info(f"Received request for /plan/status/{task_id}")
-    status_info = task_statuses.get(task_id)
+    status_info = await task_store.get(task_id)
     if not status_info:
         logger.warning(f"Task {task_id} not found in status check.")
         raise HTTPException(status_code=404, detail="Task not found")
     
     logger.info(f"Returning status for task {task_id}: {status_info.get('status')}")
     return status_info
+
+
+SSE_KEEPALIVE_SECONDS = 15
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.get("/plan/events/{task_id}")
+async def stream_plan_events(task_id: str):
+    """
+    Server-sent events for a task: its current status, each stage change, then the final result.
+    While the plan copy is generated, "partial" events carry the plan as far as it has been written.
+    """
+    if not await task_store.get(task_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def event_stream():
+        async with task_events.subscribe(task_id) as events:
+            # Read the status after subscribing so nothing published in between is missed
+            status_info = await task_store.get(task_id) or {"status": "failed", "error": "Task expired"}
+            status_info.pop("request_payload", None)
+            yield _sse("status", status_info)
+
+            while status_info.get("status") not in TERMINAL_STATUSES:
+                try:
+                    status_info = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # The final event can be lost (the Redis pump or the worker died), so
+                    # check the store rather than keeping a finished task's stream open
+                    stored = await task_store.get(task_id) or {"status": "failed", "error": "Task expired"}
+                    if stored.get("status") in TERMINAL_STATUSES:
+                        stored.pop("request_payload", None)
+                        yield _sse("status", stored)
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse("partial" if "partialPlan" in status_info else "status", status_info)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _agency_id_for(api_key: str) -> int:
+    catalog = await get_agency_catalog(api_key)
+    if catalog is None:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    return catalog.agency_id
+
+async def _plan_page(agency_id: int, client_id: Optional[int], limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    try:
+        plans, next_cursor = await list_plans(agency_id, client_id, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"plans": jsonable_encoder(plans), "nextCursor": next_cursor}
+
+@app.get("/plans")
+async def get_plans(
+    x_api_key: str = Header(...),
+    limit: int = Query(PLAN_HISTORY_PAGE_SIZE, ge=1, le=PLAN_HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None  # nextCursor from the previous page
+):
+    """The agency's saved plans, newest first, without their plan data."""
+    return await _plan_page(await _agency_id_for(x_api_key), None, limit, cursor)
+
+@app.get("/clients/{client_id}/plans")
+async def get_client_plans(
+    client_id: int,
+    x_api_key: str = Header(...),
+    limit: int = Query(PLAN_HISTORY_PAGE_SIZE, ge=1, le=PLAN_HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    return await _plan_page(await _agency_id_for(x_api_key), client_id, limit, cursor)
+
+@app.get("/plans/{plan_id}")
+async def get_saved_plan(plan_id: int, x_api_key: str = Header(...)):
+    plan = await get_plan(await _agency_id_for(x_api_key), plan_id)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return jsonable_encoder(plan)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # created_at is stored as naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+@app.get("/analytics/services")
+async def get_service_analytics(
+    x_api_key: str = Header(...),
+    since: Optional[datetime] = None,   # Defaults to the start of the current month (UTC)
+    until: Optional[datetime] = None,   # Defaults to now
+    serviceId: Optional[int] = None     # Count the plans recommending just this service
+):
+    """How often each of the agency's services was recommended by plans created in [since, until)."""
+    agency_id = await _agency_id_for(x_api_key)
+    until = _naive_utc(until or datetime.now(timezone.utc))
+    since = _naive_utc(since) if since else month_start(until)
+    period = {"since": since.isoformat(), "until": until.isoformat()}
+    if serviceId is not None:
+        return {**period, "serviceId": serviceId, "plans": await count_plans_recommending(agency_id, serviceId, since, until)}
+    return {**period, "services": await service_recommendation_counts(agency_id, since, until)}
+
+
+@app.get("/screenshots/{blob_id}")
+async def get_screenshot(blob_id: str, req: Request):
+    path = await screenshot_store.path_for(blob_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+
+    # Blob ids are content hashes, so the response for an id never changes
+    etag = f'"{BLOB_ID_PATTERN.match(blob_id).group(1)}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = req.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    media_type = MEDIA_TYPES[blob_id.rsplit(".", 1)[1]]
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+@app.get("/health")
+async def get_health():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def get_readiness():
+    """Readiness: 503 until the start-up warm-up has finished, with the state of each step."""
+    snapshot = warmup.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
+
+
+@app.get("/debug/event-loop")
+async def get_event_loop_stats():
+    return loop_monitor.snapshot()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=await metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
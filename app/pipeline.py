@@ -0,0 +1,418 @@
+from sqlalchemy import insert, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from fastapi.encoders import jsonable_encoder
+from app.schemas import AIResponse, ClientResponses, DisplayServiceRecommendation
+from app.services.scraper import capture_website
+from app.services.task_store import task_store
+from app.services.task_events import task_events, TERMINAL_STATUSES
+from app.services.agency_cache import AgencyCatalog, get_agency_catalog
+from app.services.pipeline_dag import DagResult, Stage, run_dag
+from app.services.plan_batch import row_task_id, PLAN_BATCH_CONCURRENCY, PLAN_BATCH_INSERT_SIZE
+from app.services.metrics import plan_stage_seconds, plans_in_flight, plans_total, track_llm_usage, record_agency_usage
+from app.services.openai_llm import analyse_website, recommend_services, extract_company_insights
+from app.db import AsyncSessionLocal, Client as App_DB_Client, Plan as App_DB_Plan
+import asyncio
+import contextlib
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Any, Optional, Sequence
+
+# Prefix for links handed to the frontend, e.g. https://api.planform.ai
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+# Stream the plan copy to /plan/events listeners while it is being generated
+PLAN_STREAMING = os.getenv("PLAN_STREAMING", "true").lower() == "true"
+
+# Per-stage time limits
+PLAN_DB_TIMEOUT_SECONDS    = float(os.getenv("PLAN_DB_TIMEOUT_SECONDS", 15))
+PLAN_CRAWL_TIMEOUT_SECONDS = float(os.getenv("PLAN_CRAWL_TIMEOUT_SECONDS", 90))
+PLAN_LLM_TIMEOUT_SECONDS   = float(os.getenv("PLAN_LLM_TIMEOUT_SECONDS", 120))
+
+PLAN_CANCELLED_ERROR = "Plan generation was interrupted. Please try again."
+
+logger = logging.getLogger(__name__)
+
+
+class AgencyNotFound(LookupError):
+    pass
+
+
+async def _set_task_status(task_id: str, status: Dict[str, Any]):
+    """Replace the task's status and push it to anyone listening on /plan/events."""
+    await task_store.set(task_id, status)
+    await task_events.publish(task_id, status)
+
+async def _set_task_stage(task_id: str, stage: str):
+    await task_store.update(task_id, status="processing", stage=stage)
+    await task_events.publish(task_id, {"status": "processing", "stage": stage})
+
+
+def build_plan_stages(task_id: str, payload: ClientResponses, refresh: bool,
+                      load_catalog: Callable[[], Awaitable[AgencyCatalog]],
+                      stream_partials: bool = PLAN_STREAMING) -> list[Stage]:
+    """
+    The stages from the agency catalog lookup to the generated plan copy ("recommend").
+
+    The catalog lookup runs alongside the website capture, and the screenshot analysis
+    and the insights extraction both start as soon as the capture is done. The website
+    stages are optional, so a site that can't be crawled or analysed still gets a plan
+    built from the questionnaire alone. Callers add a stage to save the result.
+    """
+    answers = payload.model_dump()
+    if payload.model_extra:
+        answers.update(payload.model_extra)
+    use_cache = not refresh
+
+    async def capture():
+        # One navigation of the homepage gives us both the screenshot and the crawl
+        await _set_task_stage(task_id, "crawling")
+        return await capture_website(payload.websiteUrl, max_pages=6, refresh=refresh)
+
+    async def analyse(capture):
+        if capture is None:
+            return None
+        await _set_task_stage(task_id, "analysing")
+        return await analyse_website(
+            capture.screenshot_b64, payload.websiteUrl, answers, capture.screenshot_media_type,
+            use_cache=use_cache
+        )
+
+    async def insights(capture):
+        if capture is None or not capture.pages:
+            logger.warning(f"Task {task_id}: No content found during website crawl")
+            return None
+        company_insights = await extract_company_insights(capture.pages, answers, use_cache=use_cache)
+        logger.info(f"Task {task_id}: Extracted insights from {len(capture.pages)} pages")
+        return company_insights
+
+    async def publish_partial_plan(partial_plan: Dict[str, Any]):
+        await task_events.publish(task_id, {"status": "processing", "stage": "recommending", "partialPlan": partial_plan})
+
+    async def recommend(catalog, analyse=None, insights=None):
+        await _set_task_stage(task_id, "recommending")
+        return await recommend_services(
+            catalog.description, catalog.services, answers, analyse, insights,
+            on_partial=publish_partial_plan if stream_partials else None,
+            services_json=catalog.services_json,
+            use_cache=use_cache
+        )
+
+    stages = [Stage("catalog", load_catalog, timeout=PLAN_DB_TIMEOUT_SECONDS)]
+    recommend_deps = ("catalog",)
+    if payload.websiteUrl:
+        stages += [
+            Stage("capture", capture, timeout=PLAN_CRAWL_TIMEOUT_SECONDS, optional=True),
+            Stage("analyse", analyse, deps=("capture",), timeout=PLAN_LLM_TIMEOUT_SECONDS, optional=True),
+            Stage("insights", insights, deps=("capture",), timeout=PLAN_LLM_TIMEOUT_SECONDS, optional=True),
+        ]
+        recommend_deps += ("analyse", "insights")
+    stages.append(Stage("recommend", recommend, deps=recommend_deps, timeout=PLAN_LLM_TIMEOUT_SECONDS))
+    return stages
+
+
+async def _upsert_clients(db, agency_id: int, payloads: list[ClientResponses]) -> Dict[str, int]:
+    """
+    Insert the clients that don't exist yet, in one statement, and return every client id by email.
+
+    Relies on the unique (agency_id, email) index: concurrent plans for the same new
+    client both land on one row instead of racing to create two.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for payload in payloads:
+        if payload.email and payload.email not in rows:
+            rows[payload.email] = {"email": payload.email, "name": payload.name, "website_url": payload.websiteUrl, "agency_id": agency_id}
+    if not rows:
+        return {}
+
+    # Lock rows in a fixed order, so two batches sharing clients can't deadlock on each other
+    upsert = pg_insert(App_DB_Client).values([rows[email] for email in sorted(rows)])
+    # DO UPDATE rather than DO NOTHING so RETURNING includes the clients that already existed
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[App_DB_Client.agency_id, App_DB_Client.email],
+        set_={"updated_at": func.now()},
+    ).returning(App_DB_Client.id, App_DB_Client.email)
+    result = await db.execute(upsert)
+    return {email: client_id for client_id, email in result.all()}
+
+
+def _recommended_service_ids(ai_response_data: AIResponse, service_ids: Sequence[int]) -> list[int]:
+    """Service.id of each recommendation; recommendation ids are positions in the agency catalog."""
+    return [
+        service_ids[recommendation.id]
+        for recommendation in ai_response_data.recommendations
+        if 0 <= recommendation.id < len(service_ids)
+    ]
+
+
+async def save_plans(agency_id: int, plans: list[tuple[ClientResponses, AIResponse]],
+                     session_factory=AsyncSessionLocal, service_ids: Sequence[int] = ()) -> list[tuple[int, Optional[int]]]:
+    """
+    Upsert each plan's client and insert the plans, in one short transaction.
+
+    That is one statement for the clients, one for the plans and the commit, however
+    many plans there are; ids come back through RETURNING, so nothing is refreshed.
+
+    Args:
+        agency_id: Agency the plans belong to
+        plans: (questionnaire payload, generated plan) pairs
+        service_ids: The catalog's Service.id list (AgencyCatalog.service_ids), to record which services were recommended
+
+    Returns:
+        (plan id, client id) for each input, in order. The client id is None for payloads without an email.
+    """
+    async with session_factory() as db:
+        client_ids = await _upsert_clients(db, agency_id, [payload for payload, _ in plans])
+        plan_rows = [
+            {
+                "client_id": client_ids.get(payload.email) if payload.email else None,
+                "agency_id": agency_id,
+                "plan_data": ai_response_data.model_dump(),
+                "plan_title": ai_response_data.planTitle,
+                "recommended_service_ids": _recommended_service_ids(ai_response_data, service_ids),
+            }
+            for payload, ai_response_data in plans
+        ]
+        result = await db.execute(
+            insert(App_DB_Plan).returning(App_DB_Plan.id, sort_by_parameter_order=True),
+            plan_rows,
+        )
+        plan_ids = result.scalars().all()
+        await db.commit()
+    return [(plan_id, row["client_id"]) for plan_id, row in zip(plan_ids, plan_rows)]
+
+
+def build_plan_data(catalog: AgencyCatalog, dag: DagResult, plan_id: int, client_id: Optional[int]) -> Dict[str, Any]:
+    """The planData returned to the frontend for a finished pipeline run."""
+    ai_response_data = dag.results["recommend"]
+    website_capture = dag.results.get("capture")
+    screenshot_url = f"{PUBLIC_BASE_URL}/screenshots/{website_capture.screenshot_id}" if website_capture else None
+
+    display_recommendations = []
+    for recommendation in ai_response_data.recommendations:
+        # Positions outside the catalog are dropped, as in _recommended_service_ids
+        if not 0 <= recommendation.id < len(catalog.services):
+            continue
+        display_recommendations.append(DisplayServiceRecommendation(
+            id=recommendation.id,
+            serviceId=recommendation.serviceId,
+            reason=recommendation.reason,
+            description=catalog.services[recommendation.id]["description"]
+        ))
+
+    plan_data_for_response = {
+        "planId": plan_id,
+        "clientId": client_id,
+        "recommendations": display_recommendations,
+        "executiveSummary": ai_response_data.executiveSummary,
+        "websiteAnalysis": dag.results.get("analyse"),
+        "screenshotUrl": screenshot_url,
+        "planTitle": ai_response_data.planTitle,
+        "subTitle": ai_response_data.subTitle,
+        "callToAction": ai_response_data.callToAction
+    }
+    return jsonable_encoder(plan_data_for_response)
+
+
+def stage_timings(dag: DagResult) -> Dict[str, float]:
+    """Record the run's stage timings in the metrics and return them rounded for the task status."""
+    for stage_name, seconds in dag.timings.items():
+        plan_stage_seconds.observe(seconds, stage=stage_name)
+    return {stage_name: round(seconds, 3) for stage_name, seconds in dag.timings.items()}
+
+
+async def generate_plan_async(task_id: str, payload: ClientResponses, agency_api_key: str, client_host: str, refresh: bool = False):
+    """
+    Run the whole plan pipeline for one task and record the outcome in the task store.
+
+    See build_plan_stages for how the work overlaps. A database session is opened only
+    for the final writes, so no pooled connection is held while the site is crawled
+    and the LLM calls run.
+    """
+    plans_in_flight.inc()
+    llm_usage = track_llm_usage()
+    agency_id = None
+    outcome = "failed"
+    try:
+        await task_store.update(task_id, status="processing")
+        await task_events.publish(task_id, {"status": "processing"})
+
+        async def load_catalog():
+            nonlocal agency_id
+            # Agency and its active service catalog, cached per API key
+            catalog = await get_agency_catalog(agency_api_key)
+            if catalog is None:
+                raise AgencyNotFound("Agency not found.")
+            agency_id = catalog.agency_id
+            return catalog
+
+        async def save(catalog, recommend):
+            await _set_task_stage(task_id, "saving")
+            return (await save_plans(catalog.agency_id, [(payload, recommend)], service_ids=catalog.service_ids))[0]
+
+        stages = build_plan_stages(task_id, payload, refresh, load_catalog)
+        stages.append(Stage("save", save, deps=("catalog", "recommend"), timeout=PLAN_DB_TIMEOUT_SECONDS))
+
+        dag = await run_dag(stages)
+        for stage_name, error in dag.errors.items():
+            logger.warning(f"Task {task_id}: Optional stage '{stage_name}' failed, continuing without it: {error}")
+
+        plan_id, client_id = dag.results["save"]
+        plan_data = build_plan_data(dag.results["catalog"], dag, plan_id, client_id)
+        timings = stage_timings(dag)
+        await _set_task_status(task_id, {"status": "completed", "planData": plan_data, "timings": timings})
+        logger.info(f"Task {task_id}: Plan generation completed successfully. Stage timings: {timings}")
+        outcome = "completed"
+
+    except AgencyNotFound:
+        await _set_task_status(task_id, {"status": "failed", "error": "Agency not found."})
+        logger.error(f"Task {task_id}: Agency not found for API key.")
+    except Exception as e:
+        logger.error(f"Task {task_id}: Error during plan generation: {e}", exc_info=True)
+        await _set_task_status(task_id, {"status": "failed", "error": str(e)})
+    except asyncio.CancelledError:
+        # The worker is shutting down; don't leave the task "processing" for the client to poll forever
+        logger.error(f"Task {task_id}: Plan generation cancelled.")
+        await _set_task_status(task_id, {"status": "failed", "error": PLAN_CANCELLED_ERROR})
+        raise
+    finally:
+        plans_in_flight.dec()
+        plans_total.inc(status=outcome)
+        if agency_id is not None:
+            record_agency_usage(agency_id, llm_usage)
+
+
+async def generate_batch_async(batch_id: str, payloads: list[ClientResponses], agency_api_key: str,
+                               refresh: bool = False, concurrency: int = PLAN_BATCH_CONCURRENCY,
+                               slots: Optional[asyncio.Semaphore] = None):
+    """
+    Run a lead list through the plan pipeline, `concurrency` rows at a time, each row
+    also holding one of `slots` (the process-wide pipeline limit) while it runs.
+
+    The agency catalog is resolved once for the whole batch, and every row's prompts
+    share its catalog prefix. Finished plans are saved PLAN_BATCH_INSERT_SIZE at a
+    time (see save_plans) rather than one transaction per row. Each row's outcome is
+    recorded under its own task id and the batch's counters under `batch_id`. If the
+    batch itself fails or is cancelled, it and every row without an outcome yet are
+    marked failed. Rows that already have an outcome, from a run interrupted by a
+    worker crash, are not run again.
+    """
+    progress = {"status": "processing", "total": len(payloads), "completed": 0, "failed": 0}
+    recorded: set[int] = set()   # Rows whose outcome is in the task store
+    llm_usage = track_llm_usage()
+    catalog: Optional[AgencyCatalog] = None
+
+    async def finish(row: int, status: Dict[str, Any]):
+        if row in recorded:
+            return
+        recorded.add(row)
+        await _set_task_status(row_task_id(batch_id, row), status)
+        progress[status["status"]] += 1
+        plans_total.inc(status=status["status"])
+        await _set_task_status(batch_id, dict(progress))
+
+    async def fail_batch(error: str):
+        for row in range(len(payloads)):
+            if row not in recorded:
+                recorded.add(row)
+                await _set_task_status(row_task_id(batch_id, row), {"status": "failed", "error": error})
+                progress["failed"] += 1
+                plans_total.inc(status="failed")
+        progress.update(status="failed", error=error)
+        await _set_task_status(batch_id, dict(progress))
+
+    try:
+        # A batch requeued after its worker died resumes: rows that already have an outcome keep it
+        previous = await asyncio.gather(*(task_store.get(row_task_id(batch_id, row)) for row in range(len(payloads))))
+        for row, status in enumerate(previous):
+            if status and status.get("status") in TERMINAL_STATUSES:
+                recorded.add(row)
+                progress[status["status"]] += 1
+
+        await _set_task_status(batch_id, dict(progress))
+        catalog = await get_agency_catalog(agency_api_key)
+        if catalog is None:
+            raise AgencyNotFound("Agency not found.")
+
+        async def load_catalog():
+            return catalog
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        process_slots = slots or contextlib.nullcontext()
+        write_lock = asyncio.Lock()
+        finished: list[tuple[int, ClientResponses, DagResult]] = []
+
+        async def save_finished():
+            async with write_lock:
+                rows = finished[:]
+                finished.clear()
+                if not rows:
+                    return
+                try:
+                    ids = await asyncio.wait_for(
+                        save_plans(
+                            catalog.agency_id, [(payload, dag.results["recommend"]) for _, payload, dag in rows],
+                            service_ids=catalog.service_ids,
+                        ),
+                        timeout=PLAN_DB_TIMEOUT_SECONDS,
+                    )
+                except Exception as e:
+                    logger.error(f"Batch {batch_id}: Failed to save {len(rows)} plans: {e}", exc_info=True)
+                    for row, _, _ in rows:
+                        await finish(row, {"status": "failed", "error": str(e) or type(e).__name__})
+                    return
+                for (row, _, dag), (plan_id, client_id) in zip(rows, ids):
+                    try:
+                        plan_data = build_plan_data(catalog, dag, plan_id, client_id)
+                    except Exception as e:
+                        logger.error(f"Task {row_task_id(batch_id, row)}: Plan {plan_id} saved but its planData failed: {e}", exc_info=True)
+                        await finish(row, {"status": "failed", "error": str(e) or type(e).__name__})
+                        continue
+                    await finish(row, {"status": "completed", "planData": plan_data, "timings": stage_timings(dag)})
+
+        async def run_row(row: int, payload: ClientResponses):
+            task_id = row_task_id(batch_id, row)
+            async with semaphore, process_slots:
+                plans_in_flight.inc()
+                try:
+                    await task_store.update(task_id, status="processing")
+                    dag = await run_dag(build_plan_stages(task_id, payload, refresh, load_catalog, stream_partials=False))
+                except Exception as e:
+                    logger.error(f"Task {task_id}: Error during plan generation: {e}", exc_info=True)
+                    await finish(row, {"status": "failed", "error": str(e)})
+                    return
+                finally:
+                    plans_in_flight.dec()
+            for stage_name, error in dag.errors.items():
+                logger.warning(f"Task {task_id}: Optional stage '{stage_name}' failed, continuing without it: {error}")
+
+            # Saving happens outside the semaphores so writes never hold up the next row's crawl
+            finished.append((row, payload, dag))
+            if len(finished) >= PLAN_BATCH_INSERT_SIZE:
+                await save_finished()
+
+        # A row that raises (e.g. the task store is unreachable) cancels the others before the batch is failed,
+        # so no row keeps running, or holding a process slot, after its outcome has been recorded
+        async with asyncio.TaskGroup() as rows:
+            for row, payload in enumerate(payloads):
+                if row not in recorded:
+                    rows.create_task(run_row(row, payload))
+        await save_finished()
+
+        progress["status"] = "completed"
+        await _set_task_status(batch_id, dict(progress))
+        logger.info(f"Batch {batch_id}: {progress['completed']} of {progress['total']} plans completed, {progress['failed']} failed.")
+
+    except AgencyNotFound:
+        await fail_batch("Agency not found.")
+        logger.error(f"Batch {batch_id}: Agency not found for API key.")
+    except Exception as e:
+        logger.error(f"Batch {batch_id}: Error during batch generation: {e}", exc_info=True)
+        if isinstance(e, ExceptionGroup):
+            e = e.exceptions[0]   # From the row TaskGroup: report the row's own error
+        await fail_batch(str(e) or type(e).__name__)
+    except asyncio.CancelledError:
+        logger.error(f"Batch {batch_id}: Batch generation cancelled with {len(payloads) - len(recorded)} rows unfinished.")
+        await fail_batch(PLAN_CANCELLED_ERROR)
+        raise
+    finally:
+        if catalog is not None:
+            record_agency_usage(catalog.agency_id, llm_usage)
@@ -22,10 +22,11 @@ class WebsiteAnalysis(BaseModel):
     overallImpression:  str
 
 class AIResponse(BaseModel):
-    recommendations: List[ServiceRecommendation]
-    executiveSummary: str
+    # Field order is generation order when streaming: headline copy first so it can be shown early
     planTitle: str
     subTitle: str
+    executiveSummary: str
+    recommendations: List[ServiceRecommendation]
     callToAction: str
 
 class DisplayServiceRecommendation(ServiceRecommendation):
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+from dataclasses import dataclass, asdict
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from app.db import AsyncSessionLocal, Agency
+from app.services.ttl_cache import TieredCache
+
+# Agencies and services are edited outside this service, so the TTL is what bounds how
+# stale a cached catalog can be; invalidate_agency drops one sooner.
+AGENCY_CACHE_TTL_SECONDS = int(os.getenv("AGENCY_CACHE_TTL_SECONDS", 5 * 60))
+AGENCY_CACHE_MAX_ENTRIES = int(os.getenv("AGENCY_CACHE_MAX_ENTRIES", 256))
+AGENCY_CACHE_USE_REDIS   = os.getenv("AGENCY_CACHE_USE_REDIS", "true").lower() == "true"
+
+agency_cache = TieredCache("agency", AGENCY_CACHE_MAX_ENTRIES, AGENCY_CACHE_TTL_SECONDS, use_redis=AGENCY_CACHE_USE_REDIS)
+
+
+@dataclass
+class AgencyCatalog:
+    """Everything the pipeline needs about an agency, resolved once per TTL."""
+    agency_id:     int
+    description:   Optional[str]
+    services:      list[dict]   # Prompt-ready service dicts, active services only
+    service_ids:   list[int]    # Service.id for each entry of `services`, same order
+    services_json: str          # `services` serialised for the prompt
+
+
+def _cache_key(api_key: str) -> str:
+    # Keep raw API keys out of Redis key names
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+def _build_catalog(agency: Agency) -> AgencyCatalog:
+    active_services = [service for service in agency.services if service.is_active is not False]
+    services = [
+        {
+            "name": service.name,
+            "description": service.description,
+            "outcomes": service.outcomes,
+            "price_lower": service.price_lower,
+            "price_upper": service.price_upper,
+            "when_to_recommend": service.when_to_recommend,
+        }
+        for service in active_services
+    ]
+    return AgencyCatalog(
+        agency_id=agency.id,
+        description=agency.description,
+        services=services,
+        service_ids=[service.id for service in active_services],
+        services_json=json.dumps(services, indent=2),
+    )
+
+async def get_agency_catalog(api_key: str, session_factory=AsyncSessionLocal) -> Optional[AgencyCatalog]:
+    """Resolve an API key to its agency catalog, from cache when possible. None if there is no such agency."""
+    key = _cache_key(api_key)
+    cached = await agency_cache.get(key)
+    if cached is not None:
+        return AgencyCatalog(**cached)
+
+    async with session_factory() as db:
+        result = await db.execute(
+            select(Agency)
+            .where(Agency.api_key == api_key)
+            .options(selectinload(Agency.services))
+        )
+        agency = result.scalars().first()
+        if agency is None:
+            return None
+        catalog = _build_catalog(agency)
+
+    await agency_cache.set(key, asdict(catalog))
+    return catalog
+
+async def prime_agency_catalogs(limit: int = AGENCY_CACHE_MAX_ENTRIES, session_factory=AsyncSessionLocal) -> int:
+    """Load up to `limit` agencies' catalogs into the cache in one query, so their first plans skip the lookup. Returns how many."""
+    async with session_factory() as db:
+        result = await db.execute(
+            select(Agency)
+            .where(Agency.api_key.is_not(None))
+            .order_by(Agency.id)
+            .limit(limit)
+            .options(selectinload(Agency.services))
+        )
+        agencies = result.scalars().all()
+        catalogs = [(agency.api_key, _build_catalog(agency)) for agency in agencies]
+
+    for api_key, catalog in catalogs:
+        await agency_cache.set(_cache_key(api_key), asdict(catalog))
+    return len(catalogs)
+
+async def invalidate_agency(api_key: str):
+    """Drop an agency's cached catalog from both tiers, for tools that edit an agency and can't wait for the TTL."""
+    await agency_cache.delete(_cache_key(api_key))
@@ -0,0 +1,135 @@
+import io
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+import threading
+from typing import Optional
+
+try:
+    from PIL import Image  # Optional: only needed to re-encode screenshots as WebP
+except ImportError:
+    Image = None
+
+SCREENSHOT_STORE_DIR       = os.getenv("SCREENSHOT_STORE_DIR", os.path.join(tempfile.gettempdir(), "planform-screenshots"))
+SCREENSHOT_STORE_MAX_BYTES = int(os.getenv("SCREENSHOT_STORE_MAX_BYTES", 512 * 1024 * 1024))
+SCREENSHOT_FORMAT          = os.getenv("SCREENSHOT_FORMAT", "jpeg").lower()   # jpeg | webp | png
+SCREENSHOT_QUALITY         = int(os.getenv("SCREENSHOT_QUALITY", 75))
+
+MEDIA_TYPES = {"jpg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+BLOB_ID_PATTERN = re.compile(r"^([0-9a-f]{64})\.(jpg|webp|png)$")
+
+
+class LocalBlobStore:
+    """
+    Content-addressed files on local disk.
+
+    Blobs are named after the SHA-256 of their bytes, so storing the same image twice
+    is a no-op and a blob id can be cached forever. Once the directory grows past
+    `max_bytes` the least recently read blobs are deleted.
+
+    The directory's size is counted once and then kept up to date as blobs are
+    added; it is only walked again when that count goes over `max_bytes`. Other
+    processes sharing the directory aren't counted until then, so it may briefly
+    overshoot the limit.
+    """
+
+    def __init__(self, root: str = SCREENSHOT_STORE_DIR, max_bytes: int = SCREENSHOT_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._total_bytes: Optional[int] = None   # None until the first write counts the directory
+        self._lock = threading.Lock()             # Writes run in worker threads
+
+    def _path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.{extension}")
+
+    async def put(self, data: bytes, extension: str) -> str:
+        """Store the bytes and return their blob id ("<sha256>.<extension>")."""
+        return await asyncio.to_thread(self._put, data, extension)
+
+    def _put(self, data: bytes, extension: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, extension)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                if self._total_bytes is None:
+                    self._total_bytes = sum(size for _, size, _ in self._files())
+                else:
+                    self._total_bytes += len(data)
+                if self._total_bytes > self.max_bytes:
+                    self._total_bytes = self._evict(keep=path)
+        return f"{digest}.{extension}"
+
+    async def path_for(self, blob_id: str) -> Optional[str]:
+        """Filesystem path of a stored blob, or None for unknown or malformed ids."""
+        match = BLOB_ID_PATTERN.match(blob_id)
+        if not match:
+            return None
+        return await asyncio.to_thread(self._touch, self._path(match.group(1), match.group(2)))
+
+    @staticmethod
+    def _touch(path: str) -> Optional[str]:
+        try:
+            os.utime(path)  # Reads count as use for eviction
+        except FileNotFoundError:
+            return None
+        except OSError:
+            pass
+        return path
+
+    def _files(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, path) of every stored file."""
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _evict(self, keep: str) -> int:
+        """Delete the least recently used files until the directory fits; returns its new size."""
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        return total
+
+
+def encode_screenshot(png: bytes) -> tuple[bytes, str]:
+    """
+    Re-encode a PNG screenshot in the configured delivery format.
+
+    Returns:
+        The encoded bytes and the file extension. WebP needs Pillow; without it
+        the PNG is kept as is. JPEG screenshots are taken directly by Playwright,
+        so they never reach this function.
+    """
+    if SCREENSHOT_FORMAT == "webp" and Image is not None:
+        buffer = io.BytesIO()
+        Image.open(io.BytesIO(png)).save(buffer, format="WEBP", quality=SCREENSHOT_QUALITY)
+        return buffer.getvalue(), "webp"
+    return png, "png"
+
+
+screenshot_store = LocalBlobStore()
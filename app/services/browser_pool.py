@@ -0,0 +1,210 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Playwright
+
+BROWSER_MAX_PAGES            = int(os.getenv("BROWSER_MAX_PAGES", 200))          # recycle a browser after this many pages
+BROWSER_MAX_MEMORY_MB        = int(os.getenv("BROWSER_MAX_MEMORY_MB", 1536))     # recycle when Chromium RSS crosses this (0 = off)
+BROWSER_MEMORY_CHECK_SECONDS = float(os.getenv("BROWSER_MEMORY_CHECK_SECONDS", 5))
+
+BROWSER_LAUNCH_ARGS = ["--no-sandbox", "--disable-dev-shm-usage", "--disable-web-security"]
+
+
+def _process_tree_rss_mb(root_pid: int) -> float:
+    """
+    Sum the resident memory of every descendant of root_pid.
+
+    Playwright runs Chromium under its driver process, which is a child of this
+    worker, so this is the memory used by the browsers we launched. Only works
+    where /proc is available; elsewhere it reports 0 and memory recycling is a no-op.
+    """
+    parents: dict[int, int] = {}
+    rss_pages: dict[int, int] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return 0.0
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the "(comm)" part: state, ppid, ... rss is the 22nd of those
+        fields = stat.rsplit(")", 1)[1].split()
+        pid = int(entry)
+        parents[pid] = int(fields[1])
+        rss_pages[pid] = int(fields[21])
+
+    total_pages = 0
+    for pid in parents:
+        ancestor = parents.get(pid)
+        while ancestor:
+            if ancestor == root_pid:
+                total_pages += rss_pages[pid]
+                break
+            ancestor = parents.get(ancestor)
+
+    return total_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class _PooledBrowser:
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.pages_served = 0
+        self.active_contexts = 0
+        self.retired = False
+        self.disconnected = False
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, _browser):
+        self.disconnected = True
+
+
+class BrowserPool:
+    """
+    Process-wide Chromium shared by the screenshot and crawl paths.
+
+    Callers get an isolated BrowserContext per use via `context()`. The browser
+    behind it is launched once and recycled after `max_pages` pages or when the
+    browser processes grow past `max_memory_mb`. A recycled browser keeps
+    serving the contexts already handed out and is closed once they are released.
+    """
+
+    def __init__(self, max_pages: int = BROWSER_MAX_PAGES, max_memory_mb: int = BROWSER_MAX_MEMORY_MB):
+        self._max_pages = max_pages
+        self._max_memory_mb = max_memory_mb
+        self._playwright: Optional[Playwright] = None
+        self._current: Optional[_PooledBrowser] = None
+        self._draining: set[_PooledBrowser] = set()
+        self._lock = asyncio.Lock()
+        self._last_memory_check = 0.0
+        self._open_pages: set[Page] = set()
+
+    @property
+    def open_pages(self) -> int:
+        return len(self._open_pages)
+
+    @property
+    def active_contexts(self) -> int:
+        browsers = list(self._draining) + ([self._current] if self._current is not None else [])
+        return sum(pooled.active_contexts for pooled in browsers)
+
+    async def start(self):
+        """Launch the browser ahead of the first request."""
+        async with self._lock:
+            if self._current is None:
+                await self._launch()
+
+    async def stop(self):
+        async with self._lock:
+            browsers = list(self._draining)
+            if self._current is not None:
+                browsers.append(self._current)
+            self._current = None
+            self._draining.clear()
+            for pooled in browsers:
+                await self._close(pooled)
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    @asynccontextmanager
+    async def context(self, **context_kwargs) -> AsyncIterator[BrowserContext]:
+        """Yield a fresh BrowserContext; it is closed when the block exits."""
+        pooled = await self._acquire()
+        try:
+            context = await pooled.browser.new_context(**context_kwargs)
+        except Exception:
+            await self._release(pooled)
+            raise
+
+        context_pages: set[Page] = set()
+
+        def on_page_closed(page: Page):
+            context_pages.discard(page)
+            self._open_pages.discard(page)
+
+        def count_page(page: Page):
+            pooled.pages_served += 1
+            context_pages.add(page)
+            self._open_pages.add(page)
+            page.on("close", on_page_closed)
+
+        context.on("page", count_page)
+        try:
+            yield context
+        finally:
+            try:
+                await context.close()
+            except Exception as e:
+                print(f"WARN: Failed to close browser context: {e}")
+            self._open_pages.difference_update(context_pages)
+            await self._release(pooled)
+
+    async def _launch(self) -> _PooledBrowser:
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        browser = await self._playwright.chromium.launch(headless=True, args=BROWSER_LAUNCH_ARGS)
+        self._current = _PooledBrowser(browser)
+        return self._current
+
+    async def _acquire(self) -> _PooledBrowser:
+        # Measured before taking the lock: the /proc scan runs in a thread and
+        # other acquirers shouldn't queue behind it
+        over_memory = await self._over_memory_limit()
+        idle_retired = None
+        async with self._lock:
+            pooled = self._current
+            if pooled is not None and self._should_recycle(pooled, over_memory):
+                pooled.retired = True
+                self._current = None
+                if pooled.active_contexts == 0:
+                    idle_retired = pooled
+                else:
+                    self._draining.add(pooled)
+                pooled = None
+            if pooled is None:
+                pooled = await self._launch()
+            pooled.active_contexts += 1
+
+        if idle_retired is not None:
+            await self._close(idle_retired)
+        return pooled
+
+    async def _release(self, pooled: _PooledBrowser):
+        pooled.active_contexts -= 1
+        if pooled.retired and pooled.active_contexts == 0 and pooled in self._draining:
+            self._draining.discard(pooled)
+            await self._close(pooled)
+
+    def _should_recycle(self, pooled: _PooledBrowser, over_memory: bool = False) -> bool:
+        if pooled.disconnected or not pooled.browser.is_connected():
+            return True
+        if self._max_pages > 0 and pooled.pages_served >= self._max_pages:
+            return True
+        return over_memory
+
+    async def _over_memory_limit(self) -> bool:
+        # Skip while an old browser is still draining, its memory would trigger another recycle
+        if self._max_memory_mb <= 0 or self._draining:
+            return False
+        now = time.monotonic()
+        if now - self._last_memory_check < BROWSER_MEMORY_CHECK_SECONDS:
+            return False
+        self._last_memory_check = now
+        return await asyncio.to_thread(_process_tree_rss_mb, os.getpid()) > self._max_memory_mb
+
+    async def _close(self, pooled: _PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            print(f"WARN: Failed to close pooled browser: {e}")
+
+
+browser_pool = BrowserPool()
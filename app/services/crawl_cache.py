@@ -0,0 +1,48 @@
+import os
+import hashlib
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from app.services.ttl_cache import TieredCache
+
+CRAWL_CACHE_TTL_SECONDS = int(os.getenv("CRAWL_CACHE_TTL_SECONDS", 6 * 60 * 60))   # 6 hours
+CRAWL_CACHE_MAX_ENTRIES = int(os.getenv("CRAWL_CACHE_MAX_ENTRIES", 256))
+CRAWL_CACHE_USE_REDIS   = os.getenv("CRAWL_CACHE_USE_REDIS", "true").lower() == "true"
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+crawl_cache = TieredCache("crawl", CRAWL_CACHE_MAX_ENTRIES, CRAWL_CACHE_TTL_SECONDS, use_redis=CRAWL_CACHE_USE_REDIS)
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a start URL so trivially different spellings share a cache entry.
+    Lowercases scheme and host, drops default ports, fragments and trailing slashes,
+    and sorts the query string.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    netloc = host
+    if parts.port is not None and _DEFAULT_PORTS.get(scheme) != parts.port:
+        netloc = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def cache_key(url: str, max_pages: int) -> str:
+    digest = hashlib.sha256(normalize_url(url).encode()).hexdigest()
+    return f"{digest}:{max_pages}"
+
+async def get_cached_crawl(url: str, max_pages: int) -> Optional[dict]:
+    """Return the cached {"pages", "screenshot_b64", "screenshot_extension"} entry for this crawl, if any."""
+    return await crawl_cache.get(cache_key(url, max_pages))
+
+async def cache_crawl(url: str, max_pages: int, pages: dict[str, str],
+                      screenshot_b64: Optional[str] = None, screenshot_extension: Optional[str] = None):
+    # Don't pin failed crawls for the whole TTL
+    if not pages or any(content.startswith("Error accessing main page") for content in pages.values()):
+        return
+    await crawl_cache.set(cache_key(url, max_pages), {
+        "pages": pages,
+        "screenshot_b64": screenshot_b64,
+        "screenshot_extension": screenshot_extension,
+    })
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+from typing import Optional
+from app.schemas import ClientResponses
+from app.services.crawl_cache import normalize_url
+from app.services.redis_client import get_redis
+from app.services.ttl_cache import TTLCache
+
+PLAN_DEDUP_WINDOW_SECONDS = int(os.getenv("PLAN_DEDUP_WINDOW_SECONDS", 5 * 60))
+PLAN_DEDUP_MAX_ENTRIES    = int(os.getenv("PLAN_DEDUP_MAX_ENTRIES", 10000))
+
+KEY_PREFIX = "plan-dedup"
+CLAIM_ATTEMPTS = 3   # SET NX tries when the holder's key keeps expiring between SET and GET
+
+# Delete the key only if it still names the releasing task, in one step
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_local_claims = TTLCache(PLAN_DEDUP_MAX_ENTRIES, PLAN_DEDUP_WINDOW_SECONDS)
+_release_script = None
+_release_script_client = None
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+def plan_request_key(payload: ClientResponses, refresh: bool = False, idempotency_key: Optional[str] = None) -> str:
+    """
+    Identify a /plan request for deduplication.
+
+    An Idempotency-Key header, scoped to the API key, wins when the client sends one.
+    Otherwise the key is a fingerprint of the request: API key, email, normalised
+    website URL and every questionnaire answer.
+    """
+    api_key_hash = _sha256(payload.apiKey)
+    if idempotency_key:
+        return f"{KEY_PREFIX}:idem:{api_key_hash}:{_sha256(idempotency_key)}"
+
+    fingerprint = payload.model_dump(mode="json")
+    fingerprint["email"] = payload.email.strip().lower()
+    if payload.websiteUrl:
+        fingerprint["websiteUrl"] = normalize_url(payload.websiteUrl)
+    fingerprint["refresh"] = refresh
+    encoded = json.dumps(fingerprint, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{KEY_PREFIX}:fp:{_sha256(encoded)}"
+
+async def claim(key: str, task_id: str) -> Optional[str]:
+    """
+    Claim `key` for `task_id` for PLAN_DEDUP_WINDOW_SECONDS.
+
+    Returns:
+        None when the claim succeeded, otherwise the task id already holding the key.
+        Uses Redis SET NX when configured, so duplicates hitting different API
+        instances are caught too; falls back to this process on Redis errors.
+    """
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            for _ in range(CLAIM_ATTEMPTS):
+                if await redis_client.set(key, task_id, nx=True, ex=PLAN_DEDUP_WINDOW_SECONDS):
+                    return None
+                existing = await redis_client.get(key)
+                if existing is not None:
+                    return existing.decode() if isinstance(existing, bytes) else existing
+                # Expired between the two commands, try again
+            print(f"WARN: Redis dedup claim for {key} kept expiring, using in-process dedup")
+        except Exception as e:
+            print(f"WARN: Redis dedup claim failed, using in-process dedup: {e}")
+
+    existing = _local_claims.get(key)
+    if existing is not None:
+        return existing
+    _local_claims.set(key, task_id)
+    return None
+
+async def replace(key: str, task_id: str):
+    """Point `key` at a new task, used when the task holding it failed or expired."""
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            await redis_client.set(key, task_id, ex=PLAN_DEDUP_WINDOW_SECONDS)
+            return
+        except Exception as e:
+            print(f"WARN: Redis dedup replace failed, using in-process dedup: {e}")
+    _local_claims.set(key, task_id)
+
+async def release(key: str, task_id: str):
+    """Drop the claim if `task_id` still holds it, e.g. when the request was rejected before a task was created."""
+    global _release_script, _release_script_client
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            if _release_script is None or _release_script_client is not redis_client:
+                _release_script = redis_client.register_script(RELEASE_LUA)
+                _release_script_client = redis_client
+            await _release_script(keys=[key], args=[task_id])
+            return
+        except Exception as e:
+            print(f"WARN: Redis dedup release failed: {e}")
+    if _local_claims.get(key) == task_id:
+        _local_claims.delete(key)
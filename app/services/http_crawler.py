@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Optional
+from urllib.parse import urljoin, urldefrag
+import httpx
+from app.services.metrics import crawl_page_seconds
+
+CRAWL_MODE                 = os.getenv("CRAWL_MODE", "http").lower()         # "http" = HTTP first with browser fallback, "browser" = always render
+HTTP_CRAWL_MIN_TEXT_CHARS  = int(os.getenv("HTTP_CRAWL_MIN_TEXT_CHARS", 200))  # less text than this means the page probably needs JS
+HTTP_CRAWL_TIMEOUT_SECONDS = float(os.getenv("HTTP_CRAWL_TIMEOUT_SECONDS", 6))
+HTTP_CRAWL_MAX_BYTES       = int(os.getenv("HTTP_CRAWL_MAX_BYTES", 2 * 1024 * 1024))
+HTTP_CRAWL_CONCURRENCY     = int(os.getenv("HTTP_CRAWL_CONCURRENCY", 8))
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# Same elements the browser extraction removes before reading innerText
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "header", "nav", "footer"}
+SKIP_CLASSES = {"sidebar"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "form", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "main", "ol", "p", "pre", "section",
+    "table", "td", "th", "tr", "ul",
+}
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+@dataclass
+class FetchedPage:
+    text:    str
+    links:   list[str] = field(default_factory=list)
+    is_html: bool = True
+
+
+class _TextExtractor(HTMLParser):
+    """Approximates document.body.innerText and the page's links without a browser."""
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links: list[str] = []
+        self._lines: list[str] = []
+        self._current: list[str] = []
+        self._stack: list[str] = []
+        self._skip_depth: Optional[int] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "base":
+            href = dict(attrs).get("href")
+            if href:
+                self.base_url = urljoin(self.base_url, href)
+            return
+
+        attrs = dict(attrs)
+        if tag in BLOCK_TAGS:
+            self._break_line()
+        if tag in VOID_TAGS:
+            return
+
+        self._stack.append(tag)
+        classes = set((attrs.get("class") or "").split())
+        if self._skip_depth is None and (tag in SKIP_TAGS or classes & SKIP_CLASSES):
+            self._skip_depth = len(self._stack) - 1
+
+        if tag == "a" and self._skip_depth is None and attrs.get("href"):
+            link = urldefrag(urljoin(self.base_url, attrs["href"]))[0]
+            if link.startswith("http"):
+                self.links.append(link)
+
+    def handle_endtag(self, tag):
+        if tag not in self._stack:
+            return
+        # Pop up to the matching tag, which also closes anything left unclosed inside it
+        while self._stack and self._stack.pop() != tag:
+            pass
+        if self._skip_depth is not None and len(self._stack) <= self._skip_depth:
+            self._skip_depth = None
+        if tag in BLOCK_TAGS:
+            self._break_line()
+
+    def handle_data(self, data):
+        if self._skip_depth is None and self._stack_has_body_content():
+            self._current.append(data)
+
+    def _stack_has_body_content(self) -> bool:
+        return "title" not in self._stack and "head" not in self._stack
+
+    def _break_line(self):
+        line = " ".join("".join(self._current).split())
+        if line:
+            self._lines.append(line)
+        self._current = []
+
+    def result(self) -> tuple[str, list[str]]:
+        self._break_line()
+        return "\n".join(self._lines), self.links
+
+
+def extract_html(html: str, base_url: str) -> tuple[str, list[str]]:
+    """Return the visible text and absolute links of an HTML document."""
+    parser = _TextExtractor(base_url)
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        print(f"WARN: Failed to parse HTML from {base_url}: {e}")
+    return parser.result()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared client so crawls reuse pooled keep-alive connections."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_CRAWL_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def fetch_page(url: str) -> Optional[FetchedPage]:
+    """
+    Fetch a page over plain HTTP and extract its text and links.
+
+    Returns:
+        FetchedPage, with is_html=False for non-HTML responses such as PDFs.
+        None when the page could not be fetched, so the caller can fall back to a browser.
+    """
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(HTTP_CRAWL_CONCURRENCY)
+
+    async with _semaphore:
+        started = time.perf_counter()
+        try:
+            async with get_http_client().stream("GET", url) as response:
+                if response.status_code >= 400:
+                    return None
+                content_type = response.headers.get("content-type", "").lower()
+                if content_type and "html" not in content_type:
+                    return FetchedPage(text="", is_html=False)
+
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) >= HTTP_CRAWL_MAX_BYTES:
+                        break
+                html = body.decode(response.charset_encoding or "utf-8", errors="replace")
+                final_url = str(response.url)
+        except Exception as e:
+            print(f"HTTP fetch failed for {url}: {e}")
+            return None
+        finally:
+            crawl_page_seconds.observe(time.perf_counter() - started, mode="http")
+
+    text, links = extract_html(html, final_url)
+    return FetchedPage(text=text, links=links)
+
+def needs_browser(page: Optional[FetchedPage]) -> bool:
+    """True when a plain HTTP fetch didn't yield enough text and the page should be rendered."""
+    if page is None:
+        return True
+    return page.is_html and len(page.text.strip()) < HTTP_CRAWL_MIN_TEXT_CHARS
@@ -0,0 +1,176 @@
+import os
+import json
+import uuid
+import socket
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+from app.services.redis_client import get_redis
+
+PLAN_QUEUE_BACKEND               = os.getenv("PLAN_QUEUE_BACKEND", "memory").lower()   # memory | redis
+PLAN_QUEUE_MAX_DEPTH             = int(os.getenv("PLAN_QUEUE_MAX_DEPTH", 100))          # /plan answers 503 at this many waiting jobs
+PLAN_QUEUE_RETRY_AFTER_SECONDS   = int(os.getenv("PLAN_QUEUE_RETRY_AFTER_SECONDS", 30))
+PLAN_QUEUE_HEARTBEAT_TTL_SECONDS = int(os.getenv("PLAN_QUEUE_HEARTBEAT_TTL_SECONDS", 30))  # a worker silent this long has its jobs requeued
+PLAN_BATCH_QUEUE_MAX_DEPTH       = int(os.getenv("PLAN_BATCH_QUEUE_MAX_DEPTH", 20))     # /plan/batch answers 503 at this many waiting batches
+
+
+class JobQueue(ABC):
+    """FIFO of plan jobs between the API and the workers that run the pipeline."""
+
+    @abstractmethod
+    async def enqueue(self, job: dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def dequeue(self, timeout: float) -> Optional[dict[str, Any]]:
+        """Next job, or None if none arrived within timeout seconds. Call ack() once it has been handled."""
+        ...
+
+    @abstractmethod
+    async def depth(self) -> int:
+        """Number of jobs waiting to be picked up."""
+        ...
+
+    async def ack(self, job: dict[str, Any]):
+        """Mark a dequeued job as handled, so it isn't given to another worker."""
+
+    async def start(self):
+        """Called by a process before its workers start dequeuing."""
+
+    async def stop(self):
+        """Called by a process after its workers have stopped."""
+
+
+class MemoryJobQueue(JobQueue):
+    """In-process queue; jobs are only visible to workers running in the same process."""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def enqueue(self, job):
+        self._get_queue().put_nowait(job)
+
+    async def dequeue(self, timeout):
+        try:
+            return await asyncio.wait_for(self._get_queue().get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def depth(self):
+        return self._get_queue().qsize()
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Redis list shared by every API and worker process.
+
+    A dequeued job is moved, atomically, onto this process's processing list and
+    only removed from it by ack(). Each consuming process keeps a heartbeat key
+    alive; when a worker starts, and about once a heartbeat TTL after that, it puts
+    the jobs of processes whose heartbeat has expired (crashed, OOM-killed,
+    redeployed) back at the head of the queue.
+    """
+
+    def __init__(self, redis_client, key: str = "plan-jobs", consumer_id: Optional[str] = None):
+        self._redis = redis_client
+        self._key = key
+        self._consumer_id = consumer_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._raw_jobs: dict[int, str] = {}   # id(job) -> the exact list entry, for LREM
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def _processing_key(self, consumer_id: str) -> str:
+        return f"{self._key}:processing:{consumer_id}"
+
+    def _heartbeat_key(self, consumer_id: str) -> str:
+        return f"{self._key}:consumer:{consumer_id}"
+
+    async def enqueue(self, job):
+        await self._redis.lpush(self._key, json.dumps(job))
+
+    async def dequeue(self, timeout):
+        raw = await self._redis.blmove(
+            self._key, self._processing_key(self._consumer_id), max(1, int(timeout)), src="RIGHT", dest="LEFT"
+        )
+        if raw is None:
+            return None
+        job = json.loads(raw)
+        self._raw_jobs[id(job)] = raw
+        return job
+
+    async def ack(self, job):
+        raw = self._raw_jobs.pop(id(job), None)
+        if raw is not None:
+            await self._redis.lrem(self._processing_key(self._consumer_id), 1, raw)
+
+    async def depth(self):
+        return await self._redis.llen(self._key)
+
+    async def start(self):
+        await self._beat()
+        self._heartbeat_task = asyncio.create_task(self._keep_alive(), name="plan-queue-heartbeat")
+        requeued = await self.requeue_stale()
+        if requeued:
+            print(f"WARN: Requeued {requeued} plan jobs left unfinished by workers that stopped.")
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        # Jobs still here were interrupted; the next worker to start picks them up
+        await self._redis.delete(self._heartbeat_key(self._consumer_id))
+
+    async def requeue_stale(self) -> int:
+        """Move the jobs of consumers without a live heartbeat back onto the queue. Returns how many."""
+        prefix = self._processing_key("")
+        requeued = 0
+        async for processing_key in self._redis.scan_iter(match=f"{prefix}*", count=100):
+            if isinstance(processing_key, bytes):
+                processing_key = processing_key.decode()
+            consumer_id = processing_key[len(prefix):]
+            if consumer_id == self._consumer_id or await self._redis.exists(self._heartbeat_key(consumer_id)):
+                continue
+            # Onto the consuming end, so they run before newer jobs. Newest first, which
+            # leaves the oldest (rightmost in the processing list too) to be taken first
+            while await self._redis.lmove(processing_key, self._key, src="LEFT", dest="RIGHT") is not None:
+                requeued += 1
+        return requeued
+
+    async def _beat(self):
+        await self._redis.set(self._heartbeat_key(self._consumer_id), "1", ex=PLAN_QUEUE_HEARTBEAT_TTL_SECONDS)
+
+    async def _keep_alive(self):
+        # Every third beat, about once a heartbeat TTL, also take back the jobs of consumers
+        # that have gone quiet since, rather than waiting for a worker to restart
+        beats = 0
+        while True:
+            await asyncio.sleep(PLAN_QUEUE_HEARTBEAT_TTL_SECONDS / 3)
+            beats += 1
+            try:
+                await self._beat()
+                if beats % 3 == 0:
+                    requeued = await self.requeue_stale()
+                    if requeued:
+                        print(f"WARN: Requeued {requeued} plan jobs left unfinished by workers that stopped.")
+            except Exception as e:
+                print(f"WARN: Plan queue heartbeat failed: {e}")
+
+
+def create_job_queue(backend: str = PLAN_QUEUE_BACKEND, key: str = "plan-jobs") -> JobQueue:
+    if backend == "redis":
+        redis_client = get_redis()
+        if redis_client is not None:
+            return RedisJobQueue(redis_client, key)
+        print("WARN: PLAN_QUEUE_BACKEND=redis but no Redis is configured. Using the in-process plan queue.")
+    return MemoryJobQueue()
+
+
+plan_queue = create_job_queue()
+# Batches wait in their own queue, taken by their own worker loops, so a batch running
+# for hours never keeps single plans from being dequeued
+plan_batch_queue = create_job_queue(key="plan-batch-jobs")
@@ -1,87 +1,137 @@
 import os
 import time
-from upstash_redis import Redis # SDK for Upstash REST API
-from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+from upstash_redis.asyncio import Redis as UpstashRedis  # Async SDK for the Upstash REST API
+from app.services.redis_client import get_redis
+from app.services.ttl_cache import TTLCache
 
 RATE_LIMIT_MAX = int(os.getenv("RATE_LIMIT_MAX", 100))
 RATE_WINDOW    = int(os.getenv("RATE_WINDOW_SECONDS", 60 * 60))   # 1 hour in seconds
+RATE_LIMIT_LOCAL_MAX_KEYS     = int(os.getenv("RATE_LIMIT_LOCAL_MAX_KEYS", 10000))
+RATE_LIMIT_REDIS_RETRY_SECONDS = float(os.getenv("RATE_LIMIT_REDIS_RETRY_SECONDS", 10))   # how long to stay on the local bucket after a Redis error
 
-upstash_sdk_client = None
-
-# Configuration for Upstash REST API SDK
+# Configuration for the Upstash REST API, used when there is no redis:// DSN (see redis_client)
 REDIS_URL = os.getenv("REDIS_URL") # e.g., https://moved-oyster-22743.upstash.io
 REDIS_TOKEN = os.getenv("REDIS_TOKEN")
 
-if REDIS_URL and REDIS_TOKEN:
-    try:
-        upstash_sdk_client = Redis(
-            url=REDIS_URL,
-            token=REDIS_TOKEN
-        )
-        # Test connection by trying to get a non-existent key (or a known one)
-        # The SDK doesn't have a direct .ping() like redis-py for REST.
-        # A get command will verify token and URL.
-        upstash_sdk_client.get("rate_limiter_ping_test") 
-        print(f"Rate limiter connected to Upstash Redis via REST API at: {REDIS_URL}")
-    except Exception as e:
-        print(f"ERROR: Could not connect to Upstash Redis via REST API. Rate limiting may not work. Error: {e}")
-        upstash_sdk_client = None
-else:
-    print("WARN: REDIS_URL or REDIS_TOKEN not set. Upstash SDK client not configured.")
-    # Note: This version does not have a fallback to local Redis, as it's specifically for the Upstash SDK.
-    # If you need local fallback, you'd re-introduce the redis-py client logic here or handle it upstream.
-
-if not upstash_sdk_client:
-    print("WARN: Upstash SDK client could not be configured for rate limiting. Limiter will allow all requests.")
-
-def _perform_upstash_sdk_check(key_name: str):
-    # This is a synchronous function using the Upstash SDK that will run in a thread pool
-    global upstash_sdk_client
-    if not upstash_sdk_client:
-        raise ConnectionError("Upstash SDK client not initialized for _perform_upstash_sdk_check")
-
-    # Upstash SDK pipeline for atomicity (if supported well for these commands, equivalent to MULTI/EXEC)
-    # Note: The Upstash SDK's pipeline might behave differently than redis-py's. 
-    # Check its documentation for atomicity guarantees for incr/expire combo.
-    # For simplicity, let's do sequential calls; for strict atomicity, Upstash Lua might be needed via REST or a different approach.
-    
-    current_count = upstash_sdk_client.incr(key_name)
-    if current_count == 1:
-        # Set expiry only if the key is new (count is 1)
-        upstash_sdk_client.expire(key_name, RATE_WINDOW)
-    
-    ttl = upstash_sdk_client.ttl(key_name)
-
-    if ttl is None or ttl < 0: # ttl can be None if key doesn't exist or -1 for no expiry, -2 for no key
-        # If key has no expiry (e.g., if incr happened but expire failed, or if key existed without TTL)
-        # or if key somehow doesn't exist after incr (unlikely but defensive)
-        # Ensure an expiry is set. This might re-set it if it already exists.
-        upstash_sdk_client.expire(key_name, RATE_WINDOW)
-        ttl = RATE_WINDOW # Assume it's set to the full window now
-        
-    return current_count, ttl
+KEY_PREFIX = "rate_bucket"
+
+# Token bucket: RATE_LIMIT_MAX tokens, refilled continuously at RATE_LIMIT_MAX per RATE_WINDOW.
+# Read, refill, take and write happen in one script, so concurrent checks can't both spend the last token.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill_per_second = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_per_second)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ttl)
+return {allowed, tostring(tokens)}
+"""
+
+
+class LocalTokenBucket:
+    """
+    In-process token bucket with the same semantics as TOKEN_BUCKET_LUA.
+
+    Used when no Redis is configured or while it is unreachable. Limits are then
+    enforced per process rather than across all API instances.
+    """
+
+    def __init__(self, capacity: int = RATE_LIMIT_MAX, window_seconds: float = RATE_WINDOW, max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS):
+        self.capacity = capacity
+        self.refill_per_second = capacity / window_seconds
+        # An untouched bucket is full again after one window, so it can be forgotten
+        self._buckets = TTLCache(max_keys, window_seconds)
+
+    def take(self, identifier: str, now: float) -> tuple[bool, float]:
+        """Spend one token if there is one. Returns (allowed, tokens left)."""
+        tokens, ts = self._buckets.get(identifier, (self.capacity, now))
+        tokens = min(self.capacity, tokens + max(0.0, now - ts) * self.refill_per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets.set(identifier, (tokens, now))
+        return allowed, tokens
+
+
+local_bucket = LocalTokenBucket()
+
+_upstash_client: Optional[UpstashRedis] = None
+_redis_script = None
+_redis_script_client = None
+_remote_disabled_until = 0.0
+
+
+async def _take_remote(key: str, now: float) -> Optional[tuple[bool, float]]:
+    """Run the bucket script on the shared Redis in one round trip. None when no Redis is configured."""
+    global _upstash_client, _redis_script, _redis_script_client
+    args = [RATE_LIMIT_MAX, RATE_LIMIT_MAX / RATE_WINDOW, now, RATE_WINDOW]
+
+    redis_client = get_redis()
+    if redis_client is not None:
+        if _redis_script is None or _redis_script_client is not redis_client:
+            # Runs by EVALSHA and loads the script on a NOSCRIPT reply
+            _redis_script = redis_client.register_script(TOKEN_BUCKET_LUA)
+            _redis_script_client = redis_client
+        allowed, tokens = await _redis_script(keys=[key], args=args)
+    elif REDIS_URL and REDIS_TOKEN and REDIS_URL.startswith("https://"):
+        if _upstash_client is None:
+            _upstash_client = UpstashRedis(url=REDIS_URL, token=REDIS_TOKEN)
+        allowed, tokens = await _upstash_client.eval(TOKEN_BUCKET_LUA, keys=[key], args=args)
+    else:
+        return None
+
+    if isinstance(tokens, bytes):
+        tokens = tokens.decode()
+    return int(allowed) == 1, float(tokens)
+
+def _result(allowed: bool, tokens: float, now: float) -> dict:
+    missing = RATE_LIMIT_MAX - tokens
+    refill_per_second = RATE_LIMIT_MAX / RATE_WINDOW
+    return {
+        "allowed": allowed,
+        "reset_at": now + missing / refill_per_second,   # when the bucket is full again
+        "retry_after": 0 if allowed else (1 - tokens) / refill_per_second,
+        "current": round(missing),
+        "limit": RATE_LIMIT_MAX,
+    }
 
 async def check(identifier: str):
-    if not upstash_sdk_client:
-        print(f"WARN: Upstash SDK client not available. Rate check for {identifier} allowed by default.")
-        return {"allowed": True, "reset_at": time.time() + RATE_WINDOW, "current": 0, "limit": RATE_LIMIT_MAX}
-
-    key = f"rate_limit:{identifier}"
-    current_time = time.time()
-
-    try:
-        # Run the synchronous Upstash SDK operations in a separate thread
-        current_count, ttl = await run_in_threadpool(_perform_upstash_sdk_check, key_name=key)
-        
-        is_allowed = current_count <= RATE_LIMIT_MAX
-        reset_at = current_time + ttl
-
-        return {
-            "allowed": is_allowed,
-            "reset_at": reset_at,
-            "current": current_count,
-            "limit": RATE_LIMIT_MAX,
-        }
-    except Exception as e:
-        print(f"ERROR: Upstash SDK operation failed for rate limiting identifier {identifier}. Allowing request. Error: {e}")
-        return {"allowed": True, "reset_at": current_time + RATE_WINDOW, "current": "unknown", "limit": RATE_LIMIT_MAX}
+    """
+    Take one request from `identifier`'s allowance.
+
+    Returns:
+        Dict with allowed, reset_at (epoch seconds when the full allowance is back),
+        retry_after (seconds until the next request would be allowed), current
+        (requests counted against the allowance) and limit.
+    """
+    global _remote_disabled_until
+    now = time.time()
+
+    if now >= _remote_disabled_until:
+        try:
+            remote = await _take_remote(f"{KEY_PREFIX}:{identifier}", now)
+            if remote is not None:
+                return _result(remote[0], remote[1], now)
+        except Exception as e:
+            print(f"WARN: Redis rate limit check failed, using the in-process limiter for {RATE_LIMIT_REDIS_RETRY_SECONDS}s: {e}")
+            _remote_disabled_until = now + RATE_LIMIT_REDIS_RETRY_SECONDS
+
+    allowed, tokens = local_bucket.take(identifier, now)
+    return _result(allowed, tokens, now)
@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+from typing import Any, Awaitable, Callable, Optional
+from pydantic import BaseModel
+from app.services.ttl_cache import TieredCache
+from app.services.metrics import llm_cache_requests
+
+LLM_CACHE_ENABLED     = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 24 * 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 512))
+LLM_CACHE_USE_REDIS   = os.getenv("LLM_CACHE_USE_REDIS", "true").lower() == "true"
+
+llm_cache = TieredCache("llm", LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, use_redis=LLM_CACHE_USE_REDIS)
+
+
+def llm_cache_key(model: str, messages: list, schema: Optional[type[BaseModel]] = None, **params) -> str:
+    """
+    Hash of everything that determines a model response.
+
+    Args:
+        model: Model name
+        messages: The exact messages / input items sent to the model
+        schema: Pydantic model for structured output, if any. Its JSON schema is hashed,
+            so changing a field invalidates earlier entries.
+        **params: Other generation parameters (temperature, max_tokens, ...)
+    """
+    payload = {
+        "model": model,
+        "messages": messages,
+        "schema": schema.model_json_schema() if schema is not None else None,
+        "params": params,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def prompt_cache_key(prefix: str, stable_prompt: str) -> str:
+    """Routing hint for the provider's prompt cache: requests sharing a prefix get the same key."""
+    return f"{prefix}-{hashlib.sha256(stable_prompt.encode()).hexdigest()[:16]}"
+
+async def memoized(key: str, compute: Callable[[], Awaitable[Any]],
+                   schema: Optional[type[BaseModel]] = None, use_cache: bool = True) -> Any:
+    """
+    Return the cached result for `key`, or await `compute()` and cache what it returns.
+
+    Args:
+        key: From llm_cache_key
+        compute: Makes the model call
+        schema: When set, results are stored with model_dump() and rebuilt with model_validate()
+        use_cache: False skips the cache entirely for this call
+
+    Returns:
+        The result of compute(), possibly from an earlier call.
+    """
+    if not (use_cache and LLM_CACHE_ENABLED):
+        return await compute()
+
+    cached = await llm_cache.get(key)
+    if cached is not None:
+        llm_cache_requests.inc(result="hit")
+        return schema.model_validate(cached) if schema is not None else cached
+    llm_cache_requests.inc(result="miss")
+
+    result = await compute()
+    if result is not None:
+        await llm_cache.set(key, result.model_dump() if schema is not None else result)
+    return result
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional
+
+LOOP_MONITOR_ENABLED         = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL_SECONDS    = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", 0.5))
+LOOP_BLOCK_THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", 0.25))
+
+logger = logging.getLogger(__name__)
+
+
+class LoopMonitor:
+    """
+    Measures event-loop lag and reports what blocked the loop.
+
+    A coroutine on the loop sleeps for `interval` seconds and records how late it
+    woke up; that overshoot is the lag every other request saw. A watchdog thread
+    checks the coroutine's heartbeat and, when the loop has been stuck for longer
+    than `block_threshold`, logs the stack of the loop thread so the offending
+    synchronous call shows up by file and line.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SECONDS, block_threshold: float = LOOP_BLOCK_THRESHOLD_SECONDS):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.samples = 0
+        self.blocked_count = 0
+        self.last_blocked_stack: Optional[str] = None
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._measure(), name="loop-lag-monitor")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def snapshot(self) -> dict:
+        return {
+            "lagSeconds": self.last_lag,
+            "maxLagSeconds": self.max_lag,
+            "meanLagSeconds": self.total_lag / self.samples if self.samples else 0.0,
+            "samples": self.samples,
+            "blockedCount": self.blocked_count,
+        }
+
+    async def _measure(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+
+            lag = max(0.0, now - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.total_lag += lag
+            self.samples += 1
+            if lag > self.block_threshold:
+                logger.warning(f"Event loop lag of {lag:.3f}s (threshold {self.block_threshold:.3f}s)")
+
+    def _watch(self):
+        reported_heartbeat = None
+        while not self._stop.wait(self.block_threshold / 2):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            if stalled_for <= self.block_threshold or heartbeat == reported_heartbeat:
+                continue
+
+            # Report each stall once, with the stack of whatever is running on the loop thread
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+            task = asyncio.current_task(self._loop) if self._loop is not None else None
+            task_name = task.get_name() if task is not None else "<no task>"
+
+            self.blocked_count += 1
+            self.last_blocked_stack = stack
+            logger.warning(
+                f"Event loop blocked for over {stalled_for:.3f}s in task {task_name}. Loop thread stack:\n{stack}"
+            )
+
+
+loop_monitor = LoopMonitor()
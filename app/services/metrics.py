@@ -0,0 +1,282 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Only the handful of metric types this service needs, so there is no client library
+to install. Each process exposes its own numbers: the API on /metrics and a
+standalone worker on PLAN_WORKER_METRICS_PORT (see serve_metrics).
+"""
+import math
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterator, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(key: LabelKey, extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+@dataclass
+class _HistogramSeries:
+    counts: list[int]
+    total:  float = 0.0
+    count:  int = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[LabelKey, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _HistogramSeries(counts=[0] * len(self.buckets))
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                series.counts[i] += 1
+                break
+        series.total += value
+        series.count += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return series.count if series else 0
+
+    def samples(self) -> Iterator[str]:
+        for key, series in self._series.items():
+            cumulative = 0
+            for upper, count in zip(self.buckets, series.counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, ('le', _format_value(upper)))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(series.total)}"
+            yield f"{self.name}_count{_format_labels(key)} {series.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Awaitable[None]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Awaitable[None]]):
+        """Register a coroutine that refreshes gauges (pool sizes, queue depth, ...) right before each scrape."""
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                print(f"WARN: Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+def counter(name: str, documentation: str) -> Counter:
+    return registry.register(Counter(name, documentation))
+
+def gauge(name: str, documentation: str) -> Gauge:
+    return registry.register(Gauge(name, documentation))
+
+def histogram(name: str, documentation: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, buckets))
+
+
+# Latency
+plan_stage_seconds     = histogram("planform_plan_stage_seconds", "Time spent in each plan pipeline stage.")
+screenshot_seconds     = histogram("planform_screenshot_seconds", "Time to take and encode a website screenshot.")
+crawl_page_seconds     = histogram("planform_crawl_page_seconds", "Time to fetch and extract one crawled page, by mode (http or browser).")
+openai_request_seconds = histogram("planform_openai_request_seconds", "Duration of OpenAI API calls, by call and model.")
+db_query_seconds       = histogram("planform_db_query_seconds", "Database statement duration, by operation (read or write).")
+rate_limit_seconds     = histogram("planform_rate_limit_check_seconds", "Duration of rate limiter checks.")
+
+# Volume
+plans_total             = counter("planform_plans_total", "Plans finished, by status.")
+openai_tokens_total     = counter("planform_openai_tokens_total", "OpenAI tokens used, by call, model and kind (input, cached_input, output).")
+agency_tokens_total     = counter("planform_agency_openai_tokens_total", "OpenAI tokens used for each agency's plans, by kind.")
+llm_cache_requests      = counter("planform_llm_cache_requests_total", "LLM response cache lookups, by result (hit or miss).")
+
+# Current state, refreshed by collectors at scrape time
+plans_in_flight         = gauge("planform_plans_in_flight", "Plan pipelines currently running in this process.")
+db_pool_checked_out     = gauge("planform_db_pool_checked_out", "Database connections currently checked out of the pool.")
+browser_open_pages      = gauge("planform_browser_open_pages", "Browser pages currently open in this process.")
+browser_active_contexts = gauge("planform_browser_active_contexts", "Browser contexts currently handed out by the pool.")
+task_store_size         = gauge("planform_task_store_size", "Tasks held in the task store.")
+plan_queue_depth        = gauge("planform_plan_queue_depth", "Plan jobs waiting in the queue.")
+plan_batch_queue_depth  = gauge("planform_plan_batch_queue_depth", "Batch jobs waiting in the batch queue.")
+event_loop_lag_seconds  = gauge("planform_event_loop_lag_seconds", "Most recent event loop scheduling lag.")
+
+
+@dataclass
+class LLMUsage:
+    """Token totals for one plan, filled in by every OpenAI call made while it is tracked."""
+    input_tokens:        int = 0
+    cached_input_tokens: int = 0
+    output_tokens:       int = 0
+
+_current_usage: ContextVar[Optional[LLMUsage]] = ContextVar("llm_usage", default=None)
+
+def track_llm_usage() -> LLMUsage:
+    """
+    Start collecting token usage for the current task. Tasks created after this call
+    inherit the same LLMUsage, so concurrent stages add up into one total.
+    """
+    usage = LLMUsage()
+    _current_usage.set(usage)
+    return usage
+
+def record_openai_usage(call: str, model: str, usage):
+    """Count the tokens from an OpenAI response's `usage` (Responses or Chat Completions shape)."""
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", 0) or 0
+    output_tokens = getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+    openai_tokens_total.inc(input_tokens, call=call, model=model, kind="input")
+    openai_tokens_total.inc(cached_tokens, call=call, model=model, kind="cached_input")
+    openai_tokens_total.inc(output_tokens, call=call, model=model, kind="output")
+
+    tracked = _current_usage.get()
+    if tracked is not None:
+        tracked.input_tokens += input_tokens
+        tracked.cached_input_tokens += cached_tokens
+        tracked.output_tokens += output_tokens
+
+def record_agency_usage(agency_id, usage: LLMUsage):
+    agency_tokens_total.inc(usage.input_tokens, agency=agency_id, kind="input")
+    agency_tokens_total.inc(usage.cached_input_tokens, agency=agency_id, kind="cached_input")
+    agency_tokens_total.inc(usage.output_tokens, agency=agency_id, kind="output")
+
+
+def instrument_engine(engine):
+    """Time every statement run through a SQLAlchemy engine (async engines are instrumented via sync_engine)."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        is_write = context is not None and (context.isinsert or context.isupdate or context.isdelete)
+        operation = "write" if is_write else "read"
+        db_query_seconds.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+async def serve_metrics(port: int, host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """Minimal HTTP server answering every request with the metrics page, for processes without an API."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Read the request line and headers; the path is ignored
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            body = (await registry.render()).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                + f"Content-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except Exception as e:
+            print(f"WARN: Failed to serve metrics: {e}")
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
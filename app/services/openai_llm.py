@@ -1,16 +1,37 @@
-import os, json
-from openai import AsyncOpenAI
+import os, json, time
+from typing import Optional, Callable, Awaitable
 from app.schemas import WebsiteAnalysis, AIResponse
+from app.services.partial_json import parse_partial_json
+from app.services.text_processing import condense_pages
+from app.services.llm_cache import llm_cache_key, prompt_cache_key, memoized
+from app.services.metrics import openai_request_seconds, record_openai_usage
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+STREAM_PARTIAL_INTERVAL_SECONDS = float(os.getenv("STREAM_PARTIAL_INTERVAL_SECONDS", 0.1))
 
-async def extract_company_insights(crawled_content: dict[str, str], client_answers: dict) -> str:
+_client = None
+
+def get_openai_client():
+    """The shared OpenAI client. The SDK is imported and the client built on first use, not at import."""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+async def close_openai_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+async def extract_company_insights(crawled_content: dict[str, str], client_answers: dict, use_cache: bool = True) -> str:
     """
     Extract key company insights from crawled website content to personalize recommendations.
     
     Args:
         crawled_content: Dictionary mapping URLs to their text content
         client_answers: Client's questionnaire responses for context
+        use_cache: Set to False to bypass the LLM response cache
     
     Returns:
         String containing key insights about the company
@@ -18,9 +39,10 @@ async def extract_company_insights(crawled_content: dict[str, str], client_answe
     if not crawled_content:
         return "No additional company information available from website crawl."
     
-    # Prepare content summary for AI analysis
+    # Prepare content summary for AI analysis: boilerplate and text repeated across
+    # pages removed, then the most informative blocks up to INSIGHTS_TOKEN_BUDGET
     content_summary = ""
-    for url, content in crawled_content.items():
+    for url, content in condense_pages(crawled_content).items():
         page_type = "Main Page"
         url_lower = url.lower()
         if "about" in url_lower:
@@ -34,15 +56,11 @@ async def extract_company_insights(crawled_content: dict[str, str], client_answe
         elif "career" in url_lower:
             page_type = "Careers Page"
         
-        content_summary += f"\n--- {page_type} ({url}) ---\n{content[:1000]}...\n"
+        content_summary += f"\n--- {page_type} ({url}) ---\n{content}\n"
     
-    prompt = f"""Analyze the following website content from multiple pages and extract key insights about this company that would be valuable for personalizing business recommendations.
-
-Client Context:
-{json.dumps(client_answers, indent=2)}
-
-Website Content:
-{content_summary}
+    # Instructions first and the client's data last, so the prompt prefix is identical
+    # across calls and the provider's prompt cache can reuse it
+    instructions = """Analyze the website content from multiple pages that the user provides and extract key insights about this company that would be valuable for personalizing business recommendations.
 
 Extract and summarize:
 1. Company mission, values, and unique positioning
@@ -63,26 +81,39 @@ Provide specific, actionable insights that reveal:
 Keep the response concise but highly specific - focus on insights that would help personalize service recommendations and sales messaging. Avoid generic observations.
 
 If there is a small amount of content, extract what you can but also return an insight that indicts the clients website has poor SEO, indicated by the lack of content available to the crawler.
+"""
+
+    prompt = f"""Client Context:
+{json.dumps(client_answers, indent=2)}
+
+Website Content:
+{content_summary}
 """
 
     messages = [
         {
             "role": "system", 
-            "content": "You are an expert business analyst specializing in company research and competitive intelligence. Extract specific, actionable insights from website content that reveal business opportunities and challenges."
+            "content": "You are an expert business analyst specializing in company research and competitive intelligence. Extract specific, actionable insights from website content that reveal business opportunities and challenges.\n\n" + instructions
         },
         {"role": "user", "content": prompt}
     ]
-    
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        max_tokens=800,
-        temperature=0.3
-    )
-    
-    return response.choices[0].message.content
+    model = "gpt-4o-mini"
+    params = {"max_tokens": 800, "temperature": 0.3}
 
-async def analyse_website(b64_png: str, url: str, answers: dict) -> WebsiteAnalysis:
+    async def call() -> str:
+        with openai_request_seconds.time(call="insights", model=model):
+            response = await get_openai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                extra_body={"prompt_cache_key": prompt_cache_key("insights", messages[0]["content"])},
+                **params
+            )
+        record_openai_usage("insights", model, response.usage)
+        return response.choices[0].message.content
+
+    return await memoized(llm_cache_key(model, messages, **params), call, use_cache=use_cache)
+
+async def analyse_website(b64_image: str, url: str, answers: dict, media_type: str = "image/png", use_cache: bool = True) -> WebsiteAnalysis:
     messages = [
         {
             "role": "system",
@@ -91,57 +122,64 @@ async def analyse_website(b64_png: str, url: str, answers: dict) -> WebsiteAnaly
         {
             "role": "user",
             "content": [
-                {"type": "input_text", "text": f"Analyze the first fold of this website ({url}) and provide insights on its design, user experience, and effectiveness. Focus on strengths, weaknesses, and actionable recommendations. The client has provided the following answers to a questionnaire: {json.dumps(answers, indent=2)}" },
+                {"type": "input_text", "text": f"Analyze the first fold of this website and provide insights on its design, user experience, and effectiveness. Focus on strengths, weaknesses, and actionable recommendations.\n\nWebsite: {url}\n\nThe client has provided the following answers to a questionnaire: {json.dumps(answers, indent=2)}" },
                 {
                     "type": "input_image",
-                    "image_url": f"data:image/png;base64,{b64_png}",
+                    "image_url": f"data:{media_type};base64,{b64_image}",
                     "detail": "high"
                 }
             ]
         }
     ]
-    
-    response = await client.responses.parse(
-        model="gpt-4.1-mini",
-        input=messages,
-        text_format=WebsiteAnalysis
-    )
-    return response.output_parsed
+    model = "gpt-4.1-mini"
 
-async def recommend_services(agency_desc: str, services: list,
-                             answers: dict, website: WebsiteAnalysis, company_insights: str = None) -> AIResponse:
-    
-    # Build the website analysis section
-    website_section = f"""We have analyzed the first fold of their website and provided the following feedback:
-These is was the overall impression of the website:
-{website.overallImpression}
+    async def call() -> WebsiteAnalysis:
+        with openai_request_seconds.time(call="analyse", model=model):
+            response = await get_openai_client().responses.parse(
+                model=model,
+                input=messages,
+                text_format=WebsiteAnalysis
+            )
+        record_openai_usage("analyse", model, response.usage)
+        return response.output_parsed
 
-These are the strengths of the website:
-{website.strengths}
-
-These are the weaknesses of the website:
-{website.weaknesses}
+    return await memoized(llm_cache_key(model, messages, WebsiteAnalysis), call, WebsiteAnalysis, use_cache)
 
-These are the recommendations for the website:
-{website.recommendations}"""
+async def recommend_services(agency_desc: str, services: list,
+                             answers: dict, website: WebsiteAnalysis, company_insights: str = None,
+                             on_partial: Optional[Callable[[dict], Awaitable[None]]] = None,
+                             services_json: Optional[str] = None, use_cache: bool = True) -> AIResponse:
+    """
+    Ask the model for the plan copy and service recommendations.
 
-    # Add company insights section if available
-    company_insights_section = ""
-    if company_insights and company_insights.strip():
-        company_insights_section = f"""
+    services_json is the catalog already serialised for the prompt (see agency_cache);
+    when omitted `services` is serialised here.
 
-Additionally, from our comprehensive analysis of their website content, we have extracted these key company insights:
-{company_insights}
+    When on_partial is given the response is streamed and on_partial is awaited with
+    the partially generated plan (planTitle, subTitle, executiveSummary, ...) as it
+    grows. The return value is the same fully validated AIResponse either way.
 
-Use these insights to create highly personalized recommendations that speak directly to their unique business situation, challenges, and opportunities."""
+    The agency description, catalog and copywriting instructions form the system
+    prompt, which is identical for every plan of an agency, and the client's answers
+    and analysis follow in the user message. That keeps the long shared prefix
+    eligible for the provider's prompt cache. Responses are memoized in llm_cache
+    unless use_cache is False.
+    """
 
-    prompt_text = f"""I have a client with the following responses to a questionnaire:
-{json.dumps(answers, indent=2)}
+    catalog_json = services_json or json.dumps(services, indent=2)
 
-{website_section}{company_insights_section}
+    system_prompt = f"""You are an expert business consultant that works for the agency and helps match client needs
+        to appropriate services. Provide structured, specific recommendations that are directly tied to the client's responses.
+        A brief description of the agency is: {agency_desc}. Keep this in mind and remember you work for this agency.
+        Format the output according to the service_recommendations schema. When recommending services, your reason for
+        recommending should be based on powerful sales tactices and proving value to the client.
+        The Executice summary should be a masterpiece of sales copy, delivering an exceptional level of insight and making
+        it impossible for the client to ignore the opportunity. Demonstrating exactly what they will get from our services.
+        Not selling them on features, but on the outcomes and emotions they will feel, a business they can be proud of.
+        Their competitors won't stand a chance, with this agency at their side? They are unstoppable.
 
-Based on these responses and insights, recommend the most appropriate services from this catalog:
-{json.dumps(services, indent=2)}
+The user will share a client's responses to a questionnaire and what we know about their business. Based on these responses and insights, recommend the most appropriate services from this catalog:
+{catalog_json}
 
 For each recommended service, provide a clear justification based on the client's specific needs and company characteristics.
 Your response will be shown to the client so it should be addressed to them.
@@ -163,25 +201,93 @@ Not overly focussed on the features of the services, but on the outcomes and emo
 Also keep it brief but powerful.
 """
 
-    system_prompt = f"""You are an expert business consultant that works for the agency and helps match client needs
-        to appropriate services. Provide structured, specific recommendations that are directly tied to the client's responses.
-        A brief description of the agency is: {agency_desc}. Keep this in mind and remember you work for this agency.
-        Format the output according to the service_recommendations schema. When recommending services, your reason for
-        recommending should be based on powerful sales tactices and proving value to the client.
-        The Executice summary should be a masterpiece of sales copy, delivering an exceptional level of insight and making
-        it impossible for the client to ignore the opportunity. Demonstrating exactly what they will get from our services.
-        Not selling them on features, but on the outcomes and emotions they will feel, a business they can be proud of.
-        Their competitors won't stand a chance, with this agency at their side? They are unstoppable.
-        """
+    # Build the website analysis section
+    website_section = ""
+    if website is not None:
+        website_section = f"""
+
+We have analyzed the first fold of their website and provided the following feedback:
+These is was the overall impression of the website:
+{website.overallImpression}
+
+These are the strengths of the website:
+{website.strengths}
+
+These are the weaknesses of the website:
+{website.weaknesses}
+
+These are the recommendations for the website:
+{website.recommendations}"""
+
+    # Add company insights section if available
+    company_insights_section = ""
+    if company_insights and company_insights.strip():
+        company_insights_section = f"""
+
+Additionally, from our comprehensive analysis of their website content, we have extracted these key company insights:
+{company_insights}
+
+Use these insights to create highly personalized recommendations that speak directly to their unique business situation, challenges, and opportunities."""
+
+    prompt_text = f"""I have a client with the following responses to a questionnaire:
+{json.dumps(answers, indent=2)}{website_section}{company_insights_section}
+"""
 
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt_text}
     ]
-    
-    response = await client.responses.parse(
-        model="gpt-4.1-mini",
+    model = "gpt-4.1-mini"
+    cache_hint = prompt_cache_key("recommend", system_prompt)
+
+    async def call() -> AIResponse:
+        with openai_request_seconds.time(call="recommend", model=model):
+            if on_partial is not None:
+                response = await _stream_parsed(model, messages, AIResponse, on_partial, cache_hint)
+            else:
+                response = await get_openai_client().responses.parse(
+                    model=model,
+                    input=messages,
+                    text_format=AIResponse,
+                    extra_body={"prompt_cache_key": cache_hint}
+                )
+        record_openai_usage("recommend", model, response.usage)
+        return response.output_parsed
+
+    # A cache hit skips the partial updates; listeners get the finished plan straight away
+    return await memoized(llm_cache_key(model, messages, AIResponse), call, AIResponse, use_cache)
+
+async def _stream_parsed(model: str, messages: list, text_format, on_partial: Callable[[dict], Awaitable[None]],
+                         cache_hint: Optional[str] = None):
+    """
+    Stream a structured response, reporting the partial object at most every STREAM_PARTIAL_INTERVAL_SECONDS.
+
+    Returns:
+        The final response, with output_parsed and usage as from responses.parse.
+    """
+    buffer = ""
+    last_partial = None
+    last_emit = 0.0
+
+    async with get_openai_client().responses.stream(
+        model=model,
         input=messages,
-        text_format=AIResponse
-    )
-    return response.output_parsed
+        text_format=text_format,
+        extra_body={"prompt_cache_key": cache_hint} if cache_hint else None
+    ) as stream:
+        async for event in stream:
+            if event.type != "response.output_text.delta":
+                continue
+            buffer += event.delta
+            partial = parse_partial_json(buffer)
+            if not isinstance(partial, dict) or partial == last_partial:
+                continue
+            # Always emit when a new field starts, otherwise throttle
+            now = time.monotonic()
+            new_field = last_partial is None or partial.keys() != last_partial.keys()
+            if new_field or now - last_emit >= STREAM_PARTIAL_INTERVAL_SECONDS:
+                await on_partial(partial)
+                last_partial = partial
+                last_emit = now
+
+        return await stream.get_final_response()
@@ -0,0 +1,57 @@
+import json
+from typing import Any, Optional
+
+MAX_TRUNCATION_ATTEMPTS = 4
+
+def _closing_suffix(text: str) -> Optional[str]:
+    """Characters that would close every string, object and array left open in text."""
+    stack = []
+    in_string = False
+    escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == "{":
+            stack.append("}")
+        elif ch == "[":
+            stack.append("]")
+        elif ch in "}]":
+            if not stack:
+                return None
+            stack.pop()
+
+    if escape:
+        return None  # Dangling backslash; wait for the next chunk
+    return ('"' if in_string else "") + "".join(reversed(stack))
+
+def parse_partial_json(text: str) -> Optional[Any]:
+    """
+    Best-effort parse of a JSON document that is still being generated.
+
+    Open strings, objects and arrays are closed. If the tail is a half-written key
+    or literal, it is trimmed back to the previous comma. Returns None when
+    nothing usable has arrived yet.
+    """
+    candidate = text.strip()
+    for _ in range(MAX_TRUNCATION_ATTEMPTS):
+        if not candidate:
+            return None
+        suffix = _closing_suffix(candidate)
+        if suffix is not None:
+            try:
+                return json.loads(candidate + suffix)
+            except ValueError:
+                pass
+        cut = candidate.rfind(",")
+        if cut == -1:
+            return None
+        candidate = candidate[:cut]
+    return None
@@ -0,0 +1,100 @@
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+
+@dataclass
+class Stage:
+    """
+    One named step of a pipeline.
+
+    `func` is awaited with the results of its dependencies as keyword arguments,
+    named after the dependency stages. An optional stage that fails or times out
+    yields None instead of failing the run, so its dependents still go ahead.
+    """
+    name:     str
+    func:     Callable[..., Awaitable[Any]]
+    deps:     tuple[str, ...] = ()
+    timeout:  Optional[float] = None
+    optional: bool = False
+
+
+@dataclass
+class DagResult:
+    results: dict[str, Any] = field(default_factory=dict)
+    timings: dict[str, float] = field(default_factory=dict)   # Seconds spent in each stage that ran
+    errors:  dict[str, str] = field(default_factory=dict)     # Optional stages that failed, and why
+
+
+def _check_graph(stages: list[Stage]):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Stage names must be unique")
+
+    remaining = {stage.name: set(stage.deps) for stage in stages}
+    for name, deps in remaining.items():
+        unknown = deps - remaining.keys()
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {sorted(unknown)}")
+
+    # Peel off stages whose dependencies are all resolved; anything left is a cycle
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps & remaining.keys()]
+        if not ready:
+            raise ValueError(f"Stages form a cycle: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+
+
+async def run_dag(stages: list[Stage]) -> DagResult:
+    """
+    Run the stages, starting each one as soon as all of its dependencies have finished.
+
+    Returns:
+        DagResult with each stage's return value, timings and optional-stage errors.
+
+    Raises:
+        The exception of the first required stage to fail (TimeoutError for timeouts).
+        All other stages still running are cancelled first.
+    """
+    _check_graph(stages)
+    outcome = DagResult()
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run(stage: Stage) -> Any:
+        inputs = {dep: await tasks[dep] for dep in stage.deps}
+        started = time.perf_counter()
+        try:
+            if stage.timeout is not None:
+                value = await asyncio.wait_for(stage.func(**inputs), stage.timeout)
+            else:
+                value = await stage.func(**inputs)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"Stage '{stage.name}' timed out after {stage.timeout}s")
+            if not stage.optional:
+                raise e
+            outcome.errors[stage.name] = str(e) or type(e).__name__
+            value = None
+        finally:
+            outcome.timings[stage.name] = time.perf_counter() - started
+        outcome.results[stage.name] = value
+        return value
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(run(stage), name=f"stage:{stage.name}")
+
+    try:
+        await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+        for stage in stages:
+            task = tasks[stage.name]
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    return outcome
@@ -0,0 +1,47 @@
+"""
+Agency analytics over saved plans.
+
+Both queries read the columns extracted from plan_data when a plan is saved, never
+the JSON itself: the agency's plans in the period come from the
+ix_plans_agency_id_created_at_id range, and a single service's plans from the GIN
+index on recommended_service_ids.
+"""
+from datetime import datetime
+from typing import Any
+from sqlalchemy import select, func
+from app.db import AsyncSessionLocal, Plan, Service
+
+
+def month_start(now: datetime) -> datetime:
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+async def service_recommendation_counts(agency_id: int, since: datetime, until: datetime,
+                                        session_factory=AsyncSessionLocal) -> list[dict[str, Any]]:
+    """How many of the agency's plans created in [since, until) recommended each service, most recommended first."""
+    recommended = (
+        select(func.unnest(Plan.recommended_service_ids).label("service_id"))
+        .where(Plan.agency_id == agency_id, Plan.created_at >= since, Plan.created_at < until)
+        .subquery()
+    )
+    plans = func.count().label("plans")
+    query = (
+        select(recommended.c.service_id, Service.name, plans)
+        .join(Service, Service.id == recommended.c.service_id)
+        .group_by(recommended.c.service_id, Service.name)
+        .order_by(plans.desc(), recommended.c.service_id)
+    )
+    async with session_factory() as db:
+        rows = (await db.execute(query)).all()
+    return [{"serviceId": row.service_id, "name": row.name, "plans": row.plans} for row in rows]
+
+async def count_plans_recommending(agency_id: int, service_id: int, since: datetime, until: datetime,
+                                   session_factory=AsyncSessionLocal) -> int:
+    """How many of the agency's plans created in [since, until) recommended one service."""
+    query = select(func.count()).select_from(Plan).where(
+        Plan.recommended_service_ids.contains([service_id]),
+        Plan.agency_id == agency_id,
+        Plan.created_at >= since,
+        Plan.created_at < until,
+    )
+    async with session_factory() as db:
+        return (await db.execute(query)).scalar_one()
@@ -0,0 +1,99 @@
+"""
+Lead lists for POST /plan/batch: parsing the upload and naming the tasks it creates.
+
+A batch is a JSONL or CSV of ClientResponses. Every row becomes its own task,
+`<batchId>:<row>`, so a row can be polled on /plan/status like any single plan,
+while the batch id itself holds the batch's progress counters.
+"""
+import os
+import csv
+import io
+import json
+from typing import Any, Optional
+from pydantic import ValidationError
+from app.schemas import ClientResponses
+
+PLAN_BATCH_MAX_ROWS        = int(os.getenv("PLAN_BATCH_MAX_ROWS", 1000))
+PLAN_BATCH_MAX_BYTES       = int(os.getenv("PLAN_BATCH_MAX_BYTES", 5 * 1024 * 1024))   # larger uploads get a 413 before they're read
+PLAN_BATCH_CONCURRENCY     = int(os.getenv("PLAN_BATCH_CONCURRENCY", 4))        # rows in flight per batch unless the request asks for another number
+PLAN_BATCH_MAX_CONCURRENCY = int(os.getenv("PLAN_BATCH_MAX_CONCURRENCY", 16))
+PLAN_BATCH_INSERT_SIZE     = int(os.getenv("PLAN_BATCH_INSERT_SIZE", 25))       # finished plans saved per transaction
+
+
+class BatchInputError(ValueError):
+    pass
+
+
+def row_task_id(batch_id: str, row: int) -> str:
+    return f"{batch_id}:{row}"
+
+def max_batch_rows(store_capacity: Optional[int]) -> int:
+    """
+    Largest batch the task store can track: PLAN_BATCH_MAX_ROWS, or less if the store
+    evicts beyond store_capacity statuses. A batch then takes at most half the store
+    (its rows plus its own status), so neither its rows nor the plans submitted while
+    it runs are evicted before they're read.
+    """
+    if store_capacity is None:
+        return PLAN_BATCH_MAX_ROWS
+    return max(1, min(PLAN_BATCH_MAX_ROWS, store_capacity // 2 - 1))
+
+def _csv_records(text: str) -> list[dict[str, Any]]:
+    reader = csv.DictReader(io.StringIO(text))
+    # Empty cells are missing answers, not empty strings
+    return [
+        {column.strip(): value for column, value in record.items() if column and value not in (None, "")}
+        for record in reader
+    ]
+
+def _jsonl_records(text: str) -> list[dict[str, Any]]:
+    records = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BatchInputError(f"Line {number}: invalid JSON ({e.msg}).")
+        if not isinstance(record, dict):
+            raise BatchInputError(f"Line {number}: expected a JSON object.")
+        records.append(record)
+    return records
+
+def parse_batch_rows(body: bytes, content_type: str, api_key: str, max_rows: int = PLAN_BATCH_MAX_ROWS) -> list[ClientResponses]:
+    """
+    Parse an uploaded lead list into questionnaire payloads.
+
+    Args:
+        body: The raw upload, UTF-8 JSONL (one object per line) or CSV with a header row
+        content_type: The request's Content-Type; anything mentioning "csv" is read as CSV
+        api_key: The batch's API key, filled in for rows that don't carry one
+        max_rows: Most rows accepted (see max_batch_rows)
+
+    Raises:
+        BatchInputError: If the upload is empty, too long, or any row is invalid
+    """
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BatchInputError("The batch must be UTF-8 encoded.")
+    records = _csv_records(text) if "csv" in (content_type or "").lower() else _jsonl_records(text)
+
+    if not records:
+        raise BatchInputError("The batch has no rows.")
+    if len(records) > max_rows:
+        raise BatchInputError(f"The batch has {len(records)} rows; the limit is {max_rows}.")
+
+    rows = []
+    for number, record in enumerate(records, start=1):
+        if record.get("apiKey") in (None, ""):
+            record["apiKey"] = api_key
+        elif record["apiKey"] != api_key:
+            raise BatchInputError(f"Row {number}: apiKey does not match the batch's API key.")
+        try:
+            rows.append(ClientResponses.model_validate(record))
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            raise BatchInputError(f"Row {number}: {field}: {error['msg']}.")
+    return rows
@@ -0,0 +1,79 @@
+"""
+Reading saved plans back: newest-first listings per agency or client, and single plans.
+
+Listings page with a keyset cursor on (created_at, id) rather than OFFSET, so each
+page is an index range scan on ix_plans_agency_id_created_at_id (or the client
+index) however deep the agency's history goes. They select only the columns
+shown in a list; plan_data is read by get_plan alone.
+"""
+import base64
+from datetime import datetime
+from typing import Any, Optional
+from sqlalchemy import select, tuple_
+from app.db import AsyncSessionLocal, Client, Plan
+
+PLAN_HISTORY_PAGE_SIZE     = 20
+PLAN_HISTORY_MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, plan_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{plan_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, plan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(plan_id)
+    except ValueError as e:
+        raise InvalidCursor("Invalid cursor.") from e
+
+async def list_plans(agency_id: int, client_id: Optional[int] = None, limit: int = PLAN_HISTORY_PAGE_SIZE,
+                     cursor: Optional[str] = None, session_factory=AsyncSessionLocal) -> tuple[list[dict[str, Any]], Optional[str]]:
+    """
+    One page of an agency's plans, newest first, optionally for a single client.
+
+    Returns:
+        The page's plan summaries and the cursor for the next page (None on the last page).
+
+    Raises:
+        InvalidCursor: If cursor wasn't produced by a previous call
+    """
+    query = (
+        select(Plan.id, Plan.client_id, Plan.created_at, Plan.plan_title, Client.name, Client.email)
+        .outerjoin(Client, Client.id == Plan.client_id)
+        .where(Plan.agency_id == agency_id)
+        .order_by(Plan.created_at.desc(), Plan.id.desc())
+        .limit(limit + 1)   # One extra row says whether there is a next page
+    )
+    if client_id is not None:
+        query = query.where(Plan.client_id == client_id)
+    if cursor:
+        query = query.where(tuple_(Plan.created_at, Plan.id) < decode_cursor(cursor))
+
+    async with session_factory() as db:
+        rows = (await db.execute(query)).all()
+
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    plans = [
+        {
+            "planId": row.id, "planTitle": row.plan_title, "clientId": row.client_id,
+            "clientName": row.name, "clientEmail": row.email, "createdAt": row.created_at,
+        }
+        for row in rows[:limit]
+    ]
+    return plans, next_cursor
+
+async def get_plan(agency_id: int, plan_id: int, session_factory=AsyncSessionLocal) -> Optional[dict[str, Any]]:
+    """A plan with its full plan_data, or None if the agency has no such plan."""
+    async with session_factory() as db:
+        result = await db.execute(
+            select(Plan.id, Plan.client_id, Plan.created_at, Plan.plan_data)
+            .where(Plan.id == plan_id, Plan.agency_id == agency_id)
+        )
+        row = result.first()
+    if row is None:
+        return None
+    return {"planId": row.id, "clientId": row.client_id, "createdAt": row.created_at, "planData": row.plan_data}
@@ -0,0 +1,26 @@
+import os
+from typing import Optional
+import redis.asyncio as redis
+
+# redis-py needs a redis:// or rediss:// URL. REDIS_URL may instead point at the
+# Upstash REST endpoint used by the limiter, in which case set REDIS_DSN explicitly.
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_DSN = os.getenv("REDIS_DSN") or (
+    REDIS_URL if REDIS_URL and REDIS_URL.startswith(("redis://", "rediss://")) else None
+)
+
+_client: Optional[redis.Redis] = None
+
+def get_redis() -> Optional[redis.Redis]:
+    """Return the shared async Redis client, or None when no Redis is configured."""
+    global _client
+    if _client is None and REDIS_DSN:
+        # Creating the client does not connect; the first command does
+        _client = redis.Redis.from_url(REDIS_DSN, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
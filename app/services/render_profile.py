@@ -0,0 +1,69 @@
+import os
+from dataclasses import dataclass
+from typing import Union
+from urllib.parse import urlparse
+from playwright.async_api import BrowserContext, Page, Route
+
+def _env_list(name: str, default: str) -> tuple[str, ...]:
+    return tuple(item.strip().lower() for item in os.getenv(name, default).split(",") if item.strip())
+
+LEAN_RENDER_ENABLED     = os.getenv("LEAN_RENDER_ENABLED", "true").lower() == "true"
+LEAN_RENDER_BLOCK_TYPES = _env_list("LEAN_RENDER_BLOCK_TYPES", "image,media,font,texttrack,eventsource,websocket,manifest")
+
+# Analytics, ads and chat widgets: never needed for innerText and often the slowest requests on a page
+DEFAULT_TRACKER_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "googleadservices.com", "googlesyndication.com",
+    "doubleclick.net", "facebook.net", "facebook.com", "connect.facebook.net", "hotjar.com",
+    "clarity.ms", "segment.com", "segment.io", "mixpanel.com", "amplitude.com", "fullstory.com",
+    "hs-analytics.net", "hs-scripts.com", "hsforms.net", "licdn.com", "ads-twitter.com",
+    "analytics.tiktok.com", "intercom.io", "intercomcdn.com", "crisp.chat", "drift.com",
+    "tawk.to", "zdassets.com", "newrelic.com", "nr-data.net", "sentry.io", "youtube.com",
+    "vimeo.com", "cookielaw.org", "onetrust.com", "cookiebot.com",
+)
+LEAN_RENDER_BLOCK_HOSTS = DEFAULT_TRACKER_HOSTS + _env_list("LEAN_RENDER_EXTRA_BLOCK_HOSTS", "")
+
+# Large downloads that can slip past the resource type check (e.g. fetched by scripts)
+LEAN_RENDER_BLOCK_EXTENSIONS = _env_list(
+    "LEAN_RENDER_BLOCK_EXTENSIONS",
+    ".mp4,.webm,.mov,.avi,.mp3,.wav,.ogg,.zip,.gz,.rar,.7z,.pdf,.dmg,.exe,.iso,.psd,.tif,.tiff",
+)
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """Request-interception rules for loading a page only to read its text and links."""
+    blocked_resource_types: tuple[str, ...]
+    blocked_hosts:          tuple[str, ...]
+    blocked_extensions:     tuple[str, ...]
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.blocked_resource_types:
+            return True
+        parsed = urlparse(url)
+        host = (parsed.hostname or "").lower()
+        if any(host == blocked or host.endswith("." + blocked) for blocked in self.blocked_hosts):
+            return True
+        return parsed.path.lower().endswith(self.blocked_extensions)
+
+    async def apply(self, target: Union[BrowserContext, Page]):
+        """Install the rules on a context or a single page."""
+        async def handle(route: Route):
+            request = route.request
+            if self.should_block(request.resource_type, request.url):
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await target.route("**/*", handle)
+
+
+LEAN_RENDER_PROFILE = RenderProfile(
+    blocked_resource_types=LEAN_RENDER_BLOCK_TYPES,
+    blocked_hosts=LEAN_RENDER_BLOCK_HOSTS,
+    blocked_extensions=LEAN_RENDER_BLOCK_EXTENSIONS,
+)
+
+async def apply_lean_render(target: Union[BrowserContext, Page]):
+    """Apply the lean crawl profile unless it has been switched off with LEAN_RENDER_ENABLED=false."""
+    if LEAN_RENDER_ENABLED:
+        await LEAN_RENDER_PROFILE.apply(target)
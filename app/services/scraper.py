@@ -1,191 +1,339 @@
-import base64, uuid, tempfile
+import time
+import base64
 import asyncio
+from dataclasses import dataclass, field
+from typing import Optional
 from urllib.parse import urljoin, urlparse
-from playwright.async_api import async_playwright
-import time
+from playwright.async_api import BrowserContext, Page
+from app.services.browser_pool import browser_pool
+from app.services.crawl_cache import get_cached_crawl, cache_crawl
+from app.services.http_crawler import CRAWL_MODE, fetch_page, needs_browser
+from app.services.render_profile import apply_lean_render
+from app.services.metrics import screenshot_seconds, crawl_page_seconds
+from app.services.blob_store import screenshot_store, encode_screenshot, MEDIA_TYPES, SCREENSHOT_FORMAT, SCREENSHOT_QUALITY
+
+# Priority keywords for important pages (ordered by importance)
+PRIORITY_KEYWORDS = [
+    'about', 'team', 'company', 'who-we-are', 'our-story',
+    'services', 'products', 'solutions', 'what-we-do',
+    'contact', 'careers', 'mission', 'vision', 'values'
+]
+
+# Blacklist keywords for pages to avoid (SEO content, generic pages)
+BLACKLIST_KEYWORDS = [
+    'blog', 'news', 'insights', 'articles', 'post', 'posts',
+    'press-release', 'media', 'resources', 'download', 'downloads',
+    'privacy', 'terms', 'legal', 'cookie', 'gdpr',
+    'sitemap', 'search', 'tag', 'category', 'archive',
+    'feed', 'rss', 'api', 'login', 'register', 'signup',
+    'pricing', 'plans', 'billing', 'support', 'help', 'faq'
+]
+
+CRAWL_CONTEXT_OPTIONS = {
+    "viewport": {"width": 1366, "height": 768},
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+}
+
+HIDE_COOKIE_BANNERS_CSS = '[class*="cookie"],[id*="cookie"]{display:none!important}'
+
+HIDE_PAGE_CHROME_CSS = '''
+    [class*="cookie"],[id*="cookie"],
+    [class*="banner"],[id*="banner"],
+    .cookie-banner, .cookie-notice,
+    header, nav, footer, .sidebar
+    {display:none!important}
+'''
+
+# Extract text content and links simultaneously
+EXTRACT_PAGE_JS = '''() => {
+    // Remove unwanted elements
+    const unwanted = document.querySelectorAll('script, style, noscript, header, nav, footer, .sidebar');
+    unwanted.forEach(el => el.remove());
+
+    // Get clean text content
+    const textContent = document.body ? document.body.innerText.trim() : '';
+
+    // Extract all internal links
+    const links = Array.from(document.querySelectorAll('a[href]'))
+        .map(link => {
+            try {
+                const href = link.href;
+                if (href && href.startsWith('http')) {
+                    return href;
+                }
+            } catch (e) {}
+            return null;
+        })
+        .filter(href => href !== null);
+
+    return { content: textContent, links: links };
+}'''
+
+EXTRACT_TEXT_JS = '''() => {
+    const unwanted = document.querySelectorAll('script, style, noscript, header, nav, footer, .sidebar');
+    unwanted.forEach(el => el.remove());
+    return document.body ? document.body.innerText.trim() : '';
+}'''
+
+
+@dataclass
+class WebsiteCapture:
+    """Result of loading a site once: the first-fold screenshot plus the crawled page text."""
+    screenshot_b64:        str
+    screenshot_media_type: str
+    screenshot_id:         str  # Blob id in the screenshot store, served at /screenshots/{id}
+    pages:                 dict[str, str] = field(default_factory=dict)
+
+
+async def _take_screenshot(page: Page) -> tuple[bytes, str]:
+    """First-fold screenshot in the configured delivery format, as (bytes, extension)."""
+    with screenshot_seconds.time():
+        if SCREENSHOT_FORMAT == "jpeg":
+            return await page.screenshot(type="jpeg", quality=SCREENSHOT_QUALITY), "jpg"
+        png = await page.screenshot(type="png")
+        return await asyncio.to_thread(encode_screenshot, png)
+
+async def _store_screenshot(img: bytes, extension: str) -> tuple[str, str]:
+    b64     = base64.b64encode(img).decode()
+    blob_id = await screenshot_store.put(img, extension)
+    return b64, blob_id
 
 async def screenshot(url: str) -> tuple[str, str]:
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True, args=["--no-sandbox"])
-        page    = await browser.new_page(viewport={"width":1366,"height":768})
+    async with browser_pool.context(viewport={"width":1366,"height":768}) as context:
+        page    = await context.new_page()
         await page.goto(url, wait_until="domcontentloaded")
         # nuke typical cookie banners
-        time.sleep(1)
-        await page.add_style_tag(content='[class*="cookie"],[id*="cookie"]{display:none!important}')
-        img = await page.screenshot(type="png")
-        await browser.close()
-    b64     = base64.b64encode(img).decode()
-    file_id = f"{uuid.uuid4()}.png"
-    path    = tempfile.gettempdir() + "/" + file_id
-    with open(path, "wb") as f: f.write(img)
-    return b64, path
+        await asyncio.sleep(1)
+        await page.add_style_tag(content=HIDE_COOKIE_BANNERS_CSS)
+        img, extension = await _take_screenshot(page)
+    b64, blob_id = await _store_screenshot(img, extension)
+    return b64, await screenshot_store.path_for(blob_id)
 
-async def crawl_website(url: str, max_pages: int = 8) -> dict[str, str]:
+async def capture_website(url: str, max_pages: int = 8, refresh: bool = False) -> WebsiteCapture:
+    """
+    Load the landing page once, take the first-fold screenshot from that load and
+    crawl the rest of the site from the links found on it.
+
+    Args:
+        url: The main URL to start crawling from
+        max_pages: Maximum number of pages to crawl (including main page)
+        refresh: Ignore any cached capture of this URL and load the site again
+
+    Returns:
+        WebsiteCapture with the stored screenshot and a mapping of URLs to their text content
+
+    Raises:
+        Whatever the main page navigation raised, since there is no screenshot without it
+    """
+    if not refresh:
+        cached = await get_cached_crawl(url, max_pages)
+        if cached and cached.get("screenshot_b64") and cached.get("screenshot_extension"):
+            # Re-storing is a no-op when this worker already has the blob
+            img = base64.b64decode(cached["screenshot_b64"])
+            _, blob_id = await _store_screenshot(img, cached["screenshot_extension"])
+            return WebsiteCapture(
+                screenshot_b64=cached["screenshot_b64"],
+                screenshot_media_type=MEDIA_TYPES[cached["screenshot_extension"]],
+                screenshot_id=blob_id,
+                pages=cached["pages"],
+            )
+
+    async with browser_pool.context(**CRAWL_CONTEXT_OPTIONS) as context:
+        page = await context.new_page()
+        try:
+            await page.goto(url, wait_until="domcontentloaded")
+            # nuke typical cookie banners before the first-fold shot
+            await asyncio.sleep(1)
+            await page.add_style_tag(content=HIDE_COOKIE_BANNERS_CSS)
+            img, extension = await _take_screenshot(page)
+            b64, blob_id = await _store_screenshot(img, extension)
+
+            page_contents, links = await _extract_main_page(page, url)
+        finally:
+            await page.close()
+
+        page_contents.update(await _crawl_links(_select_links(url, links, max_pages), context))
+
+    await cache_crawl(url, max_pages, page_contents, b64, extension)
+    return WebsiteCapture(
+        screenshot_b64=b64,
+        screenshot_media_type=MEDIA_TYPES[extension],
+        screenshot_id=blob_id,
+        pages=page_contents,
+    )
+
+async def crawl_website(url: str, max_pages: int = 8, refresh: bool = False) -> dict[str, str]:
     """
     Crawl a website to depth 1 and extract text content from pages.
     Prioritizes important pages like about, blog, team, etc.
-    
+
     Args:
         url: The main URL to start crawling from
         max_pages: Maximum number of pages to crawl (including main page)
-    
+        refresh: Ignore any cached crawl of this URL and load the site again
+
     Returns:
         Dictionary mapping URLs to their text content
     """
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True, 
-            args=["--no-sandbox", "--disable-dev-shm-usage", "--disable-web-security"]
-        )
-        context = await browser.new_context(
-            viewport={"width": 1366, "height": 768},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        )
-        
-        # Extract domain from URL for filtering
+    if not refresh:
+        cached = await get_cached_crawl(url, max_pages)
+        if cached:
+            return cached["pages"]
+
+    # Bail out early on URLs we can't parse
+    try:
+        urlparse(url)
+    except ValueError:
+        return {url: "Error: Invalid URL"}
+
+    # Server-rendered homepages don't need a browser at all
+    page_contents, links = None, []
+    if CRAWL_MODE == "http":
+        fetched = await fetch_page(url)
+        if not needs_browser(fetched) and fetched.is_html:
+            page_contents = {url: fetched.text[:5000]}  # Limit content length
+            links = fetched.links
+
+    if page_contents is None:
+        async with browser_pool.context(**CRAWL_CONTEXT_OPTIONS) as context:
+            # Process main page first
+            page = await context.new_page()
+            try:
+                await apply_lean_render(page)
+                await page.goto(url, wait_until="domcontentloaded", timeout=8000)
+                page_contents, links = await _extract_main_page(page, url)
+            except Exception as e:
+                print(f"Error processing main page {url}: {e}")
+                links = []
+                page_contents = {url: f"Error accessing main page: {str(e)}"}
+            finally:
+                await page.close()
+
+    page_contents.update(await _crawl_links(_select_links(url, links, max_pages)))
+
+    await cache_crawl(url, max_pages, page_contents)
+    return page_contents
+
+async def _extract_main_page(page: Page, url: str) -> tuple[dict[str, str], list[str]]:
+    """Pull the text and outgoing links out of an already loaded main page."""
+    page_contents = {}
+    try:
+        await page.add_style_tag(content=HIDE_PAGE_CHROME_CSS)
+        page_data = await page.evaluate(EXTRACT_PAGE_JS)
+
+        if page_data['content']:
+            page_contents[url] = page_data['content'][:5000]  # Limit content length
+
+        links = page_data['links'] or []
+
+    except Exception as e:
+        print(f"Error processing main page {url}: {e}")
+        links = []
+        page_contents[url] = f"Error accessing main page: {str(e)}"
+
+    return page_contents, links
+
+def _select_links(url: str, links: list[str], max_pages: int) -> list[str]:
+    """Filter links to the same domain, drop blacklisted ones and order the rest by priority."""
+    try:
+        base_domain = urlparse(url).netloc.lower()
+    except:
+        return []
+
+    same_domain_links = []
+    for link in links:
         try:
-            base_domain = urlparse(url).netloc.lower()
+            link_domain = urlparse(link).netloc.lower()
+            if link_domain == base_domain and link != url:
+                # Check if link contains blacklisted keywords
+                link_lower = link.lower()
+                is_blacklisted = any(keyword in link_lower for keyword in BLACKLIST_KEYWORDS)
+                if not is_blacklisted:
+                    same_domain_links.append(link)
         except:
-            await browser.close()
-            return {url: "Error: Invalid URL"}
-        
-        # Priority keywords for important pages (ordered by importance)
-        priority_keywords = [
-            'about', 'team', 'company', 'who-we-are', 'our-story',
-            'services', 'products', 'solutions', 'what-we-do',
-            'contact', 'careers', 'mission', 'vision', 'values'
-        ]
-        
-        # Blacklist keywords for pages to avoid (SEO content, generic pages)
-        blacklist_keywords = [
-            'blog', 'news', 'insights', 'articles', 'post', 'posts',
-            'press-release', 'media', 'resources', 'download', 'downloads',
-            'privacy', 'terms', 'legal', 'cookie', 'gdpr',
-            'sitemap', 'search', 'tag', 'category', 'archive',
-            'feed', 'rss', 'api', 'login', 'register', 'signup',
-            'pricing', 'plans', 'billing', 'support', 'help', 'faq'
-        ]
-        
-        page_contents = {}
-        
-        # Process main page first
-        page = await context.new_page()
-        try:
-            await page.goto(url, wait_until="domcontentloaded", timeout=8000)
-            await page.add_style_tag(content='''
-                [class*="cookie"],[id*="cookie"],
-                [class*="banner"],[id*="banner"],
-                .cookie-banner, .cookie-notice,
-                header, nav, footer, .sidebar
-                {display:none!important}
-            ''')
-            
-            # Extract text content and links simultaneously
-            page_data = await page.evaluate('''() => {
-                // Remove unwanted elements
-                const unwanted = document.querySelectorAll('script, style, noscript, header, nav, footer, .sidebar');
-                unwanted.forEach(el => el.remove());
-                
-                // Get clean text content
-                const textContent = document.body ? document.body.innerText.trim() : '';
-                
-                // Extract all internal links
-                const links = Array.from(document.querySelectorAll('a[href]'))
-                    .map(link => {
-                        try {
-                            const href = link.href;
-                            if (href && href.startsWith('http')) {
-                                return href;
-                            }
-                        } catch (e) {}
-                        return null;
-                    })
-                    .filter(href => href !== null);
-                
-                return { content: textContent, links: links };
-            }''')
-            
-            if page_data['content']:
-                page_contents[url] = page_data['content'][:5000]  # Limit content length
-            
-            links = page_data['links'] or []
-            
-        except Exception as e:
-            print(f"Error processing main page {url}: {e}")
-            links = []
-            page_contents[url] = f"Error accessing main page: {str(e)}"
-        finally:
-            await page.close()
-        
-        # Filter links to same domain and prioritize
-        same_domain_links = []
-        for link in links:
+            continue
+
+    # Remove duplicates and prioritize by keywords
+    unique_links = list(dict.fromkeys(same_domain_links))  # Preserve order, remove dupes
+
+    def get_link_priority(link):
+        link_lower = link.lower()
+        for i, keyword in enumerate(PRIORITY_KEYWORDS):
+            if keyword in link_lower:
+                return i
+        return len(PRIORITY_KEYWORDS)
+
+    # Sort by priority and limit
+    unique_links.sort(key=get_link_priority)
+    return unique_links[:max_pages-1]  # -1 for main page already processed
+
+async def _crawl_links(links_to_crawl: list[str], context: Optional[BrowserContext] = None) -> dict[str, str]:
+    """
+    Fetch the secondary pages in parallel and keep the ones with substantial content.
+
+    In "http" crawl mode pages are fetched over plain HTTP first and only the ones that
+    come back (nearly) empty are rendered in a browser. `context` is used for those
+    renders when given, otherwise one is borrowed from the pool only if needed.
+    """
+    page_contents = {}
+
+    if CRAWL_MODE == "http" and links_to_crawl:
+        fetched_pages = await asyncio.gather(*(fetch_page(link) for link in links_to_crawl))
+        links_to_render = []
+        for link, fetched in zip(links_to_crawl, fetched_pages):
+            if needs_browser(fetched):
+                links_to_render.append(link)
+            elif fetched.is_html:
+                page_contents[link] = fetched.text[:5000]  # Limit content length
+    else:
+        links_to_render = links_to_crawl
+
+    if links_to_render:
+        if context is not None:
+            page_contents.update(await _render_links(context, links_to_render))
+        else:
+            async with browser_pool.context(**CRAWL_CONTEXT_OPTIONS) as context:
+                page_contents.update(await _render_links(context, links_to_render))
+
+    # Only include substantial content
+    return {link: content for link, content in page_contents.items() if content and len(content.strip()) > 100}
+
+async def _render_links(context: BrowserContext, links: list[str]) -> dict[str, str]:
+    """Load pages in browser tabs and return their rendered text."""
+    page_contents = {}
+
+    # Process links in parallel with limited concurrency
+    semaphore = asyncio.Semaphore(3)  # Max 3 concurrent requests
+
+    async def extract_page_content(link):
+        async with semaphore:
+            page = await context.new_page()
+            started = time.perf_counter()
             try:
-                link_domain = urlparse(link).netloc.lower()
-                if link_domain == base_domain and link != url:
-                    # Check if link contains blacklisted keywords
-                    link_lower = link.lower()
-                    is_blacklisted = any(keyword in link_lower for keyword in blacklist_keywords)
-                    if not is_blacklisted:
-                        same_domain_links.append(link)
-            except:
-                continue
-        
-        # Remove duplicates and prioritize by keywords
-        unique_links = list(dict.fromkeys(same_domain_links))  # Preserve order, remove dupes
-        
-        def get_link_priority(link):
-            link_lower = link.lower()
-            for i, keyword in enumerate(priority_keywords):
-                if keyword in link_lower:
-                    return i
-            return len(priority_keywords)
-        
-        # Sort by priority and limit
-        unique_links.sort(key=get_link_priority)
-        links_to_crawl = unique_links[:max_pages-1]  # -1 for main page already processed
-        
-        # Process links in parallel with limited concurrency
-        semaphore = asyncio.Semaphore(3)  # Max 3 concurrent requests
-        
-        async def extract_page_content(link):
-            async with semaphore:
-                page = await context.new_page()
-                try:
-                    await page.goto(link, wait_until="domcontentloaded", timeout=6000)
-                    await page.add_style_tag(content='''
-                        [class*="cookie"],[id*="cookie"],
-                        [class*="banner"],[id*="banner"],
-                        .cookie-banner, .cookie-notice,
-                        header, nav, footer, .sidebar
-                        {display:none!important}
-                    ''')
-                    
-                    content = await page.evaluate('''() => {
-                        const unwanted = document.querySelectorAll('script, style, noscript, header, nav, footer, .sidebar');
-                        unwanted.forEach(el => el.remove());
-                        return document.body ? document.body.innerText.trim() : '';
-                    }''')
-                    
-                    return link, content[:5000] if content else ""  # Limit content length
-                    
-                except Exception as e:
-                    print(f"Error processing {link}: {e}")
-                    return link, ""
-                finally:
-                    await page.close()
-        
-        # Execute all page extractions in parallel
-        if links_to_crawl:
-            tasks = [extract_page_content(link) for link in links_to_crawl]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Collect successful results
-            for result in results:
-                if isinstance(result, tuple) and len(result) == 2:
-                    link, content = result
-                    if content and len(content.strip()) > 100:  # Only include substantial content
-                        page_contents[link] = content
-        
-        await browser.close()
-        return page_contents
+                # Text-only loads skip media, fonts and trackers; the screenshot page keeps full fidelity
+                await apply_lean_render(page)
+                await page.goto(link, wait_until="domcontentloaded", timeout=6000)
+                await page.add_style_tag(content=HIDE_PAGE_CHROME_CSS)
+
+                content = await page.evaluate(EXTRACT_TEXT_JS)
+
+                return link, content[:5000] if content else ""  # Limit content length
+
+            except Exception as e:
+                print(f"Error processing {link}: {e}")
+                return link, ""
+            finally:
+                crawl_page_seconds.observe(time.perf_counter() - started, mode="browser")
+                await page.close()
+
+    # Execute all page extractions in parallel
+    tasks = [extract_page_content(link) for link in links]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Collect successful results
+    for result in results:
+        if isinstance(result, tuple) and len(result) == 2:
+            link, content = result
+            page_contents[link] = content
+
+    return page_contents
@@ -0,0 +1,84 @@
+import os
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+from app.services.redis_client import get_redis
+
+TASK_EVENTS_BACKEND = os.getenv("TASK_EVENTS_BACKEND", "memory").lower()   # memory | redis
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+class MemoryTaskEventBus:
+    """Fan-out of task events to subscribers in this process."""
+
+    def __init__(self):
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    async def publish(self, task_id: str, event: dict[str, Any]):
+        for queue in list(self._subscribers.get(task_id, ())):
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[task_id]
+
+
+class RedisTaskEventBus:
+    """Task events over Redis pub/sub, for when the pipeline and the listener run in different workers."""
+
+    def __init__(self, redis_client, prefix: str = "task-events"):
+        self._redis = redis_client
+        self._prefix = prefix
+
+    def _channel(self, task_id: str) -> str:
+        return f"{self._prefix}:{task_id}"
+
+    async def publish(self, task_id: str, event: dict[str, Any]):
+        try:
+            await self._redis.publish(self._channel(task_id), json.dumps(event, default=str))
+        except Exception as e:
+            print(f"WARN: Failed to publish event for task {task_id}: {e}")
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue()
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._channel(task_id))
+
+        async def pump():
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    queue.put_nowait(json.loads(message["data"]))
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            yield queue
+        finally:
+            pump_task.cancel()
+            try:
+                await pump_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            await pubsub.aclose()
+
+
+def create_task_event_bus(backend: str = TASK_EVENTS_BACKEND):
+    if backend == "redis":
+        redis_client = get_redis()
+        if redis_client is not None:
+            return RedisTaskEventBus(redis_client)
+        print("WARN: TASK_EVENTS_BACKEND=redis but no Redis is configured. Using in-process task events.")
+    return MemoryTaskEventBus()
+
+
+task_events = create_task_event_bus()
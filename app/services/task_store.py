@@ -0,0 +1,154 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+from sqlalchemy import select, delete, func
+from app.db import AsyncSessionLocal, PlanTask
+from app.services.ttl_cache import TTLCache
+from app.services.redis_client import get_redis
+
+TASK_STORE_BACKEND     = os.getenv("TASK_STORE_BACKEND", "memory").lower()   # memory | redis | postgres
+TASK_STORE_TTL_SECONDS = int(os.getenv("TASK_STORE_TTL_SECONDS", 24 * 60 * 60))
+TASK_STORE_MAX_ENTRIES = int(os.getenv("TASK_STORE_MAX_ENTRIES", 1000))      # memory backend only
+
+
+class TaskStore(ABC):
+    """Where /plan records task statuses and /plan/status reads them back."""
+
+    capacity: Optional[int] = None   # Most statuses held at once, if the backend evicts beyond a count
+
+    @abstractmethod
+    async def get(self, task_id: str) -> Optional[dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def set(self, task_id: str, status: dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def size(self) -> Optional[int]:
+        """Statuses currently held, or None if the backend can't count them cheaply."""
+        ...
+
+    async def update(self, task_id: str, **fields):
+        """Merge fields into an existing status (or start a new one)."""
+        status = await self.get(task_id) or {}
+        status.update(fields)
+        await self.set(task_id, status)
+
+
+class MemoryTaskStore(TaskStore):
+    """Per-process store; bounded by entry count and TTL. Not shared across workers."""
+
+    def __init__(self, max_entries: int = TASK_STORE_MAX_ENTRIES, ttl_seconds: int = TASK_STORE_TTL_SECONDS):
+        self._cache = TTLCache(max_entries, ttl_seconds)
+        self.capacity = max_entries
+
+    async def get(self, task_id):
+        status = self._cache.get(task_id)
+        return dict(status) if status is not None else None
+
+    async def set(self, task_id, status):
+        self._cache.set(task_id, dict(status))
+
+    async def size(self):
+        return len(self._cache)
+
+
+class RedisTaskStore(TaskStore):
+    def __init__(self, redis_client, ttl_seconds: int = TASK_STORE_TTL_SECONDS, prefix: str = "task"):
+        self._redis = redis_client
+        self._ttl_seconds = ttl_seconds
+        self._prefix = prefix
+
+    def _key(self, task_id: str) -> str:
+        return f"{self._prefix}:{task_id}"
+
+    async def get(self, task_id):
+        raw = await self._redis.get(self._key(task_id))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, task_id, status):
+        await self._redis.set(self._key(task_id), json.dumps(status, default=str), ex=self._ttl_seconds)
+
+    async def size(self):
+        # Counting means a SCAN of the whole keyspace, too slow for every metrics scrape,
+        # and a counter key would drift as statuses expire
+        return None
+
+
+class PostgresTaskStore(TaskStore):
+    """
+    Keeps statuses in the plan_tasks table; expired rows are purged as new ones are written.
+
+    The repo has no migrations, so the table is created (if missing) the first time a
+    store touches the database. To create it ahead of time, or where the app's role may
+    not run DDL:
+
+        CREATE TABLE IF NOT EXISTS plan_tasks (
+            id         VARCHAR(64) PRIMARY KEY,
+            data       JSON NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS ix_plan_tasks_expires_at ON plan_tasks (expires_at);
+    """
+
+    PURGE_EVERY_WRITES = 100
+
+    def __init__(self, session_factory=AsyncSessionLocal, ttl_seconds: int = TASK_STORE_TTL_SECONDS):
+        self._session_factory = session_factory
+        self._ttl_seconds = ttl_seconds
+        self._writes = 0
+        self._table_ready = False
+
+    async def _ensure_table(self, db):
+        if not self._table_ready:
+            await db.run_sync(lambda session: PlanTask.__table__.create(session.connection(), checkfirst=True))
+            await db.commit()
+            self._table_ready = True
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    async def get(self, task_id):
+        async with self._session_factory() as db:
+            await self._ensure_table(db)
+            result = await db.execute(
+                select(PlanTask.data).where(PlanTask.id == task_id, PlanTask.expires_at > self._now())
+            )
+            return result.scalars().first()
+
+    async def set(self, task_id, status):
+        data = json.loads(json.dumps(status, default=str))
+        async with self._session_factory() as db:
+            await self._ensure_table(db)
+            await db.merge(PlanTask(id=task_id, data=data, expires_at=self._now() + timedelta(seconds=self._ttl_seconds)))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY_WRITES == 0:
+                await db.execute(delete(PlanTask).where(PlanTask.expires_at <= self._now()))
+            await db.commit()
+
+    async def size(self):
+        async with self._session_factory() as db:
+            await self._ensure_table(db)
+            result = await db.execute(select(func.count()).select_from(PlanTask).where(PlanTask.expires_at > self._now()))
+            return result.scalar_one()
+
+
+def create_task_store(backend: str = TASK_STORE_BACKEND) -> TaskStore:
+    if backend == "redis":
+        redis_client = get_redis()
+        if redis_client is not None:
+            return RedisTaskStore(redis_client)
+        print("WARN: TASK_STORE_BACKEND=redis but no Redis is configured. Falling back to the in-memory task store.")
+    elif backend == "postgres":
+        return PostgresTaskStore()
+    elif backend != "memory":
+        print(f"WARN: Unknown TASK_STORE_BACKEND '{backend}'. Using the in-memory task store.")
+    return MemoryTaskStore()
+
+
+task_store = create_task_store()
@@ -0,0 +1,122 @@
+import os
+import re
+import math
+from dataclasses import dataclass
+
+INSIGHTS_TOKEN_BUDGET   = int(os.getenv("INSIGHTS_TOKEN_BUDGET", 1800))   # approximate tokens of website text sent for insights
+TEXT_MIN_BLOCK_WORDS    = int(os.getenv("TEXT_MIN_BLOCK_WORDS", 4))       # shorter lines are menu items, buttons and labels
+TEXT_SHINGLE_SIZE       = 5
+TEXT_NEAR_DUPLICATE     = 0.8   # share of a block's shingles already seen for it to count as a repeat
+
+CHARS_PER_TOKEN = 4
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+BOILERPLATE_PATTERN = re.compile(
+    r"(all rights reserved|©|\bcopyright\b|cookie|privacy policy|terms (of|and) (use|service|conditions)|"
+    r"subscribe to our newsletter|sign up for our newsletter|skip to (main )?content|follow us on|powered by)",
+    re.IGNORECASE,
+)
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further get got had has have having he her here hers him
+his how i if in into is it its itself just let me more most my no nor not now of off on once only or other our ours
+out over own same she should so some such than that the their theirs them then there these they this those through
+to too under until up us very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+
+@dataclass
+class _Block:
+    url:     str
+    index:   int     # Position within its page, to restore reading order
+    text:    str
+    tokens:  int
+    density: float
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting; about four characters per token for English text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _words(text: str) -> list[str]:
+    return WORD_PATTERN.findall(text.lower())
+
+def _shingles(words: list[str]) -> set[tuple[str, ...]]:
+    if len(words) < TEXT_SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + TEXT_SHINGLE_SIZE]) for i in range(len(words) - TEXT_SHINGLE_SIZE + 1)}
+
+def _is_low_information(text: str, words: list[str]) -> bool:
+    if len(words) < TEXT_MIN_BLOCK_WORDS and not any(char.isdigit() for char in text):
+        return True
+    if BOILERPLATE_PATTERN.search(text) and len(words) < 25:
+        return True
+    letters = sum(char.isalpha() for char in text)
+    return letters < len(text) * 0.5
+
+def _density(words: list[str], tokens: int) -> float:
+    """Distinct content words per token: high for specific prose and facts, low for filler and lists of links."""
+    content_words = {word for word in words if word not in STOPWORDS and len(word) > 2}
+    return len(content_words) / max(tokens, 1)
+
+def condense_pages(pages: dict[str, str], token_budget: int = INSIGHTS_TOKEN_BUDGET) -> dict[str, str]:
+    """
+    Reduce crawled pages to their most informative text within a token budget.
+
+    Lines repeated across pages (navigation, hero, footer) are kept only where they
+    first appear, blocks that mostly repeat earlier text are dropped, as are short
+    labels and legal or cookie boilerplate. The remaining blocks are chosen by
+    information density until the budget is spent and returned in reading order.
+
+    Args:
+        pages: Mapping of URL to page text, in crawl order (main page first)
+        token_budget: Approximate number of tokens to keep across all pages
+
+    Returns:
+        Mapping of URL to condensed text, omitting pages with nothing left.
+    """
+    seen_lines: set[str] = set()
+    seen_shingles: set[tuple[str, ...]] = set()
+    blocks: list[_Block] = []
+
+    for url, text in pages.items():
+        for index, raw_line in enumerate((text or "").splitlines()):
+            line = " ".join(raw_line.split())
+            words = _words(line)
+            key = " ".join(words)
+            if not key or key in seen_lines:
+                continue
+            seen_lines.add(key)
+            if _is_low_information(line, words):
+                continue
+
+            shingles = _shingles(words)
+            repeated = len(shingles & seen_shingles) / len(shingles)
+            seen_shingles.update(shingles)
+            if repeated >= TEXT_NEAR_DUPLICATE:
+                continue
+
+            tokens = estimate_tokens(line)
+            blocks.append(_Block(url=url, index=index, text=line, tokens=tokens, density=_density(words, tokens)))
+
+    selected: list[_Block] = []
+    remaining = token_budget
+    for block in sorted(blocks, key=lambda block: block.density, reverse=True):
+        if remaining <= 0:
+            break
+        if block.tokens > remaining:
+            # Only worth cutting a long block when a useful amount of it fits
+            if remaining < 50:
+                continue
+            cut = block.text[:remaining * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+            block = _Block(block.url, block.index, cut + " ...", remaining, block.density)
+        selected.append(block)
+        remaining -= block.tokens
+
+    page_order = {url: position for position, url in enumerate(pages)}
+    selected.sort(key=lambda block: (page_order[block.url], block.index))
+
+    condensed: dict[str, list[str]] = {}
+    for block in selected:
+        condensed.setdefault(block.url, []).append(block.text)
+    return {url: "\n".join(lines) for url, lines in condensed.items()}
@@ -0,0 +1,103 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from app.services.redis_client import get_redis
+
+
+class TTLCache:
+    """Small in-process LRU cache whose entries expire after `ttl_seconds`."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    TTLCache in front of an optional shared Redis tier.
+
+    Values must be JSON-serialisable. Redis is used when one is configured (see
+    app.services.redis_client); errors talking to it are logged and treated as a miss,
+    so the local tier keeps working when Redis is down.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, ttl_seconds: float, use_redis: bool = True):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.use_redis = use_redis
+        self.local = TTLCache(max_entries, ttl_seconds)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        redis_client = get_redis() if self.use_redis else None
+        if redis_client is None:
+            return None
+        try:
+            raw = await redis_client.get(self._redis_key(key))
+        except Exception as e:
+            print(f"WARN: Redis read failed for {self.namespace} cache: {e}")
+            return None
+        if raw is None:
+            return None
+
+        value = json.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any):
+        self.local.set(key, value)
+        redis_client = get_redis() if self.use_redis else None
+        if redis_client is None:
+            return
+        try:
+            await redis_client.set(self._redis_key(key), json.dumps(value), ex=int(self.ttl_seconds))
+        except Exception as e:
+            print(f"WARN: Redis write failed for {self.namespace} cache: {e}")
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        redis_client = get_redis() if self.use_redis else None
+        if redis_client is None:
+            return
+        try:
+            await redis_client.delete(self._redis_key(key))
+        except Exception as e:
+            print(f"WARN: Redis delete failed for {self.namespace} cache: {e}")
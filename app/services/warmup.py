@@ -0,0 +1,84 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import text
+from app.db import get_engine
+from app.services.browser_pool import browser_pool
+from app.services.agency_cache import prime_agency_catalogs
+
+WARMUP_DB_CONNECTIONS  = int(os.getenv("WARMUP_DB_CONNECTIONS", 2))     # pool connections to open ahead of traffic (0 = off)
+WARMUP_AGENCY_CATALOGS = int(os.getenv("WARMUP_AGENCY_CATALOGS", 0))    # agency catalogs to load into the cache (0 = off)
+
+logger = logging.getLogger(__name__)
+
+
+async def open_db_connections(count: int = WARMUP_DB_CONNECTIONS):
+    """Open `count` connections at once and hand them back, so the pool keeps them for the first requests."""
+    async with AsyncExitStack() as stack:
+        connections = await asyncio.gather(*(stack.enter_async_context(get_engine().connect()) for _ in range(count)))
+        await asyncio.gather(*(connection.execute(text("SELECT 1")) for connection in connections))
+
+
+class Warmup:
+    """
+    Optional start-up work run in the background while the process already serves requests.
+
+    Every step is something the first request would otherwise do lazily, so a failed
+    or slow step only costs that request time. /ready reports ready once all steps
+    have finished, whatever their outcome, and shows how each one went.
+    """
+
+    def __init__(self):
+        self.steps: dict[str, str] = {}   # step -> pending | ok | failed: <error>
+        self.seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    def start(self, browser: bool = True):
+        """Start the warm-up steps; `browser` launches the shared Chromium (only useful where pipelines run)."""
+        if self._task is not None:
+            return
+        steps: dict[str, Callable[[], Awaitable]] = {}
+        if WARMUP_DB_CONNECTIONS > 0:
+            steps["database"] = open_db_connections
+        if browser:
+            steps["browser"] = browser_pool.start
+        if WARMUP_AGENCY_CATALOGS > 0:
+            steps["agencyCatalogs"] = lambda: prime_agency_catalogs(WARMUP_AGENCY_CATALOGS)
+        self.steps = {name: "pending" for name in steps}
+        self._task = asyncio.create_task(self._run(steps), name="warmup")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def snapshot(self) -> dict:
+        return {"ready": self.ready, "steps": dict(self.steps), "seconds": self.seconds}
+
+    async def _run(self, steps: dict[str, Callable[[], Awaitable]]):
+        started = time.perf_counter()
+
+        async def run_step(name: str, step: Callable[[], Awaitable]):
+            try:
+                await step()
+                self.steps[name] = "ok"
+            except Exception as e:
+                self.steps[name] = f"failed: {e}"
+                logger.error(f"Warm-up step '{name}' failed, it will happen on first use instead: {e}", exc_info=True)
+
+        await asyncio.gather(*(run_step(name, step) for name, step in steps.items()))
+        self.seconds = round(time.perf_counter() - started, 3)
+        logger.info(f"Warm-up finished in {self.seconds}s: {self.steps}")
+
+
+warmup = Warmup()
@@ -0,0 +1,168 @@
+"""
+Plan worker: takes jobs queued by /plan and runs the plan pipeline.
+
+With PLAN_QUEUE_BACKEND=redis run it as its own process, scaled independently of the API:
+
+    python -m app.worker
+
+Each process runs at most PLAN_WORKER_CONCURRENCY pipelines at a time, counting
+single plans and the rows of /plan/batch jobs alike; a batch also keeps to the
+concurrency it was submitted with. Batches come from their own queue and are taken
+by PLAN_BATCH_WORKER_CONCURRENCY separate loops, so they never hold up the loops
+that take single plans. With the in-process
+queue the API starts the same loops itself (see PLAN_RUN_WORKERS_IN_API).
+Set PLAN_WORKER_METRICS_PORT to expose the worker's metrics for Prometheus.
+"""
+from dotenv import load_dotenv
+load_dotenv(dotenv_path=".env.local")
+
+import os
+import asyncio
+import logging
+import signal
+from app.schemas import ClientResponses
+from app.pipeline import generate_plan_async, generate_batch_async
+from app.services.job_queue import JobQueue, MemoryJobQueue, plan_queue, plan_batch_queue, PLAN_QUEUE_BACKEND
+from app.services.browser_pool import browser_pool
+from app.services.http_crawler import close_http_client
+from app.services.redis_client import close_redis
+from app.services.task_store import task_store
+from app.services.loop_monitor import loop_monitor
+from app.services.openai_llm import close_openai_client
+from app.services.warmup import warmup
+from app.services import metrics
+from app.db import get_engine, dispose_engine
+
+PLAN_WORKER_CONCURRENCY       = int(os.getenv("PLAN_WORKER_CONCURRENCY", 4))
+PLAN_BATCH_WORKER_CONCURRENCY = int(os.getenv("PLAN_BATCH_WORKER_CONCURRENCY", 1))   # batch jobs run at once per process
+PLAN_WORKER_SHUTDOWN_SECONDS  = float(os.getenv("PLAN_WORKER_SHUTDOWN_SECONDS", 30))
+PLAN_WORKER_METRICS_PORT      = int(os.getenv("PLAN_WORKER_METRICS_PORT", 0))   # 0 = don't serve metrics
+# Defaults from the queue actually in use: a redis backend that fell back to memory has no other consumer
+PLAN_RUN_WORKERS_IN_API = os.getenv(
+    "PLAN_RUN_WORKERS_IN_API", "true" if isinstance(plan_queue, MemoryJobQueue) else "false"
+).lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+# Pipelines running in this process; sized to what the browser pool and DB pool are tuned for
+plan_slots = asyncio.Semaphore(PLAN_WORKER_CONCURRENCY)
+
+async def collect_runtime_metrics():
+    """Refresh the pool, queue and store gauges for a metrics scrape."""
+    checkedout = getattr(get_engine().pool, "checkedout", None)
+    if checkedout is not None:
+        metrics.db_pool_checked_out.set(checkedout())
+    metrics.browser_open_pages.set(browser_pool.open_pages)
+    metrics.browser_active_contexts.set(browser_pool.active_contexts)
+    task_store_size = await task_store.size()
+    if task_store_size is not None:
+        metrics.task_store_size.set(task_store_size)
+    metrics.plan_queue_depth.set(await plan_queue.depth())
+    metrics.plan_batch_queue_depth.set(await plan_batch_queue.depth())
+    metrics.event_loop_lag_seconds.set(loop_monitor.snapshot()["lagSeconds"])
+
+def _job_id(job: dict) -> str:
+    return job.get("batchId") or job.get("taskId")
+
+async def run_plan_job(job: dict):
+    if "batchId" in job:
+        payloads = [ClientResponses.model_validate(payload) for payload in job["payloads"]]
+        # The batch job holds no slot itself, only its rows do
+        await generate_batch_async(
+            job["batchId"], payloads, job["apiKey"], job.get("refresh", False), job["concurrency"], slots=plan_slots
+        )
+        return
+    payload = ClientResponses.model_validate(job["payload"])
+    async with plan_slots:
+        await generate_plan_async(job["taskId"], payload, payload.apiKey, job["clientHost"], job.get("refresh", False))
+
+async def worker_loop(queue: JobQueue, worker_id: int, stopping: asyncio.Event):
+    while not stopping.is_set():
+        try:
+            job = await queue.dequeue(timeout=1)
+        except Exception as e:
+            logger.error(f"Plan worker {worker_id}: failed to read from queue: {e}")
+            await asyncio.sleep(1)
+            continue
+        if job is None:
+            continue
+        try:
+            await run_plan_job(job)
+        except Exception as e:
+            # generate_plan_async records its own failures; this only catches malformed jobs
+            logger.error(f"Plan worker {worker_id}: job {_job_id(job)} crashed: {e}", exc_info=True)
+        finally:
+            # Also on cancellation: the pipeline has already recorded the job as failed
+            try:
+                await queue.ack(job)
+            except Exception as e:
+                logger.error(f"Plan worker {worker_id}: failed to ack job {_job_id(job)}: {e}")
+
+def start_workers(queue: JobQueue, concurrency: int = PLAN_WORKER_CONCURRENCY, name: str = "plan-worker") -> tuple[asyncio.Event, list[asyncio.Task]]:
+    stopping = asyncio.Event()
+    tasks = [asyncio.create_task(worker_loop(queue, i, stopping), name=f"{name}-{i}") for i in range(concurrency)]
+    return stopping, tasks
+
+async def stop_workers(workers: tuple[asyncio.Event, list[asyncio.Task]]):
+    """Stop taking jobs and give the ones in flight PLAN_WORKER_SHUTDOWN_SECONDS to finish."""
+    stopping, tasks = workers
+    stopping.set()
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(tasks, timeout=PLAN_WORKER_SHUTDOWN_SECONDS)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+async def start_plan_workers() -> list[tuple[JobQueue, tuple[asyncio.Event, list[asyncio.Task]]]]:
+    """Start the loops taking single plans and the separate ones taking batches."""
+    running = []
+    for queue, concurrency, name in (
+        (plan_queue, PLAN_WORKER_CONCURRENCY, "plan-worker"),
+        (plan_batch_queue, PLAN_BATCH_WORKER_CONCURRENCY, "plan-batch-worker"),
+    ):
+        await queue.start()
+        running.append((queue, start_workers(queue, concurrency, name)))
+    return running
+
+async def stop_plan_workers(running: list[tuple[JobQueue, tuple[asyncio.Event, list[asyncio.Task]]]]):
+    await asyncio.gather(*(stop_workers(workers) for _, workers in running))
+    for queue, _ in running:
+        await queue.stop()
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    # Jobs are taken straight away; any that arrive mid warm-up start the browser or connections themselves
+    warmup.start(browser=True)
+
+    workers = await start_plan_workers()
+    logger.info(
+        f"Plan worker started with concurrency {PLAN_WORKER_CONCURRENCY} and {PLAN_BATCH_WORKER_CONCURRENCY} "
+        f"batch workers on the {PLAN_QUEUE_BACKEND} queue"
+    )
+
+    metrics_server = None
+    if PLAN_WORKER_METRICS_PORT:
+        metrics.registry.add_collector(collect_runtime_metrics)
+        metrics_server = await metrics.serve_metrics(PLAN_WORKER_METRICS_PORT)
+        logger.info(f"Serving worker metrics on port {PLAN_WORKER_METRICS_PORT}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Plan worker shutting down")
+    if metrics_server is not None:
+        metrics_server.close()
+    await warmup.stop()
+    await stop_plan_workers(workers)
+    await browser_pool.stop()
+    await close_http_client()
+    await close_openai_client()
+    await close_redis()
+    await dispose_engine()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+"""
+A local stand-in for the OpenAI API with configurable latency and canned structured outputs.
+
+Serves the three calls the pipeline makes: chat completions (insights), responses
+(website analysis, plan copy) and streamed responses (plan copy with PLAN_STREAMING).
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Latencies are given per call as distribution specs (see parse_latency):
+
+    python -m bench.fake_openai --port 8101 --latency recommend=lognormal:4:0.4 --latency analyse=uniform:1:3
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STREAM_CHUNK_CHARS = 24
+
+CANNED_INSIGHTS = (
+    "Acme Widgets is a small, founder-led manufacturer selling direct to trade customers. "
+    "Its site has thin service pages and no clear call to action, which suggests weak SEO "
+    "and an underused website as a lead source."
+)
+CANNED_ANALYSIS = {
+    "companyName": "Acme Widgets",
+    "strengths": ["Clear logo and brand colours", "Fast loading first fold"],
+    "weaknesses": ["No call to action above the fold", "Generic stock imagery"],
+    "recommendations": ["Add a primary call to action", "Lead with customer outcomes"],
+    "overallImpression": "A tidy but passive homepage that does little to convert visitors.",
+}
+CANNED_PLAN = {
+    "planTitle": "Turn Your Website Into Your Best Salesperson",
+    "subTitle": "A focused plan to win more of the customers already looking for you.",
+    "executiveSummary": " ".join(["Your competitors are winning customers you should be winning."] * 12),
+    "recommendations": [{"id": 0, "serviceId": "bench-service", "reason": "It fixes the biggest gap in your funnel first."}],
+    "callToAction": "Start Winning Today",
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a sampler from a latency spec, in seconds:
+
+        fixed:S              always S
+        uniform:LOW:HIGH     uniformly between LOW and HIGH
+        lognormal:MEDIAN:SIGMA   long-tailed around MEDIAN, like real model latencies
+    """
+    kind, *args = spec.split(":")
+    try:
+        values = [float(arg) for arg in args]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec '{spec}'")
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2 and values[0] > 0:
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma)
+    raise ValueError(f"Invalid latency spec '{spec}'")
+
+
+@dataclass
+class FakeOpenAIConfig:
+    # Samplers by call: insights, analyse, recommend
+    latency: dict[str, Callable[[], float]] = field(default_factory=lambda: {
+        "insights": parse_latency("lognormal:2:0.3"),
+        "analyse": parse_latency("lognormal:3:0.3"),
+        "recommend": parse_latency("lognormal:6:0.3"),
+    })
+    requests: dict[str, int] = field(default_factory=dict)
+
+    def set_latency(self, item: str):
+        """Apply a CALL=SPEC option, e.g. recommend=fixed:2."""
+        call, _, spec = item.partition("=")
+        if call not in self.latency:
+            raise ValueError(f"Unknown call '{call}', expected one of {', '.join(self.latency)}")
+        self.latency[call] = parse_latency(spec)
+
+
+def _usage(messages: Any, output: str) -> dict[str, Any]:
+    # Roughly four characters per token, which is all the metrics need
+    input_tokens = len(json.dumps(messages)) // 4
+    output_tokens = len(output) // 4
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens,
+        "input_tokens_details": {"cached_tokens": 0},
+        "output_tokens_details": {"reasoning_tokens": 0},
+    }
+
+def _response_call(body: dict[str, Any]) -> tuple[str, str]:
+    """Which call a /responses request is, and its canned output text, from the requested schema."""
+    schema = json.dumps(body.get("text", {}))
+    if "planTitle" in schema:
+        return "recommend", json.dumps(CANNED_PLAN)
+    return "analyse", json.dumps(CANNED_ANALYSIS)
+
+def _response_object(body: dict[str, Any], text: str, status: str = "completed") -> dict[str, Any]:
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "gpt-4.1-mini"),
+        "status": status,
+        "output": [{
+            "type": "message",
+            "id": "msg_bench",
+            "status": status,
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}] if text else [],
+        }],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": _usage(body.get("input"), text) if status == "completed" else None,
+    }
+
+async def _stream_response(body: dict[str, Any], text: str, seconds: float) -> AsyncIterator[str]:
+    """The responses event stream, with the latency spread over the text deltas like a real model."""
+    chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+    sequence = 0
+
+    def event(kind: str, **data) -> str:
+        nonlocal sequence
+        sequence += 1
+        return f"event: {kind}\ndata: {json.dumps({'type': kind, 'sequence_number': sequence, **data})}\n\n"
+
+    started = _response_object(body, "", status="in_progress")
+    yield event("response.created", response=started)
+    yield event("response.output_item.added", output_index=0, item=started["output"][0])
+    part = {"type": "output_text", "text": "", "annotations": []}
+    yield event("response.content_part.added", output_index=0, content_index=0, item_id="msg_bench", part=part)
+    for chunk in chunks:
+        await asyncio.sleep(seconds / len(chunks))
+        yield event("response.output_text.delta", output_index=0, content_index=0, item_id="msg_bench", delta=chunk)
+    yield event("response.output_text.done", output_index=0, content_index=0, item_id="msg_bench", text=text)
+    done = _response_object(body, text)
+    yield event("response.content_part.done", output_index=0, content_index=0, item_id="msg_bench", part=done["output"][0]["content"][0])
+    yield event("response.output_item.done", output_index=0, item=done["output"][0])
+    yield event("response.completed", response=done)
+
+
+def create_app(config: FakeOpenAIConfig = None) -> FastAPI:
+    config = config or FakeOpenAIConfig()
+    app = FastAPI()
+
+    def sample(call: str) -> float:
+        config.requests[call] = config.requests.get(call, 0) + 1
+        return max(0.0, config.latency[call]())
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(req: Request):
+        body = await req.json()
+        await asyncio.sleep(sample("insights"))
+        usage = _usage(body.get("messages"), CANNED_INSIGHTS)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": CANNED_INSIGHTS}}],
+            "usage": {
+                "prompt_tokens": usage["input_tokens"],
+                "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["total_tokens"],
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        }
+
+    @app.post("/v1/responses")
+    async def responses(req: Request):
+        body = await req.json()
+        call, text = _response_call(body)
+        seconds = sample(call)
+        if body.get("stream"):
+            return StreamingResponse(_stream_response(body, text, seconds), media_type="text/event-stream")
+        await asyncio.sleep(seconds)
+        return JSONResponse(_response_object(body, text))
+
+    @app.get("/stats")
+    async def stats():
+        return config.requests
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency", action="append", default=[], metavar="CALL=SPEC",
+                        help="Latency for insights, analyse or recommend, e.g. recommend=fixed:2")
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig()
+    for item in args.latency:
+        config.set_latency(item)
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+A static multi-page website for the crawler to load, with no network access needed.
+
+Every lead in a benchmark gets its own copy of the site under /sites/<n>/ so crawls
+aren't answered from the crawl cache unless the run asks for that. Each copy has a
+homepage linking to about, services, team, contact, careers and a few blog posts.
+
+    python -m bench.fake_site --port 8102
+"""
+import argparse
+from html import escape
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import HTMLResponse
+
+PAGES = {
+    "": ("Acme Widgets", "Precision widgets for trade customers, made in our own workshop since 1998."),
+    "about": ("About us", "We are a family business of twenty engineers who care about tolerances and delivery dates."),
+    "services": ("Services", "Custom machining, batch production runs and same-week prototyping for product teams."),
+    "team": ("Our team", "Our founders lead a small team of machinists, designers and a friendly sales desk."),
+    "contact": ("Contact", "Call the workshop or send us a drawing and we will quote within two working days."),
+    "careers": ("Careers", "We hire apprentices every autumn and train them on every machine we own."),
+    "blog/tolerances": ("Why tolerances matter", "A tenth of a millimetre decides whether an assembly fits first time."),
+    "blog/lead-times": ("Cutting lead times", "How we moved from six week to two week turnaround without new machines."),
+}
+
+FOOTER_TEXT = "Copyright Acme Widgets Ltd. All rights reserved. Privacy policy. Terms of use."
+
+
+def render_page(site: int, path: str) -> str:
+    title, lead = PAGES[path]
+    base = f"/sites/{site}"
+    nav = " ".join(f'<a href="{base}/{link}">{escape(PAGES[link][0])}</a>' for link in PAGES if link)
+    # Enough distinct prose per page that the HTTP crawler doesn't fall back to the browser
+    body = "".join(
+        f"<p>{escape(lead)} Site {site}, section {index}: we explain how {escape(title.lower())} "
+        f"helps customers ship better products with fewer surprises.</p>"
+        for index in range(1, 6)
+    )
+    return f"""<!doctype html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{escape(title)} | Acme Widgets {site}</title></head>
+<body>
+<header><nav>{nav}</nav></header>
+<main><h1>{escape(title)}</h1>{body}</main>
+<footer><p>{FOOTER_TEXT}</p></footer>
+</body>
+</html>"""
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sites/{site}/{path:path}", response_class=HTMLResponse)
+    async def page(site: int, path: str):
+        path = path.strip("/")
+        if path not in PAGES:
+            raise HTTPException(status_code=404)
+        return render_page(site, path)
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8102)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Load driver: replays plan payloads against /plan and /plan/status and reports latencies.
+
+Each of `concurrency` clients submits a plan, polls its status until it finishes, then
+submits the next. 429 and 503 answers are retried after their Retry-After. The report
+has p50/p95/p99 for the end-to-end time and for every pipeline stage (from the
+"timings" of completed tasks), and plans per minute over the run.
+
+    python -m bench.load --base-url http://127.0.0.1:8000 --api-key KEY --payloads leads.jsonl --concurrency 8
+
+Without --payloads, --count synthetic leads are generated against --site-url (see fake_site).
+"""
+import json
+import math
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import httpx
+
+POLL_INTERVAL_SECONDS = 0.25
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+@dataclass
+class PlanResult:
+    status: str                       # completed | failed | error
+    seconds: float                    # submit to terminal status
+    timings: dict[str, float] = field(default_factory=dict)
+    rejections: int = 0               # 429/503 answers before the plan was accepted
+    error: Optional[str] = None
+
+
+def synthetic_payloads(count: int, api_key: str, site_url: Optional[str]) -> list[dict[str, Any]]:
+    return [
+        {
+            "apiKey": api_key,
+            "email": f"lead{index}@bench.test",
+            "name": f"Bench Lead {index}",
+            "websiteUrl": f"{site_url.rstrip('/')}/sites/{index}/" if site_url else None,
+            "businessGoal": "Win more trade customers from our website",
+            "budgetRange": "5000-10000",
+        }
+        for index in range(count)
+    ]
+
+def load_payloads(path: str, api_key: Optional[str] = None) -> list[dict[str, Any]]:
+    """ClientResponses payloads from a JSONL file, one per line; api_key replaces each payload's apiKey if given."""
+    payloads = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                payload = json.loads(line)
+                if api_key:
+                    payload["apiKey"] = api_key
+                payloads.append(payload)
+    return payloads
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """Nearest-rank p50, p95 and p99."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        index = min(len(ordered), max(1, math.ceil(p / 100 * len(ordered)))) - 1
+        return ordered[index]
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99)}
+
+
+async def run_plan(client: httpx.AsyncClient, payload: dict[str, Any], timeout: float) -> PlanResult:
+    started = time.perf_counter()
+    rejections = 0
+    try:
+        while True:
+            response = await client.post("/plan", json=payload)
+            if response.status_code not in (429, 503):
+                break
+            rejections += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+        response.raise_for_status()
+        task_id = response.json()["taskId"]
+
+        while time.perf_counter() - started < timeout:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            status = (await client.get(f"/plan/status/{task_id}")).json()
+            if status.get("status") in TERMINAL_STATUSES:
+                return PlanResult(
+                    status=status["status"],
+                    seconds=time.perf_counter() - started,
+                    timings=status.get("timings", {}),
+                    rejections=rejections,
+                    error=status.get("error"),
+                )
+        return PlanResult("error", time.perf_counter() - started, rejections=rejections, error="Timed out")
+    except Exception as e:
+        return PlanResult("error", time.perf_counter() - started, rejections=rejections, error=str(e) or type(e).__name__)
+
+async def run_load(base_url: str, payloads: list[dict[str, Any]], concurrency: int, timeout: float = 300) -> tuple[list[PlanResult], float]:
+    """Run every payload with `concurrency` clients. Returns the results and the wall time in seconds."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    results: list[PlanResult] = []
+
+    async def client_loop(client: httpx.AsyncClient):
+        while not queue.empty():
+            results.append(await run_plan(client, queue.get_nowait(), timeout))
+
+    started = time.perf_counter()
+    limits = httpx.Limits(max_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+def summarize(results: list[PlanResult], wall_seconds: float, concurrency: int) -> dict[str, Any]:
+    completed = [result for result in results if result.status == "completed"]
+    stages: dict[str, list[float]] = {}
+    for result in completed:
+        for stage, seconds in result.timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    errors: dict[str, int] = {}
+    for result in results:
+        if result.status != "completed":
+            errors[result.error or result.status] = errors.get(result.error or result.status, 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "plans": len(results),
+        "completed": len(completed),
+        "rejections": sum(result.rejections for result in results),
+        "wallSeconds": round(wall_seconds, 3),
+        "plansPerMinute": round(len(completed) / wall_seconds * 60, 2) if wall_seconds > 0 else 0.0,
+        "endToEnd": percentiles([result.seconds for result in completed]),
+        "stages": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "errors": errors,
+    }
+
+def format_report(summary: dict[str, Any]) -> str:
+    lines = [
+        f"{summary['completed']}/{summary['plans']} plans completed at concurrency {summary['concurrency']} "
+        f"in {summary['wallSeconds']:.1f}s: {summary['plansPerMinute']:.1f} plans/min, "
+        f"{summary['rejections']} rejections",
+        f"{'':<12}{'p50':>9}{'p95':>9}{'p99':>9}",
+    ]
+    rows = [("end-to-end", summary["endToEnd"])] + list(summary["stages"].items())
+    for name, values in rows:
+        if values:
+            lines.append(f"{name:<12}" + "".join(f"{values[p]:>8.2f}s" for p in ("p50", "p95", "p99")))
+    for error, count in summary["errors"].items():
+        lines.append(f"{count} x {error}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", help="Agency API key; replaces the apiKey in --payloads")
+    parser.add_argument("--payloads", help="JSONL of ClientResponses payloads")
+    parser.add_argument("--count", type=int, default=20, help="Synthetic leads to generate without --payloads")
+    parser.add_argument("--site-url", help="Base URL of a fake_site for the synthetic leads' websites")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    if args.payloads:
+        payloads = load_payloads(args.payloads, args.api_key)
+    elif args.api_key:
+        payloads = synthetic_payloads(args.count, args.api_key, args.site_url)
+    else:
+        parser.error("--api-key is required without --payloads")
+
+    results, wall_seconds = asyncio.run(run_load(args.base_url, payloads, args.concurrency))
+    summary = summarize(results, wall_seconds, args.concurrency)
+    print(json.dumps(summary, indent=2) if args.json else format_report(summary))
+
+if __name__ == "__main__":
+    main()
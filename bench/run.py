@@ -0,0 +1,134 @@
+"""
+End-to-end offline benchmark: fake OpenAI, fake website, the real API, and the load driver.
+
+Starts fake_openai and fake_site in this process, seeds a benchmark agency into the
+database at DATABASE_URL (a local Postgres keeps the run offline), launches the API
+with uvicorn pointed at the fakes, replays the leads and prints the report.
+
+    python -m bench.run --plans 50 --concurrency 8 --latency recommend=lognormal:4:0.4
+
+The API runs with its LLM response cache off and without Redis, so every plan does
+the full crawl and LLM work. Use --env to change any other setting, for example
+--env CRAWL_MODE=browser or --env PLAN_WORKER_CONCURRENCY=8.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import httpx
+import uvicorn
+from bench import fake_openai, fake_site
+from bench.load import load_payloads, synthetic_payloads, run_load, summarize, format_report
+
+BENCH_API_KEY = "bench-agency-key"
+
+
+async def serve(app, port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+async def seed_agency(api_key: str = BENCH_API_KEY):
+    """Create the tables if needed and an agency with one service for the benchmark leads."""
+    from sqlalchemy import select
+    from app.db import get_engine, dispose_engine, AsyncSessionLocal, Base, Agency, Service
+
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Agency).where(Agency.api_key == api_key))
+        if result.scalars().first() is None:
+            agency = Agency(name="Benchmark Agency", api_key=api_key, description="Websites and growth marketing for trade businesses.")
+            db.add(agency)
+            db.add(Service(
+                agency=agency,
+                name="Conversion-focused website rebuild",
+                description="A fast website built around one clear call to action.",
+                outcomes=["More enquiries from the same traffic"],
+                when_to_recommend=["The website is passive or has no clear call to action"],
+            ))
+            await db.commit()
+    await dispose_engine()
+
+async def wait_until_ready(base_url: str, process: asyncio.subprocess.Process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process.returncode is not None:
+                raise RuntimeError(f"API exited with code {process.returncode} during startup")
+            try:
+                if (await client.get("/ready")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise TimeoutError(f"API at {base_url} was not ready within {timeout}s")
+
+async def run(args) -> dict:
+    config = fake_openai.FakeOpenAIConfig()
+    for item in args.latency:
+        config.set_latency(item)
+
+    openai_server, openai_task = await serve(fake_openai.create_app(config), args.openai_port)
+    site_server, site_task = await serve(fake_site.create_app(), args.site_port)
+    await seed_agency()
+
+    env = {key: value for key, value in os.environ.items() if not key.startswith("REDIS_")}
+    env.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "LLM_CACHE_ENABLED": "false",
+        "RATE_LIMIT_MAX": "1000000",
+    })
+    env.update(item.split("=", 1) for item in args.env)
+    api = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.api_port),
+        "--log-level", "warning", env=env,
+    )
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    try:
+        await wait_until_ready(base_url, api)
+        site_url = f"http://127.0.0.1:{args.site_port}"
+        payloads = (
+            load_payloads(args.payloads, BENCH_API_KEY) if args.payloads
+            else synthetic_payloads(args.plans, BENCH_API_KEY, None if args.no_website else site_url)
+        )
+        results, wall_seconds = await run_load(base_url, payloads, args.concurrency)
+        summary = summarize(results, wall_seconds, args.concurrency)
+        summary["openaiRequests"] = dict(config.requests)
+        return summary
+    finally:
+        if api.returncode is None:
+            api.terminate()
+            await api.wait()
+        for server, task in ((openai_server, openai_task), (site_server, site_task)):
+            server.should_exit = True
+            await task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=20, help="Synthetic leads to run without --payloads")
+    parser.add_argument("--payloads", help="JSONL of ClientResponses payloads to replay; apiKey is replaced")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", action="append", default=[], metavar="CALL=SPEC",
+                        help="Fake OpenAI latency for insights, analyse or recommend, e.g. recommend=fixed:2")
+    parser.add_argument("--no-website", action="store_true", help="Leave websiteUrl out of the synthetic leads")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra environment for the API")
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--openai-port", type=int, default=8101)
+    parser.add_argument("--site-port", type=int, default=8102)
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    print(json.dumps(summary, indent=2) if args.json else format_report(summary))
+
+if __name__ == "__main__":
+    main()
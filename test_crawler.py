@@ -6,6 +6,7 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from app.services.scraper import crawl_website
+from app.services.browser_pool import browser_pool
 
 async def test_crawler():
     """Test the website crawler with a sample URL"""
@@ -49,6 +50,8 @@ async def test_crawler():
         print(f"❌ Error during crawling: {str(e)}")
         import traceback
         traceback.print_exc()
+    finally:
+        await browser_pool.stop()
 
 if __name__ == "__main__":
     # Run the test
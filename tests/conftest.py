@@ -5,6 +5,7 @@ from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from typing import AsyncGenerator
+from contextlib import asynccontextmanager
 
 from app.main import app  # Your FastAPI application
 from app.db import Base, get_db, settings # Import settings to potentially override DATABASE_URL for tests
@@ -48,6 +49,19 @@ async def db_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
         await session.rollback() # Rollback any changes after each test to keep tests isolated
 
+@pytest.fixture
+def session_factory(db_session: AsyncSession):
+    """
+    Stand-in for AsyncSessionLocal, for code that opens its own sessions: every session
+    it opens is the test's db_session. `opened` counts how many were asked for.
+    """
+    @asynccontextmanager
+    async def factory():
+        factory.opened += 1
+        yield db_session
+    factory.opened = 0
+    return factory
+
 @pytest_asyncio.fixture(scope="function")
 async def test_client(db_session: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
     """Provides an HTTP client for making requests to the FastAPI app, with overridden DB."""
@@ -0,0 +1,42 @@
+import uuid
+import pytest
+
+from app.db import Agency, Service
+from app.services.agency_cache import get_agency_catalog, invalidate_agency
+
+def _service(agency_id: int, name: str, is_active: bool = True) -> Service:
+    return Service(
+        agency_id=agency_id, name=name, description=f"{name} description",
+        outcomes=["More leads"], when_to_recommend=["Always"], is_active=is_active,
+    )
+
+@pytest.mark.asyncio
+async def test_agency_catalog_is_cached_until_invalidated(db_session, session_factory):
+    """Only active services are listed, repeat lookups skip the DB until the entry is dropped."""
+    api_key = f"key-{uuid.uuid4()}"
+    agency = Agency(name="Cache Agency", api_key=api_key, description="We build websites")
+    db_session.add(agency)
+    await db_session.flush()
+    db_session.add_all([_service(agency.id, "Web Design"), _service(agency.id, "Retired", is_active=False)])
+    await db_session.flush()
+
+    catalog = await get_agency_catalog(api_key, session_factory=session_factory)
+    assert catalog.agency_id == agency.id
+    assert [service["name"] for service in catalog.services] == ["Web Design"]
+    assert '"name": "Web Design"' in catalog.services_json
+
+    await get_agency_catalog(api_key, session_factory=session_factory)
+    assert session_factory.opened == 1
+
+    db_session.add(_service(agency.id, "SEO"))
+    await db_session.flush()
+    db_session.expire(agency, ["services"])
+    catalog = await get_agency_catalog(api_key, session_factory=session_factory)
+    assert [service["name"] for service in catalog.services] == ["Web Design"]
+
+    await invalidate_agency(api_key)
+    catalog = await get_agency_catalog(api_key, session_factory=session_factory)
+    assert session_factory.opened == 2
+    assert [service["name"] for service in catalog.services] == ["Web Design", "SEO"]
+
+    assert await get_agency_catalog(f"missing-{uuid.uuid4()}", session_factory=session_factory) is None
@@ -0,0 +1,29 @@
+import pytest
+
+from bench.fake_openai import parse_latency
+from bench.load import PlanResult, percentiles, summarize
+
+def test_percentiles_use_nearest_rank():
+    assert percentiles(list(range(1, 101))) == {"p50": 50, "p95": 95, "p99": 99}
+    assert percentiles([2.0]) == {"p50": 2.0, "p95": 2.0, "p99": 2.0}
+    assert percentiles([]) == {}
+
+def test_summarize_reports_stages_throughput_and_errors():
+    results = [
+        PlanResult("completed", 10.0, {"capture": 2.0, "recommend": 6.0}),
+        PlanResult("completed", 12.0, {"capture": 3.0, "recommend": 7.0}, rejections=1),
+        PlanResult("failed", 1.0, error="Agency not found."),
+    ]
+    summary = summarize(results, wall_seconds=30, concurrency=2)
+
+    assert summary["plansPerMinute"] == 4.0
+    assert summary["rejections"] == 1
+    assert summary["stages"]["capture"]["p99"] == 3.0
+    assert summary["errors"] == {"Agency not found.": 1}
+
+def test_parse_latency():
+    assert parse_latency("fixed:1.5")() == 1.5
+    assert 1 <= parse_latency("uniform:1:2")() <= 2
+    assert parse_latency("lognormal:2:0")() == 2
+    with pytest.raises(ValueError):
+        parse_latency("normal:1")
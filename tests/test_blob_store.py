@@ -0,0 +1,62 @@
+import os
+import pytest
+
+from app.services.blob_store import LocalBlobStore, screenshot_store
+
+@pytest.mark.asyncio
+async def test_put_is_content_addressed_and_deduplicated(tmp_path):
+    store = LocalBlobStore(root=str(tmp_path))
+
+    blob_id = await store.put(b"image-bytes", "jpg")
+    assert blob_id == await store.put(b"image-bytes", "jpg")
+    assert blob_id != await store.put(b"other-bytes", "jpg")
+
+    path = await store.path_for(blob_id)
+    with open(path, "rb") as f:
+        assert f.read() == b"image-bytes"
+    assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 2
+
+@pytest.mark.asyncio
+async def test_path_for_rejects_unknown_and_malformed_ids_and_marks_reads(tmp_path):
+    store = LocalBlobStore(root=str(tmp_path))
+    blob_id = await store.put(b"image-bytes", "png")
+    path = await store.path_for(blob_id)
+    os.utime(path, (0, 0))
+
+    assert await store.path_for(blob_id) == path
+    assert os.stat(path).st_mtime > 0   # A read counts as use for eviction
+    assert await store.path_for("0" * 64 + ".png") is None
+    assert await store.path_for("../../etc/passwd") is None
+    assert await store.path_for(blob_id.replace(".png", ".gif")) is None
+
+@pytest.mark.asyncio
+async def test_put_evicts_least_recently_used_blobs_past_the_limit(tmp_path):
+    store = LocalBlobStore(root=str(tmp_path), max_bytes=25)
+    old = await store.put(b"a" * 10, "jpg")
+    recent = await store.put(b"b" * 10, "jpg")
+    os.utime(await store.path_for(old), (1, 1))
+    os.utime(await store.path_for(recent), (2, 2))
+
+    newest = await store.put(b"c" * 10, "jpg")
+
+    assert await store.path_for(old) is None
+    assert await store.path_for(recent) is not None
+    assert await store.path_for(newest) is not None
+    assert store._total_bytes == 20
+
+@pytest.mark.asyncio
+async def test_get_screenshot_answers_304_for_a_matching_etag(test_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(screenshot_store, "root", str(tmp_path))
+    monkeypatch.setattr(screenshot_store, "_total_bytes", None)
+    blob_id = await screenshot_store.put(b"image-bytes", "jpg")
+
+    response = await test_client.get(f"/screenshots/{blob_id}")
+    assert response.status_code == 200
+    assert response.content == b"image-bytes"
+    assert response.headers["content-type"] == "image/jpeg"
+    etag = response.headers["etag"]
+
+    assert (await test_client.get(f"/screenshots/{blob_id}", headers={"If-None-Match": etag})).status_code == 304
+    assert (await test_client.get(f"/screenshots/{blob_id}", headers={"If-None-Match": f'"other", {etag}'})).status_code == 304
+    assert (await test_client.get(f"/screenshots/{blob_id}", headers={"If-None-Match": '"other"'})).status_code == 200
+    assert (await test_client.get("/screenshots/" + "0" * 64 + ".jpg")).status_code == 404
@@ -0,0 +1,126 @@
+import threading
+import pytest
+
+from app.services import browser_pool
+from app.services.browser_pool import BrowserPool
+
+class FakePage:
+    def on(self, event, callback):
+        pass
+
+class FakeContext:
+    def __init__(self):
+        self._on_page = None
+        self.closed = False
+
+    def on(self, event, callback):
+        self._on_page = callback
+
+    async def new_page(self):
+        page = FakePage()
+        self._on_page(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+class FakeBrowser:
+    def __init__(self):
+        self.handlers = {}
+        self.connected = True
+        self.closed = False
+
+    def on(self, event, callback):
+        self.handlers[event] = callback
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **kwargs):
+        return FakeContext()
+
+    async def close(self):
+        self.closed = True
+
+class FakePlaywright:
+    """Stands in for the started async_playwright(); launches FakeBrowsers."""
+
+    def __init__(self):
+        self.chromium = self
+        self.browsers = []
+
+    async def launch(self, **kwargs):
+        self.browsers.append(FakeBrowser())
+        return self.browsers[-1]
+
+    async def stop(self):
+        pass
+
+def _pool(max_pages: int) -> tuple[BrowserPool, FakePlaywright]:
+    pool = BrowserPool(max_pages=max_pages, max_memory_mb=0)
+    pool._playwright = FakePlaywright()
+    return pool, pool._playwright
+
+@pytest.mark.asyncio
+async def test_browser_is_recycled_after_max_pages_once_its_contexts_are_released():
+    pool, playwright = _pool(max_pages=2)
+
+    async with pool.context() as context:
+        await context.new_page()
+        await context.new_page()
+        assert pool.open_pages == 2
+
+        # The first browser has served its pages: the next context gets a new one,
+        # while the context still open on the old one keeps working
+        async with pool.context():
+            assert len(playwright.browsers) == 2
+            assert pool.active_contexts == 2
+            assert not playwright.browsers[0].closed
+        assert not playwright.browsers[0].closed
+
+    assert playwright.browsers[0].closed
+    assert not playwright.browsers[1].closed
+    assert pool.active_contexts == 0 and pool.open_pages == 0
+
+@pytest.mark.asyncio
+async def test_idle_browser_is_reused_then_replaced_when_it_disconnects():
+    pool, playwright = _pool(max_pages=0)
+
+    for _ in range(3):
+        async with pool.context() as context:
+            await context.new_page()
+    assert len(playwright.browsers) == 1
+
+    playwright.browsers[0].handlers["disconnected"](playwright.browsers[0])
+    async with pool.context():
+        pass
+    assert len(playwright.browsers) == 2
+    assert playwright.browsers[0].closed
+
+    await pool.stop()
+    assert playwright.browsers[1].closed
+
+@pytest.mark.asyncio
+async def test_memory_is_measured_off_the_event_loop_and_throttled(monkeypatch):
+    scans = []
+    def rss_mb(pid):
+        scans.append(threading.current_thread())
+        return 2048.0
+    monkeypatch.setattr(browser_pool, "_process_tree_rss_mb", rss_mb)
+    monkeypatch.setattr(browser_pool, "BROWSER_MEMORY_CHECK_SECONDS", 3600)
+    pool = BrowserPool(max_pages=0, max_memory_mb=1024)
+    pool._playwright = playwright = FakePlaywright()
+    pool._last_memory_check = float("-inf")
+
+    for _ in range(3):
+        async with pool.context():
+            pass
+
+    # One scan per check interval, in a worker thread; there was no browser yet to retire
+    assert len(scans) == 1 and scans[0] is not threading.current_thread()
+    assert len(playwright.browsers) == 1
+    pool._last_memory_check = float("-inf")
+    async with pool.context():
+        pass
+    assert len(scans) == 2
+    assert len(playwright.browsers) == 2 and playwright.browsers[0].closed
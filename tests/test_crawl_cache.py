@@ -0,0 +1,46 @@
+import pytest
+
+from app.services import crawl_cache as crawl_cache_module
+from app.services.crawl_cache import normalize_url, cache_key, get_cached_crawl, cache_crawl
+from app.services.ttl_cache import TTLCache, TieredCache
+
+def test_normalize_url_collapses_equivalent_urls():
+    """Scheme/host case, default ports, fragments, trailing slashes and query order don't matter."""
+    expected = normalize_url("https://example.com/about?a=1&b=2")
+    assert normalize_url("HTTPS://Example.COM:443/about/?b=2&a=1#team") == expected
+    assert normalize_url("https://example.com") == "https://example.com/"
+    assert normalize_url("http://example.com:8080/") == "http://example.com:8080/"
+
+def test_cache_key_includes_max_pages():
+    assert cache_key("https://example.com", 6) != cache_key("https://example.com", 8)
+    assert cache_key("https://example.com/", 6) == cache_key("https://EXAMPLE.com", 6)
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1, ttl_seconds=0)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+@pytest.mark.asyncio
+async def test_crawl_cache_round_trip_skips_failed_crawls(monkeypatch):
+    """Successful crawls are cached per URL and max_pages; failed main pages are not."""
+    monkeypatch.setattr(crawl_cache_module, "crawl_cache", TieredCache("crawl-test", 8, 60, use_redis=False))
+
+    await cache_crawl("https://failed.example.com", 6, {"https://failed.example.com": "Error accessing main page: timeout"})
+    assert await get_cached_crawl("https://failed.example.com", 6) is None
+
+    pages = {"https://example.com": "Welcome to Example"}
+    await cache_crawl("https://example.com", 6, pages, "c2NyZWVuc2hvdA==", "jpg")
+    cached = await get_cached_crawl("https://example.com/", 6)
+    assert cached == {"pages": pages, "screenshot_b64": "c2NyZWVuc2hvdA==", "screenshot_extension": "jpg"}
+    assert await get_cached_crawl("https://example.com", 8) is None
@@ -1,8 +1,11 @@
+import uuid
 import pytest
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.db import Agency as App_DB_Agency, Service as App_DB_Service, Client as App_DB_Client, Plan as App_DB_Plan
+from app.pipeline import save_plans
+from app.schemas import AIResponse, ClientResponses
 
 @pytest.mark.asyncio
 async def test_db_connection(db_session: AsyncSession):
@@ -55,4 +58,22 @@ async def test_create_and_read_service_for_agency(db_session: AsyncSession):
     assert retrieved_agency_with_service is not None
     # To check services relationship, you might need eager loading in the get or refresh, 
     # or a separate query. For simplicity, we check agency_id on service.
-    # For a more thorough check, you'd query agency.services. 
\ No newline at end of file
+    # For a more thorough check, you'd query agency.services. 
+
+@pytest.mark.asyncio
+async def test_save_plans_reuses_clients_by_agency_and_email(db_session: AsyncSession, session_factory):
+    """Repeat and duplicate emails share one client; payloads without an email get no client."""
+    agency = App_DB_Agency(name="Upsert Agency", api_key=f"upsert-{uuid.uuid4()}", description="Upserts")
+    db_session.add(agency)
+    await db_session.commit()
+
+    plan = AIResponse(planTitle="Title", subTitle="Sub", executiveSummary="Summary", recommendations=[], callToAction="Go")
+    payload = ClientResponses(apiKey=agency.api_key, email="lead@example.com", name="Lead")
+    first = await save_plans(agency.id, [(payload, plan)], session_factory)
+    second = await save_plans(agency.id, [(payload, plan), (payload, plan), (ClientResponses(apiKey=agency.api_key, email=""), plan)], session_factory)
+
+    client_id = first[0][1]
+    assert [ids[1] for ids in second] == [client_id, client_id, None]
+    assert len({ids[0] for ids in first + second}) == 4
+    clients = await db_session.execute(select(App_DB_Client).where(App_DB_Client.agency_id == agency.id))
+    assert len(clients.scalars().all()) == 1
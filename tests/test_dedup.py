@@ -0,0 +1,52 @@
+import uuid
+import pytest
+
+from app.schemas import ClientResponses
+from app.services import dedup
+from app.services.task_store import task_store
+
+def _payload(**overrides) -> ClientResponses:
+    data = {"apiKey": "key", "email": "Jane@Example.com", "websiteUrl": "https://acme.test/", "goal": "More leads"}
+    data.update(overrides)
+    return ClientResponses(**data)
+
+def test_plan_request_key_matches_equivalent_requests():
+    key = dedup.plan_request_key(_payload())
+
+    assert key == dedup.plan_request_key(_payload(email=" jane@example.com", websiteUrl="https://acme.test"))
+    assert key != dedup.plan_request_key(_payload(goal="Fewer leads"))
+    assert key != dedup.plan_request_key(_payload(), refresh=True)
+    # An Idempotency-Key replaces the fingerprint, scoped to the API key
+    assert dedup.plan_request_key(_payload(), idempotency_key="abc") == dedup.plan_request_key(_payload(goal="x"), idempotency_key="abc")
+    assert dedup.plan_request_key(_payload(), idempotency_key="abc") != dedup.plan_request_key(_payload(apiKey="other"), idempotency_key="abc")
+
+@pytest.mark.asyncio
+async def test_claim_returns_the_task_already_holding_the_key():
+    key = f"test:{uuid.uuid4()}"
+
+    assert await dedup.claim(key, "task-1") is None
+    assert await dedup.claim(key, "task-2") == "task-1"
+
+    await dedup.release(key, "task-2")   # Not the holder, so nothing changes
+    assert await dedup.claim(key, "task-3") == "task-1"
+
+    await dedup.release(key, "task-1")
+    assert await dedup.claim(key, "task-4") is None
+
+@pytest.mark.asyncio
+async def test_duplicate_waits_until_the_first_request_is_admitted(test_client):
+    """A claimed task with no status yet may still be rejected, so duplicates get a 409 rather than its id."""
+    payload = {"apiKey": "dedup-admission-key", "email": "lead@example.com"}
+    key = dedup.plan_request_key(ClientResponses(**payload))
+    first_task_id = str(uuid.uuid4())
+    assert await dedup.claim(key, first_task_id) is None
+
+    response = await test_client.post("/plan", json=payload)
+    assert response.status_code == 409
+    assert response.headers["retry-after"] == "1"
+
+    await task_store.set(first_task_id, {"status": "pending"})
+    response = await test_client.post("/plan", json=payload)
+    assert response.status_code == 202
+    assert response.json() == {"taskId": first_task_id}
+    await dedup.release(key, first_task_id)
@@ -0,0 +1,40 @@
+from app.services.http_crawler import extract_html, needs_browser, FetchedPage
+
+SAMPLE_HTML = """
+<html>
+<head><title>Acme</title><script>var tracking = "ignored";</script></head>
+<body>
+  <header><a href="/home">Home</a> Menu</header>
+  <nav><a href="/nav-only">Nav link</a></nav>
+  <main>
+    <h1>Acme Widgets</h1>
+    <p>We build <b>premium</b> widgets &amp; gadgets.</p>
+    <div class="sidebar"><p>Sidebar text</p><a href="/sidebar-link">Side</a></div>
+    <a href="about.html#team">About us</a>
+    <a href="https://other.example.com/partner">Partner</a>
+    <a href="mailto:hello@acme.test">Email</a>
+    <img src="hero.png"><br>
+    <p>Unclosed paragraph
+  </main>
+  <footer>Copyright Acme</footer>
+</body>
+</html>
+"""
+
+def test_extract_html_matches_browser_extraction_rules():
+    """Header, nav, footer, sidebars and scripts are dropped from both text and links."""
+    text, links = extract_html(SAMPLE_HTML, "https://acme.test/company/")
+
+    assert text.splitlines() == [
+        "Acme Widgets",
+        "We build premium widgets & gadgets.",
+        "About us Partner Email",
+        "Unclosed paragraph",
+    ]
+    assert links == ["https://acme.test/company/about.html", "https://other.example.com/partner"]
+
+def test_needs_browser_for_failed_or_empty_pages():
+    assert needs_browser(None)
+    assert needs_browser(FetchedPage(text="<div id='app'></div>"))
+    assert not needs_browser(FetchedPage(text="x" * 1000))
+    assert not needs_browser(FetchedPage(text="", is_html=False))
@@ -0,0 +1,145 @@
+import fnmatch
+import asyncio
+import pytest
+
+from app import main, worker
+from app.services.job_queue import MemoryJobQueue, RedisJobQueue
+
+class FakeRedis:
+    """The list and key commands RedisJobQueue uses, on dicts; TTLs are ignored (expire a key by deleting it)."""
+
+    def __init__(self):
+        self.lists: dict[str, list[str]] = {}
+        self.keys: dict[str, str] = {}
+
+    async def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    async def lmove(self, source, destination, src="LEFT", dest="RIGHT"):
+        items = self.lists.get(source)
+        if not items:
+            return None
+        value = items.pop(-1 if src == "RIGHT" else 0)
+        target = self.lists.setdefault(destination, [])
+        target.insert(len(target) if dest == "RIGHT" else 0, value)
+        return value
+
+    async def blmove(self, source, destination, timeout, src="LEFT", dest="RIGHT"):
+        return await self.lmove(source, destination, src, dest)
+
+    async def lrem(self, key, count, value):
+        self.lists[key].remove(value)
+
+    async def set(self, key, value, ex=None):
+        self.keys[key] = value
+
+    async def exists(self, key):
+        return int(key in self.keys)
+
+    async def delete(self, key):
+        self.keys.pop(key, None)
+
+    async def scan_iter(self, match, count=None):
+        for key in list(self.lists):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+@pytest.mark.asyncio
+async def test_redis_queue_keeps_a_job_in_processing_until_it_is_acked():
+    redis = FakeRedis()
+    queue = RedisJobQueue(redis, consumer_id="worker-a")
+    await queue.enqueue({"taskId": "first"})
+    await queue.enqueue({"taskId": "second"})
+
+    job = await queue.dequeue(timeout=1)
+    assert job == {"taskId": "first"}
+    assert await queue.depth() == 1
+    assert redis.lists["plan-jobs:processing:worker-a"] == ['{"taskId": "first"}']
+
+    await queue.ack(job)
+    assert redis.lists["plan-jobs:processing:worker-a"] == []
+    assert await queue.dequeue(timeout=1) == {"taskId": "second"}
+
+@pytest.mark.asyncio
+async def test_redis_queue_requeues_the_jobs_of_consumers_without_a_heartbeat():
+    redis = FakeRedis()
+    dead, alive = RedisJobQueue(redis, consumer_id="dead"), RedisJobQueue(redis, consumer_id="alive")
+    for task_id in ("old", "new", "busy"):
+        await dead.enqueue({"taskId": task_id})
+    await dead.start()
+    await alive.start()
+    assert (await dead.dequeue(timeout=1))["taskId"] == "old"
+    assert (await dead.dequeue(timeout=1))["taskId"] == "new"
+    assert (await alive.dequeue(timeout=1))["taskId"] == "busy"
+    await alive.stop()
+    await dead.stop()   # Its heartbeat is gone, as if it had expired after a crash
+    await redis.set("plan-jobs:consumer:alive", "1")
+
+    starting = RedisJobQueue(redis, consumer_id="starting")
+    assert await starting.requeue_stale() == 2
+    assert redis.lists["plan-jobs:processing:dead"] == []
+    assert redis.lists["plan-jobs:processing:alive"] == ['{"taskId": "busy"}']
+    # Back at the consuming end, oldest first
+    assert [(await starting.dequeue(timeout=1))["taskId"] for _ in range(2)] == ["old", "new"]
+
+class RecordingQueue(MemoryJobQueue):
+    def __init__(self):
+        super().__init__()
+        self.acked = []
+
+    async def ack(self, job):
+        self.acked.append(job["taskId"])
+
+async def _wait_for(condition):
+    while not condition():
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_worker_loop_acks_jobs_that_fail(monkeypatch):
+    async def crash(job):
+        raise ValueError("malformed job")
+    monkeypatch.setattr(worker, "run_plan_job", crash)
+    queue, stopping = RecordingQueue(), asyncio.Event()
+    await queue.enqueue({"taskId": "bad"})
+
+    loop = asyncio.create_task(worker.worker_loop(queue, 0, stopping))
+    await asyncio.wait_for(_wait_for(lambda: queue.acked), timeout=5)
+    stopping.set()
+    await asyncio.wait_for(loop, timeout=5)
+
+    assert queue.acked == ["bad"]
+
+@pytest.mark.asyncio
+async def test_worker_loop_acks_jobs_cancelled_at_shutdown(monkeypatch):
+    started = asyncio.Event()
+    async def hang(job):
+        started.set()
+        await asyncio.Event().wait()
+    monkeypatch.setattr(worker, "run_plan_job", hang)
+    monkeypatch.setattr(worker, "PLAN_WORKER_SHUTDOWN_SECONDS", 0.05)
+    queue = RecordingQueue()
+    await queue.enqueue({"taskId": "slow"})
+
+    workers = worker.start_workers(queue, concurrency=1)
+    await asyncio.wait_for(started.wait(), timeout=5)
+    await worker.stop_workers(workers)
+
+    assert queue.acked == ["slow"]
+
+@pytest.mark.asyncio
+async def test_plan_answers_503_with_retry_after_when_the_queue_is_full(test_client, monkeypatch):
+    async def full_depth():
+        return 2
+    monkeypatch.setattr(main.plan_queue, "depth", full_depth)
+    monkeypatch.setattr(main, "PLAN_QUEUE_MAX_DEPTH", 2)
+    monkeypatch.setattr(main, "PLAN_QUEUE_RETRY_AFTER_SECONDS", 7)
+    payload = {"apiKey": "queue-full-key", "email": "lead@example.com"}
+
+    response = await test_client.post("/plan", json=payload)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    # The rejected request released its dedup claim, so a retry isn't attached to a task that never started
+    assert (await test_client.post("/plan", json=payload)).status_code == 503
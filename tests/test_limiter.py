@@ -0,0 +1,36 @@
+import pytest
+
+from app.services import limiter
+from app.services.limiter import LocalTokenBucket
+
+def test_local_token_bucket_spends_and_refills():
+    bucket = LocalTokenBucket(capacity=2, window_seconds=10)   # one token back every 5s
+
+    assert bucket.take("client", now=100)[0]
+    assert bucket.take("client", now=100)[0]
+    assert not bucket.take("client", now=100)[0]
+    assert not bucket.take("client", now=104)[0]
+    assert bucket.take("client", now=105)[0]
+    # Other identifiers have their own allowance
+    assert bucket.take("other", now=105)[0]
+
+@pytest.mark.asyncio
+async def test_check_falls_back_to_local_bucket_when_redis_fails(monkeypatch):
+    """A Redis error doesn't let everything through: the in-process bucket keeps enforcing the limit."""
+    class BrokenRedis:
+        def register_script(self, script):
+            async def run(keys, args):
+                raise ConnectionError("redis is down")
+            return run
+
+    monkeypatch.setattr(limiter, "get_redis", lambda: BrokenRedis())
+    monkeypatch.setattr(limiter, "RATE_LIMIT_MAX", 2)
+    monkeypatch.setattr(limiter, "_remote_disabled_until", 0.0)
+    monkeypatch.setattr(limiter, "local_bucket", LocalTokenBucket(capacity=2, window_seconds=60))
+
+    results = [await limiter.check("fallback-client") for _ in range(3)]
+
+    assert [result["allowed"] for result in results] == [True, True, False]
+    assert results[2]["retry_after"] > 0
+    assert results[2]["limit"] == 2
+    assert limiter._remote_disabled_until > 0
@@ -0,0 +1,42 @@
+import pytest
+
+from app.schemas import WebsiteAnalysis
+from app.services.llm_cache import llm_cache_key, memoized
+
+ANALYSIS = {
+    "companyName": "Acme",
+    "strengths": ["Clear headline"],
+    "weaknesses": ["No call to action"],
+    "recommendations": ["Add a booking button"],
+    "overallImpression": "Solid",
+}
+
+def test_llm_cache_key_covers_model_messages_schema_and_params():
+    messages = [{"role": "user", "content": "hello"}]
+    key = llm_cache_key("gpt-4.1-mini", messages, WebsiteAnalysis, temperature=0.3)
+
+    assert key == llm_cache_key("gpt-4.1-mini", [{"content": "hello", "role": "user"}], WebsiteAnalysis, temperature=0.3)
+    assert key != llm_cache_key("gpt-4o-mini", messages, WebsiteAnalysis, temperature=0.3)
+    assert key != llm_cache_key("gpt-4.1-mini", [{"role": "user", "content": "hi"}], WebsiteAnalysis, temperature=0.3)
+    assert key != llm_cache_key("gpt-4.1-mini", messages, temperature=0.3)
+    assert key != llm_cache_key("gpt-4.1-mini", messages, WebsiteAnalysis, temperature=0.7)
+
+@pytest.mark.asyncio
+async def test_memoized_returns_cached_models_unless_opted_out():
+    """The second call is served from the cache as a validated model; use_cache=False always calls through."""
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return WebsiteAnalysis(**ANALYSIS)
+
+    key = llm_cache_key("gpt-4.1-mini", [{"role": "user", "content": "memoized test"}], WebsiteAnalysis)
+    first = await memoized(key, compute, WebsiteAnalysis)
+    second = await memoized(key, compute, WebsiteAnalysis)
+
+    assert len(calls) == 1
+    assert isinstance(second, WebsiteAnalysis)
+    assert second == first
+
+    await memoized(key, compute, WebsiteAnalysis, use_cache=False)
+    assert len(calls) == 2
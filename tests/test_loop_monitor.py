@@ -0,0 +1,23 @@
+import time
+import asyncio
+import pytest
+
+from app.services.loop_monitor import LoopMonitor
+
+@pytest.mark.asyncio
+async def test_watchdog_reports_the_call_blocking_the_loop():
+    monitor = LoopMonitor(interval=0.05, block_threshold=0.1)
+    await monitor.start()
+    try:
+        await asyncio.sleep(0.2)
+        assert monitor.blocked_count == 0
+
+        time.sleep(0.5)   # Deliberately block the loop thread
+        await asyncio.sleep(0.2)
+    finally:
+        await monitor.stop()
+
+    assert monitor.blocked_count == 1   # One stall, reported once
+    assert "test_watchdog_reports_the_call_blocking_the_loop" in monitor.last_blocked_stack
+    assert monitor.max_lag >= 0.3
+    assert monitor.snapshot()["blockedCount"] == 1
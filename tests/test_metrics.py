@@ -0,0 +1,41 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from app.services.metrics import Counter, Histogram, Registry, openai_tokens_total, record_openai_usage, track_llm_usage
+
+@pytest.mark.asyncio
+async def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter("test_requests_total", "Requests."))
+    latency = registry.register(Histogram("test_latency_seconds", "Latency.", buckets=(0.1, 1)))
+
+    requests.inc(path='/plan "x"')
+    latency.observe(0.05, stage="crawl")
+    latency.observe(0.5, stage="crawl")
+    latency.observe(5, stage="crawl")
+
+    text = await registry.render()
+    assert '# TYPE test_requests_total counter' in text
+    assert 'test_requests_total{path="/plan \\"x\\""} 1' in text
+    assert 'test_latency_seconds_bucket{stage="crawl",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{stage="crawl",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{stage="crawl",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_sum{stage="crawl"} 5.55' in text
+    assert 'test_latency_seconds_count{stage="crawl"} 3' in text
+
+@pytest.mark.asyncio
+async def test_llm_usage_is_shared_by_concurrent_stages():
+    """Calls made from tasks started after track_llm_usage() add up into one total for the plan."""
+    before = openai_tokens_total.value(call="test", model="m", kind="input")
+    usage = track_llm_usage()
+
+    async def call(input_tokens, output_tokens):
+        record_openai_usage("test", "m", SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens))
+
+    await asyncio.gather(call(100, 10), call(50, 5))
+    record_openai_usage("test", "m", SimpleNamespace(prompt_tokens=7, completion_tokens=3,
+                                                     prompt_tokens_details=SimpleNamespace(cached_tokens=4)))
+
+    assert (usage.input_tokens, usage.cached_input_tokens, usage.output_tokens) == (157, 4, 18)
+    assert openai_tokens_total.value(call="test", model="m", kind="input") - before == 157
@@ -0,0 +1,70 @@
+import pytest
+from types import SimpleNamespace
+
+from app.services import openai_llm
+from app.schemas import AIResponse
+
+DELTAS = ['{"planTitle": "Gr', 'ow", "sub', 'Title": "Hi', ' there"}']
+
+class FakeStream:
+    def __init__(self, deltas):
+        self._events = [SimpleNamespace(type="response.created")]
+        self._events += [SimpleNamespace(type="response.output_text.delta", delta=delta) for delta in deltas]
+        self._events += [SimpleNamespace(type="response.completed")]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self._events:
+            yield event
+
+    async def get_final_response(self):
+        return "final response"
+
+class FakeClient:
+    def __init__(self):
+        self.requests = []
+        self.responses = self
+
+    def stream(self, **kwargs):
+        self.requests.append(kwargs)
+        return FakeStream(DELTAS)
+
+@pytest.fixture
+def client(monkeypatch) -> FakeClient:
+    fake = FakeClient()
+    monkeypatch.setattr(openai_llm, "get_openai_client", lambda: fake)
+    return fake
+
+async def _stream(interval: float, monkeypatch) -> tuple[str, list[dict]]:
+    monkeypatch.setattr(openai_llm, "STREAM_PARTIAL_INTERVAL_SECONDS", interval)
+    partials = []
+    async def on_partial(partial):
+        partials.append(partial)
+    response = await openai_llm._stream_parsed("test-model", [{"role": "user", "content": "Hi"}], AIResponse, on_partial, "agency-1")
+    return response, partials
+
+@pytest.mark.asyncio
+async def test_stream_sends_every_change_without_throttling(client, monkeypatch):
+    response, partials = await _stream(0, monkeypatch)
+
+    assert response == "final response"
+    assert partials == [
+        {"planTitle": "Gr"}, {"planTitle": "Grow"},
+        {"planTitle": "Grow", "subTitle": "Hi"}, {"planTitle": "Grow", "subTitle": "Hi there"},
+    ]
+    assert client.requests[0]["model"] == "test-model"
+    assert client.requests[0]["extra_body"] == {"prompt_cache_key": "agency-1"}
+
+@pytest.mark.asyncio
+async def test_stream_throttles_partials_but_always_sends_a_new_field(client, monkeypatch):
+    _, partials = await _stream(3600, monkeypatch)
+
+    assert partials == [{"planTitle": "Gr"}, {"planTitle": "Grow", "subTitle": "Hi"}]
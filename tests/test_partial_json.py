@@ -0,0 +1,20 @@
+from app.services.partial_json import parse_partial_json
+
+def test_parse_partial_json_closes_open_strings_and_containers():
+    assert parse_partial_json('{"planTitle": "Grow your') == {"planTitle": "Grow your"}
+    assert parse_partial_json('{"planTitle": "Grow", "recommendations": [{"id": 1, "reason": "Because, well') == {
+        "planTitle": "Grow",
+        "recommendations": [{"id": 1, "reason": "Because, well"}],
+    }
+
+def test_parse_partial_json_drops_half_written_keys_and_literals():
+    assert parse_partial_json('{"planTitle": "Grow", "subTi') == {"planTitle": "Grow"}
+    assert parse_partial_json('{"planTitle": "Grow", "subTitle":') == {"planTitle": "Grow"}
+    assert parse_partial_json('{"recommendations": [{"id": 1, "serviceId": "seo", "rea') == {
+        "recommendations": [{"id": 1, "serviceId": "seo"}]
+    }
+
+def test_parse_partial_json_returns_none_until_usable():
+    assert parse_partial_json("") is None
+    assert parse_partial_json('{"planTitle": "Grow\\') is None
+    assert parse_partial_json("{") == {}
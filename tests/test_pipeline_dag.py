@@ -0,0 +1,59 @@
+import asyncio
+import time
+import pytest
+
+from app.services.pipeline_dag import Stage, run_dag
+
+@pytest.mark.asyncio
+async def test_run_dag_runs_independent_stages_concurrently():
+    """Stages sharing a dependency overlap, and each stage receives its dependencies' results."""
+    async def capture():
+        return "page"
+
+    def slow(name):
+        async def run(capture):
+            await asyncio.sleep(0.2)
+            return f"{name}:{capture}"
+        return run
+
+    async def combine(analyse, insights):
+        return [analyse, insights]
+
+    started = time.perf_counter()
+    dag = await run_dag([
+        Stage("capture", capture),
+        Stage("analyse", slow("analyse"), deps=("capture",)),
+        Stage("insights", slow("insights"), deps=("capture",)),
+        Stage("recommend", combine, deps=("analyse", "insights")),
+    ])
+
+    assert time.perf_counter() - started < 0.35
+    assert dag.results["recommend"] == ["analyse:page", "insights:page"]
+    assert set(dag.timings) == {"capture", "analyse", "insights", "recommend"}
+
+@pytest.mark.asyncio
+async def test_run_dag_optional_stages_degrade_and_required_stages_fail():
+    async def boom():
+        raise RuntimeError("crawl failed")
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def recommend(capture):
+        return capture or "plan without website"
+
+    dag = await run_dag([
+        Stage("capture", boom, optional=True),
+        Stage("recommend", recommend, deps=("capture",)),
+    ])
+    assert dag.results["recommend"] == "plan without website"
+    assert dag.errors == {"capture": "crawl failed"}
+
+    with pytest.raises(TimeoutError, match="'recommend' timed out"):
+        await run_dag([
+            Stage("recommend", hang, timeout=0.05),
+            Stage("other", hang),
+        ])
+
+    with pytest.raises(ValueError, match="cycle"):
+        await run_dag([Stage("a", hang, deps=("b",)), Stage("b", hang, deps=("a",))])
@@ -0,0 +1,51 @@
+import uuid
+import pytest
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+
+from app.db import Agency, Service, Plan
+from app.pipeline import save_plans, build_plan_data
+from app.services.pipeline_dag import DagResult
+from app.schemas import AIResponse, ClientResponses, ServiceRecommendation
+from app.services.plan_analytics import service_recommendation_counts, count_plans_recommending
+
+def _plan(*catalog_positions: int) -> AIResponse:
+    return AIResponse(
+        planTitle="Grow", subTitle="Sub", executiveSummary="Summary", callToAction="Go",
+        recommendations=[ServiceRecommendation(id=position, serviceId=f"s{position}", reason="Fits") for position in catalog_positions],
+    )
+
+@pytest.mark.asyncio
+async def test_service_recommendation_counts_use_extracted_service_ids(db_session, session_factory):
+    agency = Agency(name="Analytics Agency", api_key=f"analytics-{uuid.uuid4()}")
+    db_session.add(agency)
+    await db_session.flush()
+    web, seo = (Service(agency_id=agency.id, name=name, description=name, outcomes=[], when_to_recommend=[]) for name in ("Web", "SEO"))
+    db_session.add_all([web, seo])
+    await db_session.commit()
+
+    payload = ClientResponses(apiKey=agency.api_key, email="lead@example.com")
+    # Catalog positions map to Service ids; position 7 is not in the catalog and is dropped
+    ids = await save_plans(agency.id, [(payload, _plan(0, 1)), (payload, _plan(0)), (payload, _plan(7))],
+                           session_factory, service_ids=[web.id, seo.id])
+    saved = await db_session.execute(select(Plan.plan_title, Plan.recommended_service_ids).where(Plan.id == ids[0][0]))
+    assert saved.one() == ("Grow", [web.id, seo.id])
+
+    now = datetime.utcnow()
+    since, until = now - timedelta(days=1), now + timedelta(days=1)
+    counts = await service_recommendation_counts(agency.id, since, until, session_factory)
+    assert counts == [{"serviceId": web.id, "name": "Web", "plans": 2}, {"serviceId": seo.id, "name": "SEO", "plans": 1}]
+    assert await count_plans_recommending(agency.id, seo.id, since, until, session_factory) == 1
+
+    # Plans outside the period don't count
+    await db_session.execute(update(Plan).where(Plan.id == ids[1][0]).values(created_at=now - timedelta(days=40)))
+    assert await count_plans_recommending(agency.id, web.id, since, until, session_factory) == 1
+
+def test_build_plan_data_drops_recommendations_outside_the_catalog():
+    catalog = SimpleNamespace(services=[{"description": "Websites"}, {"description": "SEO"}])
+    dag = DagResult(results={"recommend": _plan(1, 7, -1, 0)})
+
+    plan_data = build_plan_data(catalog, dag, plan_id=1, client_id=None)
+
+    assert [(r["id"], r["description"]) for r in plan_data["recommendations"]] == [(1, "SEO"), (0, "Websites")]
@@ -0,0 +1,157 @@
+import uuid
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from app import pipeline
+from app.services.task_store import task_store, MemoryTaskStore
+from app.services.plan_batch import parse_batch_rows, max_batch_rows, row_task_id, BatchInputError, PLAN_BATCH_MAX_ROWS
+
+ROWS = b'{"email": "jane@example.com"}\n{"email": "joe@example.com"}\n'
+
+def test_parse_batch_rows_reads_csv_and_jsonl():
+    csv_body = b"websiteUrl,email,name,goal\nhttps://acme.test,jane@example.com,,More leads\n,joe@example.com,Joe,\n"
+    rows = parse_batch_rows(csv_body, "text/csv; charset=utf-8", "key")
+
+    assert [row.email for row in rows] == ["jane@example.com", "joe@example.com"]
+    assert rows[0].apiKey == "key" and rows[0].name is None and rows[0].model_extra == {"goal": "More leads"}
+    assert rows[1].websiteUrl is None and rows[1].model_extra == {}
+
+    jsonl_body = b'{"email": "jane@example.com", "goal": "More leads"}\n\n{"email": "joe@example.com", "apiKey": "key"}\n'
+    rows = parse_batch_rows(jsonl_body, "application/x-ndjson", "key")
+    assert [(row.email, row.apiKey) for row in rows] == [("jane@example.com", "key"), ("joe@example.com", "key")]
+    assert row_task_id("batch", 1) == "batch:1"
+
+@pytest.mark.parametrize("body, message", [
+    (b"", "no rows"),
+    (b'{"name": "No email"}', "Row 1: email"),
+    (b'{"email": "jane@example.com", "apiKey": "other"}', "does not match"),
+    (b'{"email": "jane@example.com"}\n[1]', "Line 2: expected a JSON object"),
+    (b"{not json", "Line 1: invalid JSON"),
+])
+def test_parse_batch_rows_rejects_bad_input(body, message):
+    with pytest.raises(BatchInputError, match=message):
+        parse_batch_rows(body, "application/x-ndjson", "key")
+
+def test_batch_size_is_capped_by_the_task_store_capacity():
+    assert max_batch_rows(None) == PLAN_BATCH_MAX_ROWS
+    # Memory store of 1000 entries: the batch status plus 499 rows fill at most half of it
+    assert max_batch_rows(1000) == min(PLAN_BATCH_MAX_ROWS, 499)
+
+    with pytest.raises(BatchInputError, match="the limit is 1"):
+        parse_batch_rows(ROWS, "application/x-ndjson", "key", max_rows=1)
+
+@pytest.mark.asyncio
+async def test_batch_fails_every_row_when_the_agency_is_missing(monkeypatch):
+    async def no_catalog(api_key):
+        return None
+    monkeypatch.setattr(pipeline, "get_agency_catalog", no_catalog)
+    batch_id = f"batch-{uuid.uuid4().hex}"
+
+    await pipeline.generate_batch_async(batch_id, parse_batch_rows(ROWS, "application/x-ndjson", "key"), "key")
+
+    assert await task_store.get(batch_id) == {"status": "failed", "total": 2, "completed": 0, "failed": 2, "error": "Agency not found."}
+    assert (await task_store.get(row_task_id(batch_id, 1)))["status"] == "failed"
+
+@pytest.mark.asyncio
+async def test_cancelled_batch_marks_unfinished_rows_failed(monkeypatch):
+    async def catalog(api_key):
+        return SimpleNamespace(agency_id=1, service_ids=[])
+    async def never_finishes(stages):
+        await asyncio.Event().wait()
+    monkeypatch.setattr(pipeline, "get_agency_catalog", catalog)
+    monkeypatch.setattr(pipeline, "run_dag", never_finishes)
+    batch_id = f"batch-{uuid.uuid4().hex}"
+
+    batch = asyncio.create_task(pipeline.generate_batch_async(batch_id, parse_batch_rows(ROWS, "application/x-ndjson", "key"), "key"))
+    while (await task_store.get(row_task_id(batch_id, 1)) or {}).get("status") != "processing":
+        await asyncio.sleep(0.01)
+    batch.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await batch
+
+    status = await task_store.get(batch_id)
+    assert (status["status"], status["failed"], status["error"]) == ("failed", 2, pipeline.PLAN_CANCELLED_ERROR)
+    assert (await task_store.get(row_task_id(batch_id, 0)))["error"] == pipeline.PLAN_CANCELLED_ERROR
+
+@pytest.mark.asyncio
+async def test_plan_batch_refuses_oversized_uploads(test_client, monkeypatch):
+    monkeypatch.setattr("app.main.PLAN_BATCH_MAX_BYTES", 16)
+
+    response = await test_client.post("/plan/batch", content=ROWS, headers={"X-API-Key": "key"})
+    assert response.status_code == 413
+
+    async def chunked():
+        for line in ROWS.splitlines(keepends=True):
+            yield line
+    # No Content-Length to go on, so the limit applies while reading
+    response = await test_client.post("/plan/batch", content=chunked(), headers={"X-API-Key": "key"})
+    assert response.status_code == 413
+
+@pytest.mark.asyncio
+async def test_batch_rows_share_the_process_slots(monkeypatch):
+    running, most_running = 0, 0
+
+    async def catalog(api_key):
+        return SimpleNamespace(agency_id=1, service_ids=[])
+    async def failing_row(stages):
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        raise RuntimeError("LLM unavailable")
+    monkeypatch.setattr(pipeline, "get_agency_catalog", catalog)
+    monkeypatch.setattr(pipeline, "run_dag", failing_row)
+    rows = parse_batch_rows(ROWS * 3, "application/x-ndjson", "key")
+
+    await pipeline.generate_batch_async(f"batch-{uuid.uuid4().hex}", rows, "key", concurrency=6, slots=asyncio.Semaphore(2))
+    assert most_running == 2
+
+@pytest.mark.asyncio
+async def test_row_error_outside_the_pipeline_stops_the_other_rows(monkeypatch):
+    class BrokenStore(MemoryTaskStore):
+        async def update(self, task_id, **fields):
+            if task_id.endswith(":0"):
+                raise ConnectionError("task store unreachable")
+            await super().update(task_id, **fields)
+
+    async def catalog(api_key):
+        return SimpleNamespace(agency_id=1, service_ids=[])
+    async def never_finishes(stages):
+        await asyncio.Event().wait()
+    store = BrokenStore()
+    monkeypatch.setattr(pipeline, "task_store", store)
+    monkeypatch.setattr(pipeline, "get_agency_catalog", catalog)
+    monkeypatch.setattr(pipeline, "run_dag", never_finishes)
+    slots = asyncio.Semaphore(4)
+    batch_id = f"batch-{uuid.uuid4().hex}"
+
+    await pipeline.generate_batch_async(batch_id, parse_batch_rows(ROWS * 2, "application/x-ndjson", "key"), "key", slots=slots)
+
+    status = await store.get(batch_id)
+    assert (status["status"], status["completed"], status["failed"], status["error"]) == ("failed", 0, 4, "task store unreachable")
+    assert (await store.get(row_task_id(batch_id, 3)))["status"] == "failed"
+    assert slots._value == 4   # Every row let go of its slot
+
+@pytest.mark.asyncio
+async def test_requeued_batch_skips_rows_that_already_finished(monkeypatch):
+    ran = []
+
+    async def catalog(api_key):
+        return SimpleNamespace(agency_id=1, service_ids=[])
+    async def failing_row(stages):
+        ran.append(1)
+        raise RuntimeError("LLM unavailable")
+    monkeypatch.setattr(pipeline, "get_agency_catalog", catalog)
+    monkeypatch.setattr(pipeline, "run_dag", failing_row)
+    batch_id = f"batch-{uuid.uuid4().hex}"
+    await task_store.set(row_task_id(batch_id, 0), {"status": "completed", "planData": {"planId": 1}})
+    await task_store.set(row_task_id(batch_id, 1), {"status": "processing"})   # Interrupted mid-run
+
+    await pipeline.generate_batch_async(batch_id, parse_batch_rows(ROWS, "application/x-ndjson", "key"), "key")
+
+    assert len(ran) == 1
+    assert await task_store.get(row_task_id(batch_id, 0)) == {"status": "completed", "planData": {"planId": 1}}
+    status = await task_store.get(batch_id)
+    assert (status["status"], status["completed"], status["failed"]) == ("completed", 1, 1)
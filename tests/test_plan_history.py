@@ -0,0 +1,43 @@
+import uuid
+import pytest
+from datetime import datetime, timedelta
+
+from app.db import Agency, Client, Plan
+from app.services.plan_history import list_plans, get_plan, InvalidCursor
+
+@pytest.mark.asyncio
+async def test_plan_history_pages_newest_first_and_scopes_by_agency(db_session, session_factory):
+    agency = Agency(name="History Agency", api_key=f"history-{uuid.uuid4()}")
+    other_agency = Agency(name="Other Agency", api_key=f"history-{uuid.uuid4()}")
+    db_session.add_all([agency, other_agency])
+    await db_session.flush()
+    client = Client(email="lead@example.com", name="Lead", agency_id=agency.id)
+    db_session.add(client)
+    await db_session.flush()
+
+    started = datetime(2026, 1, 1)
+    plans = [
+        Plan(agency_id=agency.id, client_id=client.id if index % 2 else None, plan_data={"planTitle": f"Plan {index}"},
+             created_at=started + timedelta(minutes=index // 2))   # Pairs share a timestamp, so ids break the tie
+        for index in range(5)
+    ]
+    db_session.add_all(plans + [Plan(agency_id=other_agency.id, plan_data={}, created_at=started)])
+    await db_session.flush()
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = await list_plans(agency.id, limit=2, cursor=cursor, session_factory=session_factory)
+        assert "planData" not in page[0]
+        seen += [plan["planId"] for plan in page]
+        if cursor is None:
+            break
+    assert seen == [plan.id for plan in reversed(plans)]
+
+    client_page, _ = await list_plans(agency.id, client.id, session_factory=session_factory)
+    assert [plan["planId"] for plan in client_page] == [plans[3].id, plans[1].id]
+    assert client_page[0]["clientEmail"] == "lead@example.com"
+
+    assert (await get_plan(agency.id, plans[0].id, session_factory))["planData"] == {"planTitle": "Plan 0"}
+    assert await get_plan(other_agency.id, plans[0].id, session_factory) is None
+    with pytest.raises(InvalidCursor):
+        await list_plans(agency.id, cursor="not-a-cursor", session_factory=session_factory)
@@ -0,0 +1,26 @@
+import pytest
+
+from app.services.render_profile import LEAN_RENDER_PROFILE
+
+@pytest.mark.parametrize("resource_type, url, blocked", [
+    ("document", "https://acme.test/", False),
+    ("script", "https://acme.test/app.js", False),
+    ("stylesheet", "https://cdn.acme.test/site.css", False),
+    ("xhr", "https://acme.test/api/services", False),
+    ("image", "https://acme.test/logo.png", True),
+    ("media", "https://acme.test/intro", True),
+    ("font", "https://fonts.gstatic.com/inter.woff2", True),
+    ("websocket", "wss://acme.test/live", True),
+    ("script", "https://www.googletagmanager.com/gtm.js?id=GTM-1", True),
+    ("script", "https://GOOGLETAGMANAGER.com/gtm.js", True),
+    ("xhr", "https://region1.google-analytics.com/g/collect", True),
+    ("script", "https://widget.intercom.io/widget/abc", True),
+    # Only the host itself and its subdomains, not hosts that merely end with the same letters
+    ("script", "https://notintercom.io/widget.js", False),
+    ("script", "https://intercom.io.acme.test/widget.js", False),
+    ("fetch", "https://acme.test/brochure.PDF", True),
+    ("fetch", "https://acme.test/video.mp4?autoplay=1", True),
+    ("document", "https://acme.test/pdf-guide", False),
+])
+def test_lean_render_profile_blocks(resource_type, url, blocked):
+    assert LEAN_RENDER_PROFILE.should_block(resource_type, url) is blocked
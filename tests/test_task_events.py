@@ -0,0 +1,83 @@
+import json
+import uuid
+import asyncio
+import pytest
+
+from app.services.task_events import MemoryTaskEventBus, task_events
+from app.services.task_store import task_store
+
+def _events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+async def _wait_for_subscriber(bus, task_id: str):
+    while task_id not in bus._subscribers:
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_memory_bus_delivers_events_in_order_to_every_subscriber():
+    bus = MemoryTaskEventBus()
+    await bus.publish("task", {"status": "processing"})   # Nobody listening yet, so dropped
+
+    async with bus.subscribe("task") as first, bus.subscribe("task") as second:
+        for stage in ("crawling", "analysing", "recommending"):
+            await bus.publish("task", {"status": "processing", "stage": stage})
+        await bus.publish("other-task", {"status": "completed"})
+
+        for queue in (first, second):
+            assert [queue.get_nowait()["stage"] for _ in range(3)] == ["crawling", "analysing", "recommending"]
+            assert queue.empty()
+
+    assert bus._subscribers == {}
+
+@pytest.mark.asyncio
+async def test_plan_events_stream_until_the_task_finishes(test_client):
+    task_id = str(uuid.uuid4())
+    await task_store.set(task_id, {"status": "pending"})
+
+    request = asyncio.create_task(test_client.get(f"/plan/events/{task_id}"))
+    await asyncio.wait_for(_wait_for_subscriber(task_events, task_id), timeout=5)
+    await task_events.publish(task_id, {"status": "processing", "stage": "recommending"})
+    await task_events.publish(task_id, {"status": "processing", "stage": "recommending", "partialPlan": {"planTitle": "Gro"}})
+    await task_events.publish(task_id, {"status": "completed", "planData": {"planTitle": "Grow"}})
+    await task_events.publish(task_id, {"status": "processing"})   # After the terminal status, never sent
+    response = await asyncio.wait_for(request, timeout=5)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [(event, data["status"]) for event, data in _events(response.text)] == [
+        ("status", "pending"), ("status", "processing"), ("partial", "processing"), ("status", "completed"),
+    ]
+    assert task_id not in task_events._subscribers
+
+@pytest.mark.asyncio
+async def test_plan_events_replays_a_finished_task_and_closes(test_client):
+    task_id = str(uuid.uuid4())
+    await task_store.set(task_id, {"status": "failed", "error": "Agency not found.", "request_payload": {"apiKey": "secret"}})
+
+    response = await test_client.get(f"/plan/events/{task_id}")
+
+    assert _events(response.text) == [("status", {"status": "failed", "error": "Agency not found."})]
+    assert (await test_client.get(f"/plan/events/{uuid.uuid4()}")).status_code == 404
+
+@pytest.mark.asyncio
+async def test_plan_events_closes_when_the_final_event_is_lost(test_client, monkeypatch):
+    """A task that finished without publishing (or whose publisher died) still ends the stream at the next keep-alive."""
+    monkeypatch.setattr("app.main.SSE_KEEPALIVE_SECONDS", 0.05)
+    task_id = str(uuid.uuid4())
+    await task_store.set(task_id, {"status": "processing"})
+
+    request = asyncio.create_task(test_client.get(f"/plan/events/{task_id}"))
+    await asyncio.wait_for(_wait_for_subscriber(task_events, task_id), timeout=5)
+    await task_store.set(task_id, {"status": "completed", "planData": {"planTitle": "Grow"}, "request_payload": {"apiKey": "secret"}})
+    response = await asyncio.wait_for(request, timeout=5)
+
+    assert _events(response.text) == [
+        ("status", {"status": "processing"}),
+        ("status", {"status": "completed", "planData": {"planTitle": "Grow"}}),
+    ]
+    assert task_id not in task_events._subscribers
@@ -0,0 +1,54 @@
+import pytest
+
+from app.db import PlanTask
+from app.services.task_store import MemoryTaskStore, PostgresTaskStore, create_task_store
+
+@pytest.mark.asyncio
+async def test_memory_task_store_update_merges_fields():
+    store = MemoryTaskStore(max_entries=10, ttl_seconds=60)
+    await store.set("task-1", {"status": "pending", "request_payload": {"email": "a@example.com"}})
+    await store.update("task-1", status="processing")
+
+    status = await store.get("task-1")
+    assert status == {"status": "processing", "request_payload": {"email": "a@example.com"}}
+    assert await store.get("missing") is None
+
+@pytest.mark.asyncio
+async def test_memory_task_store_is_bounded():
+    """Oldest tasks are evicted once the store is full, and expired ones are not returned."""
+    store = MemoryTaskStore(max_entries=2, ttl_seconds=60)
+    for task_id in ("a", "b", "c"):
+        await store.set(task_id, {"status": "completed"})
+
+    assert await store.size() == 2
+    assert await store.get("a") is None
+    assert await store.get("c") == {"status": "completed"}
+
+    expired = MemoryTaskStore(max_entries=2, ttl_seconds=0)
+    await expired.set("a", {"status": "completed"})
+    assert await expired.get("a") is None
+
+@pytest.mark.asyncio
+async def test_memory_task_store_returns_copies():
+    store = MemoryTaskStore(max_entries=2, ttl_seconds=60)
+    await store.set("a", {"status": "pending"})
+    status = await store.get("a")
+    status["status"] = "mutated"
+    assert (await store.get("a"))["status"] == "pending"
+
+@pytest.mark.asyncio
+async def test_postgres_task_store_creates_its_table(session_factory, db_session):
+    """There are no migrations; a database without plan_tasks gets it on first use."""
+    await db_session.run_sync(lambda session: PlanTask.__table__.drop(session.connection(), checkfirst=True))
+    await db_session.commit()
+
+    store = PostgresTaskStore(session_factory=session_factory, ttl_seconds=60)
+    assert await store.get("task-1") is None
+    await store.set("task-1", {"status": "pending"})
+    assert await store.get("task-1") == {"status": "pending"}
+    assert await store.size() == 1
+
+def test_create_task_store_falls_back_to_memory_without_redis(monkeypatch):
+    monkeypatch.setattr("app.services.task_store.get_redis", lambda: None)
+    assert isinstance(create_task_store("redis"), MemoryTaskStore)
+    assert isinstance(create_task_store("postgres"), PostgresTaskStore)
@@ -0,0 +1,31 @@
+from app.services.text_processing import condense_pages, estimate_tokens
+
+NAV = "Home\nAbout\nServices\nContact"
+HERO = "We help ambitious founders build brands people remember"
+FOOTER = "© 2024 Acme Studio. All rights reserved. Privacy Policy"
+
+def test_condense_pages_removes_boilerplate_and_cross_page_repeats():
+    pages = {
+        "https://acme.test": f"{NAV}\n{HERO}\nAcme Studio designs websites for 40 independent coffee roasters across Europe.\n{FOOTER}",
+        "https://acme.test/about": f"{NAV}\n{HERO}\nFounded in 2015 by Jane Doe, the team of 12 designers works from Lisbon and Berlin.\nLearn more\n{FOOTER}",
+        "https://acme.test/services": f"{NAV}\n{HERO}!\nFounded in 2015 by Jane Doe, the team of 12 designers works from Lisbon and Berlin today.\n{FOOTER}",
+    }
+
+    condensed = condense_pages(pages, token_budget=1000)
+
+    assert condensed["https://acme.test"].splitlines() == [
+        HERO,
+        "Acme Studio designs websites for 40 independent coffee roasters across Europe.",
+    ]
+    assert condensed["https://acme.test/about"] == "Founded in 2015 by Jane Doe, the team of 12 designers works from Lisbon and Berlin."
+    # Only a near-duplicate of the about page was left on the services page
+    assert "https://acme.test/services" not in condensed
+
+def test_condense_pages_fills_the_budget_with_the_densest_blocks():
+    filler = "It is what it is and we are who we are and that is that, as it was and as it will be. " * 3
+    facts = "Acme serves 40 coffee roasters, 12 bakeries and 3 breweries with branding, packaging and Shopify builds."
+    pages = {"https://acme.test": f"{filler}\n{facts}"}
+
+    condensed = condense_pages(pages, token_budget=estimate_tokens(facts))
+
+    assert condensed == {"https://acme.test": facts}
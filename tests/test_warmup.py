@@ -0,0 +1,29 @@
+import asyncio
+import pytest
+
+from app.services import warmup as warmup_module
+from app.services.warmup import Warmup
+
+@pytest.mark.asyncio
+async def test_warmup_reports_ready_once_steps_finish_even_if_one_fails(monkeypatch):
+    release = asyncio.Event()
+
+    async def slow_db():
+        await release.wait()
+
+    async def broken_browser():
+        raise RuntimeError("no chromium")
+
+    monkeypatch.setattr(warmup_module, "open_db_connections", slow_db)
+    monkeypatch.setattr(warmup_module.browser_pool, "start", broken_browser)
+    warmup = Warmup()
+    warmup.start(browser=True)
+    await asyncio.sleep(0)
+
+    assert warmup.snapshot()["ready"] is False
+    release.set()
+    await asyncio.sleep(0.01)
+
+    snapshot = warmup.snapshot()
+    assert snapshot["ready"] is True
+    assert snapshot["steps"] == {"database": "ok", "browser": "failed: no chromium"}